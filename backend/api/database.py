@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, Float, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -27,6 +27,36 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False)
 
+# Modello per i risultati dei benchmark di dischi e dataset
+class BenchmarkResult(Base):
+    __tablename__ = "benchmark_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(String, unique=True, index=True)
+    target_type = Column(String)  # dataset o mount
+    target = Column(String, index=True)
+    path = Column(String)
+    label = Column(String, nullable=True)
+    created_at = Column(Float, index=True)
+    params = Column(Text)  # JSON
+    results = Column(Text)  # JSON
+
+# Modello per le operazioni di lunga durata eseguite in background (formattazioni, creazione pool, ...)
+class JobRecord(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    type = Column(String, index=True)
+    target = Column(String)
+    devices = Column(Text)  # JSON
+    state = Column(String, index=True)  # running, completed, failed, cancelled, interrupted
+    progress = Column(Float, nullable=True)
+    message = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)  # JSON
+    created_at = Column(Float, index=True)
+    finished_at = Column(Float, nullable=True)
+
 # Crea le tabelle nel database
 Base.metadata.create_all(bind=engine)
 
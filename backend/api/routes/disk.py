@@ -1,12 +1,27 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 import psutil
-import subprocess
 import shutil
 import os
-import re
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Any
 from api.utils.overlayfs import ensure_rw_mode, is_filesystem_writable
+from api.utils.command_runner import run_command
+from api.utils.block_devices import get_block_devices, invalidate_block_devices
+from api.utils.fstab import get_fstab, parse_fstab, invalidate_fstab
+from api.utils.smart import smart_monitor
+from api.utils.diskstats import diskstats_collector
+from api.utils.hotplug import hotplug_monitor
+from api.utils.jobs import submit_job, get_device_job, Mke2fsProgress, parse_percent_progress
+from api.utils.benchmark import (
+    start_benchmark,
+    get_benchmark,
+    cancel_benchmark,
+    list_benchmark_results,
+    delete_benchmark_result,
+    compare_benchmark_results,
+    BENCH_DEFAULT_DURATION
+)
+from api.utils.streaming import sse_response
 
 router = APIRouter()
 
@@ -27,6 +42,15 @@ class DiskOperation(BaseModel):
     fstype: Optional[str] = None
     automount: Optional[bool] = False
 
+class DiskBenchmark(BaseModel):
+    target: str  # punto di montaggio o dispositivo montato
+    tests: Optional[List[str]] = None  # seq_write, seq_read, rand_read, rand_write, fsync
+    size_mb: int = 1024
+    duration: float = BENCH_DEFAULT_DURATION
+    threads: int = 1  # operazioni in coda nei test casuali
+    direct: bool = True
+    label: Optional[str] = None
+
 @router.get("/info", response_model=List[DiskInfo])
 async def get_disk_info():
     """
@@ -36,84 +60,98 @@ async def get_disk_info():
 
     try:
         # Ottieni tutti i dispositivi di blocco, inclusi quelli non montati
-        lsblk_output = subprocess.run(
-            ["lsblk", "-o", "NAME,TYPE,SIZE,MOUNTPOINT,FSTYPE", "--json"],
-            capture_output=True, text=True, check=True
-        )
-
-        import json
-        block_devices = json.loads(lsblk_output.stdout)
+        # (inventario condiviso con le route ZFS: un solo lsblk, in cache)
+        inventory = await get_block_devices()
+        # fstab analizzato una sola volta (in cache finché il file non cambia)
+        fstab = get_fstab()
+        mounted_devices = set()
+
+        # Lo stato di montaggio viene letto ad ogni richiesta da /proc/mounts (nessun processo):
+        # i mount fatti fuori dall'API non generano uevent e l'inventario in cache non li vede
+        mounts: Dict[str, List[Any]] = {}
+        for partition in psutil.disk_partitions(all=True):
+            if not partition.device.startswith("/dev/"):
+                continue
+            mounts.setdefault(partition.device, []).append(partition)
+            real_device = os.path.realpath(partition.device)
+            if real_device != partition.device:
+                mounts.setdefault(real_device, []).append(partition)
 
         # Aggiungi i dispositivi montati con informazioni complete
-        partitions = psutil.disk_partitions(all=True)
-        for partition in partitions:
-            if partition.device.startswith('/dev/'):
+        for device in inventory.devices:
+            # Verifica se il disco è configurato per l'auto mount
+            is_automount = fstab.find_device(device) is not None
+
+            partitions = mounts.get(device["path"]) or mounts.get(os.path.realpath(device["path"])) or []
+            for partition in partitions:
                 try:
+                    # statvfs diretto, nessun processo esterno
                     usage = psutil.disk_usage(partition.mountpoint)
-                    # Gestisci il caso in cui fstype è None
-                    fstype = partition.fstype
-                    if fstype is None:
-                        fstype = ""
-
-                    # Verifica se il disco è configurato per l'auto mount
-                    is_automount = await check_automount(partition.device)
 
                     disk_info.append(DiskInfo(
-                        device=partition.device,
+                        device=device["path"],
                         mountpoint=partition.mountpoint,
-                        fstype=fstype,
+                        fstype=device["fstype"] or partition.fstype,
                         total=usage.total,
                         used=usage.used,
                         free=usage.free,
                         percent=usage.percent,
                         automount=is_automount
                     ))
-                except PermissionError:
+                    mounted_devices.add(device["path"])
+                except (PermissionError, FileNotFoundError):
                     # Alcuni punti di mount potrebbero non essere accessibili
                     pass
 
         # Aggiungi i dispositivi non montati
-        for device in block_devices.get("blockdevices", []):
+        for device in inventory.devices:
             if device["type"] == "disk" or device["type"] == "part":
-                device_path = f"/dev/{device['name']}"
+                device_path = device["path"]
                 # Verifica se il dispositivo è già stato aggiunto (perché montato)
-                if not any(d.device == device_path for d in disk_info):
+                if device_path not in mounted_devices:
                     # Dispositivo non montato
-                    # Gestisci il caso in cui fstype è None
-                    fstype = device.get("fstype", "")
-                    if fstype is None:
-                        fstype = ""
-
-                    # Verifica se il disco è configurato per l'auto mount
-                    is_automount = await check_automount(device_path)
-
                     disk_info.append(DiskInfo(
                         device=device_path,
                         mountpoint="",
-                        fstype=fstype,
+                        fstype=device["fstype"],
                         total=0,  # Non possiamo ottenere queste informazioni per dispositivi non montati
                         used=0,
                         free=0,
                         percent=0,
-                        automount=is_automount
+                        automount=fstab.find_device(device) is not None
                     ))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nel recupero delle informazioni sui dischi: {str(e)}")
 
     return disk_info
 
+async def run_checked(command: List[str], timeout: Optional[float] = None) -> str:
+    """
+    Esegue un comando e solleva un'eccezione HTTP se fallisce
+    """
+    result = await run_command(command, timeout=timeout)
+    if not result["success"]:
+        raise HTTPException(status_code=500, detail=f"Errore nell'esecuzione del comando: {result['error']}")
+    return result["output"]
+
 @router.post("/operation", response_model=Dict[str, str])
 async def disk_operation(operation: DiskOperation):
     """
     Esegue operazioni sui dischi (montaggio, smontaggio, formattazione, auto mount)
     """
     try:
+        # Nessuna operazione su un disco usato da un job in corso (formattazione, creazione pool, ...)
+        busy = await get_device_job(operation.device)
+        if busy is not None:
+            raise HTTPException(status_code=409,
+                                detail=f"Il disco è in uso da un'operazione in corso ({busy['type']} su {busy['target']})")
+
         if operation.operation == "mount":
             if not operation.mountpoint:
                 raise HTTPException(status_code=400, detail="Punto di montaggio non specificato")
 
             # Crea la directory di montaggio se non esiste
-            subprocess.run(["mkdir", "-p", operation.mountpoint], check=True)
+            await run_checked(["mkdir", "-p", operation.mountpoint])
 
             # Monta il disco
             cmd = ["mount"]
@@ -121,7 +159,8 @@ async def disk_operation(operation: DiskOperation):
                 cmd.extend(["-t", operation.fstype])
             cmd.extend([operation.device, operation.mountpoint])
 
-            subprocess.run(cmd, check=True)
+            await run_checked(cmd)
+            invalidate_block_devices()
 
             # Se automount è abilitato, configura il disco per il montaggio automatico
             if operation.automount:
@@ -130,22 +169,37 @@ async def disk_operation(operation: DiskOperation):
             return {"status": "success", "message": f"Disco {operation.device} montato su {operation.mountpoint}"}
 
         elif operation.operation == "unmount":
-            subprocess.run(["umount", operation.device], check=True)
+            await run_checked(["umount", operation.device])
+            invalidate_block_devices()
             return {"status": "success", "message": f"Disco {operation.device} smontato"}
 
         elif operation.operation == "format":
             if not operation.fstype:
                 raise HTTPException(status_code=400, detail="Tipo di filesystem non specificato")
 
-            # Formatta il disco
+            # Formatta il disco in un job in background (su dischi USB grandi richiede minuti)
             if operation.fstype == "ext4":
-                subprocess.run(["mkfs.ext4", operation.device], check=True)
+                command, parse_progress = ["mkfs.ext4", operation.device], Mke2fsProgress()
             elif operation.fstype == "ntfs":
-                subprocess.run(["mkfs.ntfs", operation.device], check=True)
+                command, parse_progress = ["mkfs.ntfs", operation.device], parse_percent_progress
             else:
                 raise HTTPException(status_code=400, detail=f"Tipo di filesystem non supportato: {operation.fstype}")
 
-            return {"status": "success", "message": f"Disco {operation.device} formattato con {operation.fstype}"}
+            device, fstype = operation.device, operation.fstype
+
+            async def format_device(job) -> Dict[str, Any]:
+                job.set_progress(0, f"Formattazione di {device} con {fstype}")
+                result = await job.run_command(command, parse_progress)
+                invalidate_block_devices()
+                if not result["success"]:
+                    return result
+                return {"success": True, "message": f"Disco {device} formattato con {fstype}"}
+
+            result = await submit_job("format", device, [device], format_device)
+            if not result["success"]:
+                raise HTTPException(status_code=409, detail=result["error"])
+
+            return {"status": "success", "message": f"Formattazione di {device} avviata", "job_id": result["job_id"]}
 
         elif operation.operation == "set_automount":
             if not operation.mountpoint:
@@ -163,36 +217,17 @@ async def disk_operation(operation: DiskOperation):
         else:
             raise HTTPException(status_code=400, detail=f"Operazione non supportata: {operation.operation}")
 
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Errore nell'esecuzione del comando: {str(e)}")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore nell'operazione sul disco: {str(e)}")
 
-async def check_automount(device: str) -> bool:
-    """
-    Verifica se un dispositivo è configurato per il montaggio automatico
-    """
-    try:
-        # Controlla se il dispositivo è presente in /etc/fstab
-        with open("/etc/fstab", "r") as f:
-            fstab_content = f.read()
-
-        # Cerca il dispositivo in fstab
-        return bool(re.search(rf"^{re.escape(device)}\s+", fstab_content, re.MULTILINE))
-    except Exception as e:
-        print(f"Errore nel controllo dell'auto mount: {str(e)}")
-        return False
-
 async def get_device_uuid(device: str) -> str:
     """
     Ottiene l'UUID del dispositivo
     """
-    try:
-        result = subprocess.run(["blkid", "-s", "UUID", "-o", "value", device],
-                               capture_output=True, text=True, check=True)
-        return result.stdout.strip()
-    except Exception:
-        return ""
+    result = await run_command(["blkid", "-s", "UUID", "-o", "value", device])
+    return result["output"] if result["success"] else ""
 
 async def configure_automount(device: str, mountpoint: str, fstype: Optional[str] = None) -> None:
     """
@@ -221,12 +256,8 @@ async def configure_automount(device: str, mountpoint: str, fstype: Optional[str
 
         # Determina il tipo di filesystem
         if not fstype or fstype == "auto":
-            try:
-                result = subprocess.run(["blkid", "-s", "TYPE", "-o", "value", device],
-                                      capture_output=True, text=True, check=True)
-                fstype = result.stdout.strip()
-            except Exception:
-                fstype = "auto"
+            result = await run_command(["blkid", "-s", "TYPE", "-o", "value", device])
+            fstype = result["output"] if result["success"] else "auto"
 
         # Crea la directory di montaggio se non esiste
         os.makedirs(mountpoint, exist_ok=True)
@@ -240,6 +271,7 @@ async def configure_automount(device: str, mountpoint: str, fstype: Optional[str
         # Aggiungi la nuova configurazione a fstab
         with open("/etc/fstab", "a") as f:
             f.write(fstab_line)
+        invalidate_fstab()
 
     except Exception as e:
         raise HTTPException(status_code=500,
@@ -271,16 +303,16 @@ async def remove_automount(device: str) -> None:
         with open("/etc/fstab", "r") as f:
             fstab_lines = f.readlines()
 
-        # Filtra le righe, rimuovendo quelle che contengono il dispositivo
-        if uuid:
-            new_fstab = [line for line in fstab_lines
-                        if not (device in line or f"UUID={uuid}" in line)]
-        else:
-            new_fstab = [line for line in fstab_lines if device not in line]
+        # Filtra le righe, rimuovendo quelle del dispositivo (confronto sul primo campo,
+        # così /dev/sda1 non rimuove anche /dev/sda10)
+        specs = {device, f"UUID={uuid}"} if uuid else {device}
+        removed = {entry["line"] for entry in parse_fstab("".join(fstab_lines)) if entry["spec"] in specs}
+        new_fstab = [line for number, line in enumerate(fstab_lines, start=1) if number not in removed]
 
         # Scrivi il nuovo contenuto
         with open("/etc/fstab", "w") as f:
             f.writelines(new_fstab)
+        invalidate_fstab()
 
     except Exception as e:
         raise HTTPException(status_code=500,
@@ -292,7 +324,115 @@ async def check_disk_health(device: str):
     Controlla lo stato di salute del disco usando smartctl
     """
     try:
-        result = subprocess.run(["smartctl", "-H", device], capture_output=True, text=True, check=False)
-        return {"status": "success", "health": result.stdout}
+        result = await run_command(["smartctl", "-H", device], check=False)
+        if result["output"] is None:
+            raise RuntimeError(result["error"])
+        return {"status": "success", "health": result["output"]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Errore nel controllo della salute del disco: {str(e)}")
+
+@router.get("/smart", response_model=Dict[str, Any])
+async def get_smart_status():
+    """
+    Restituisce lo stato SMART di tutti i dischi dall'ultima interrogazione in background
+    """
+    return smart_monitor.get_summary()
+
+@router.post("/smart/refresh", response_model=Dict[str, Any])
+async def refresh_smart_status():
+    """
+    Interroga subito tutti i dischi invece di attendere il prossimo ciclo del monitor
+    """
+    try:
+        return await smart_monitor.poll()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Errore nel controllo della salute del disco: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Errore nell'interrogazione SMART: {str(e)}")
+
+@router.get("/smart/device", response_model=Dict[str, Any])
+async def get_smart_device(device: str, limit: Optional[int] = None):
+    """
+    Restituisce attributi SMART e storia di un disco
+    """
+    result = smart_monitor.get_disk(device, limit)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Nessun dato SMART per {device}")
+    return result
+
+@router.get("/iostats", response_model=Dict[str, Any])
+async def get_disk_iostats(device: Optional[str] = None, limit: Optional[int] = None):
+    """
+    Restituisce IOPS, banda, await, coda e utilizzo per dispositivo (da /proc/diskstats)
+    """
+    return diskstats_collector.get_history(device, limit)
+
+@router.get("/iostats/stream")
+async def stream_disk_iostats(request: Request):
+    """
+    Stream in tempo reale delle statistiche di I/O (SSE, evento "diskstats")
+    """
+    return sse_response(request, diskstats_collector.broadcaster,
+                        initial=diskstats_collector.get_history(limit=1))
+
+@router.get("/hotplug", response_model=Dict[str, Any])
+async def get_hotplug_events(limit: Optional[int] = None):
+    """
+    Restituisce gli ultimi dischi collegati e scollegati
+    """
+    return hotplug_monitor.get_history(limit)
+
+@router.get("/hotplug/stream")
+async def stream_hotplug_events(request: Request):
+    """
+    Stream dei collegamenti e scollegamenti dei dischi (SSE, evento "hotplug")
+    """
+    return sse_response(request, hotplug_monitor.broadcaster)
+
+@router.post("/benchmark", response_model=Dict[str, Any])
+async def run_disk_benchmark(benchmark: DiskBenchmark):
+    """
+    Avvia in background un benchmark su un file temporaneo nel punto di montaggio
+    """
+    result = await start_benchmark("mount", benchmark.target, benchmark.tests, benchmark.size_mb * 1024 ** 2,
+                                   benchmark.duration, benchmark.threads, benchmark.direct, benchmark.label)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@router.get("/benchmark/results", response_model=Dict[str, Any])
+async def get_benchmark_results(target: Optional[str] = None, limit: int = 50):
+    """
+    Elenca i benchmark salvati (di dischi e dataset), dal più recente
+    """
+    return list_benchmark_results(target, limit)
+
+@router.get("/benchmark/compare", response_model=Dict[str, Any])
+async def compare_benchmarks(base: str, other: str):
+    """
+    Confronta due benchmark salvati (prima e dopo una modifica)
+    """
+    result = compare_benchmark_results(base, other)
+    if not result["success"]:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+@router.get("/benchmark/{run_id}", response_model=Dict[str, Any])
+async def get_benchmark_run(run_id: str):
+    """
+    Restituisce avanzamento o risultati di un benchmark
+    """
+    result = get_benchmark(run_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Benchmark '{run_id}' non trovato")
+    return result
+
+@router.delete("/benchmark/{run_id}", response_model=Dict[str, Any])
+async def delete_benchmark_run(run_id: str):
+    """
+    Annulla un benchmark in corso oppure elimina un benchmark salvato
+    """
+    result = cancel_benchmark(run_id)
+    if not result["success"]:
+        result = delete_benchmark_result(run_id)
+    if not result["success"]:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
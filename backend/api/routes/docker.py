@@ -5,6 +5,7 @@ import os
 import re
 from ..auth import get_current_admin
 from ..utils.overlayfs import ensure_rw_mode, is_filesystem_writable
+from ..utils.command_runner import run_command, start_background
 from ..utils.docker_utils import (
     is_docker_installed,
     get_container_status,
@@ -68,12 +69,12 @@ async def get_docker_status(current_admin = Depends(get_current_admin)):
     }
     
     # Versioni (opzionali, possono essere rimosse se non critiche)
-    version_result = get_docker_version()
+    version_result = await get_docker_version()
     if version_result["success"]:
         result["docker_version"] = version_result["version"]
     
     if compose_available:
-        compose_version_result = get_docker_compose_version()
+        compose_version_result = await get_docker_compose_version()
         if compose_version_result["success"]:
             result["compose_version"] = compose_version_result["version"]
     
@@ -85,7 +86,7 @@ async def get_container_info(container_name: str, current_admin = Depends(get_cu
     """
     Ottiene informazioni su un container Docker
     """
-    result = get_container_status(container_name)
+    result = await get_container_status(container_name)
     
     if not result["success"]:
         raise HTTPException(status_code=404, detail=result.get("error", "Container non trovato"))
@@ -100,7 +101,7 @@ async def start_docker_container(action: ContainerAction, current_admin = Depend
     """
     import os
     working_dir = "/opt/armnas"
-    result = start_container(action.container_name, working_dir)
+    result = await start_container(action.container_name, working_dir)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result.get("error", "Errore nell'avvio del container"))
@@ -113,7 +114,7 @@ async def stop_docker_container(action: ContainerAction, current_admin = Depends
     """
     Ferma un container Docker
     """
-    result = stop_container(action.container_name)
+    result = await stop_container(action.container_name)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result.get("error", "Errore nella fermata del container"))
@@ -126,7 +127,7 @@ async def restart_docker_container(action: ContainerAction, current_admin = Depe
     """
     Riavvia un container Docker
     """
-    result = restart_container(action.container_name)
+    result = await restart_container(action.container_name)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result.get("error", "Errore nel riavvio del container"))
@@ -140,38 +141,26 @@ async def recreate_docker_container(action: ContainerAction, current_admin = Dep
     """
     # Esegui docker compose down && up -d
     try:
-        import subprocess
         working_dir = "/opt/armnas"
         
         # Down
-        result_down = subprocess.run(
-            ["docker", "compose", "down"],
-            cwd=working_dir,
-            capture_output=True,
-            text=True
-        )
+        result_down = await run_command(["docker", "compose", "down"], cwd=working_dir)
         
-        if result_down.returncode != 0:
+        if not result_down["success"]:
             # Prova con docker-compose
-            result_down = subprocess.run(
-                ["docker-compose", "down"],
-                cwd=working_dir,
-                capture_output=True,
-                text=True
-            )
+            result_down = await run_command(["docker-compose", "down"], cwd=working_dir)
         
         # Up in background
-        subprocess.Popen(
-            ["docker", "compose", "up", "-d"],
-            cwd=working_dir,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
+        result_up = await start_background(["docker", "compose", "up", "-d"], cwd=working_dir)
+        if not result_up["success"]:
+            raise HTTPException(status_code=500, detail=f"Errore ricreazione container: {result_up['error']}")
         
         return {
             "success": True,
             "message": f"Container '{action.container_name}' ricreato con successo. Attendi qualche secondo..."
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Errore ricreazione container: {str(e)}")
 
@@ -181,7 +170,7 @@ async def get_docker_container_logs(request: ContainerLogs, current_admin = Depe
     """
     Ottiene i log di un container Docker
     """
-    result = get_container_logs(request.container_name, request.tail)
+    result = await get_container_logs(request.container_name, request.tail)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result.get("error", "Errore nel recupero dei log"))
@@ -194,7 +183,7 @@ async def docker_compose_up(current_admin = Depends(get_current_admin)):
     """
     Avvia i container con docker compose
     """
-    result = compose_up()
+    result = await compose_up()
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result.get("error", "Errore nell'avvio dei container"))
@@ -207,7 +196,7 @@ async def docker_compose_down(current_admin = Depends(get_current_admin)):
     """
     Ferma i container con docker compose
     """
-    result = compose_down()
+    result = await compose_down()
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result.get("error", "Errore nella fermata dei container"))
@@ -220,7 +209,7 @@ async def docker_compose_ps(current_admin = Depends(get_current_admin)):
     """
     Lista i container gestiti da docker compose
     """
-    result = compose_ps()
+    result = await compose_ps()
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result.get("error", "Errore nel recupero dei container"))
@@ -233,7 +222,7 @@ async def get_virtual_dsm_status(current_admin = Depends(get_current_admin)):
     """
     Ottiene lo stato del container virtual-dsm
     """
-    result = get_container_status("virtual-dsm")
+    result = await get_container_status("virtual-dsm")
     
     if not result["success"] and result.get("exists", True):
         raise HTTPException(status_code=404, detail="Container virtual-dsm non trovato")
@@ -471,7 +460,7 @@ async def set_docker_data_root(config: DockerDataRootConfig, current_admin = Dep
     
     # Se richiesta, migra i dati
     if config.migrate and current_data_root != "/var/lib/docker":
-        migrate_result = migrate_docker_data(current_data_root, config.data_root)
+        migrate_result = await migrate_docker_data(current_data_root, config.data_root)
         if not migrate_result["success"]:
             # La configurazione è già stata applicata, ma la migrazione è fallita
             return {
@@ -483,8 +472,7 @@ async def set_docker_data_root(config: DockerDataRootConfig, current_admin = Dep
         result["message"] += f" {migrate_result['message']}"
     else:
         # Riavvia Docker automaticamente per applicare le modifiche
-        from ..utils.docker_utils import run_command
-        restart_result = run_command(["systemctl", "restart", "docker"])
+        restart_result = await run_command(["systemctl", "restart", "docker"])
         if restart_result["success"]:
             result["message"] += " Docker riavviato automaticamente."
         else:
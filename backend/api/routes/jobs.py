@@ -0,0 +1,44 @@
+from fastapi import APIRouter, HTTPException, Request
+from typing import List, Dict, Optional, Any
+from api.utils.jobs import list_jobs, get_job, cancel_job, broadcaster
+from api.utils.streaming import sse_response
+
+router = APIRouter()
+
+# Endpoint per elencare le operazioni in background
+@router.get("", response_model=List[Dict[str, Any]])
+async def get_jobs(limit: int = 50, state: Optional[str] = None):
+    """
+    Elenca i job (formattazioni, creazione di pool, ...) dal più recente
+    """
+    return list_jobs(limit, state)
+
+# Endpoint Server-Sent Events con l'avanzamento dei job
+@router.get("/stream")
+async def stream_jobs(request: Request):
+    """
+    Stream dell'avanzamento di tutti i job (SSE, evento "job")
+    """
+    return sse_response(request, broadcaster, initial={"jobs": list_jobs(20, "running")})
+
+# Endpoint per ottenere lo stato di un job
+@router.get("/{job_id}", response_model=Dict[str, Any])
+async def get_job_status(job_id: str):
+    """
+    Restituisce stato, avanzamento ed esito di un job
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' non trovato")
+    return job
+
+# Endpoint per annullare un job
+@router.delete("/{job_id}", response_model=Dict[str, Any])
+async def cancel_job_run(job_id: str):
+    """
+    Annulla un job in corso (solo se interromperlo non danneggia i dischi)
+    """
+    result = await cancel_job(job_id)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Dict, Optional, Any
+from api.utils.metrics_store import metrics_store, METRICS_DEFAULT_POINTS
+
+router = APIRouter()
+
+# Endpoint per elencare le metriche archiviate
+@router.get("", response_model=Dict[str, Any])
+async def get_metrics():
+    """
+    Elenca metriche, sorgenti e livelli di risoluzione dell'archivio
+    """
+    return metrics_store.list_metrics()
+
+# Endpoint per leggere la storia di una o più metriche
+@router.get("/query", response_model=List[Dict[str, Any]])
+async def query_metrics(metric: List[str] = Query(...), start: Optional[float] = None,
+                        end: Optional[float] = None, points: int = METRICS_DEFAULT_POINTS):
+    """
+    Restituisce le metriche nell'intervallo [start, end] (timestamp Unix, default l'ultima ora),
+    ridotte a circa `points` punti per il grafico
+    """
+    if points < 3 or points > 5000:
+        raise HTTPException(status_code=400, detail="points deve essere compreso tra 3 e 5000")
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=400, detail="start deve precedere end")
+
+    results = []
+    for name in metric:
+        result = metrics_store.query(name, start, end, points)
+        if result is None:
+            raise HTTPException(status_code=404, detail=f"Metrica '{name}' non trovata")
+        results.append(result)
+    return results
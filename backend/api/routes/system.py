@@ -7,11 +7,11 @@ from pydantic import BaseModel
 from typing import Dict, Optional, Any, List
 import subprocess
 import logging
-import platform
-import psutil
-from datetime import datetime, timedelta
 from ..auth import get_current_admin
 from ..utils.overlayfs import check_overlay_status, ensure_rw_mode, is_filesystem_writable
+from ..utils.command_runner import run_command
+from ..utils.system_sampler import system_sampler
+from ..utils.services import get_services_status, invalidate_services
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -33,13 +33,8 @@ async def get_overlayfs_status(current_admin = Depends(get_current_admin)):
         # Ottieni informazioni dettagliate tramite overlay-status
         status_info = {}
         try:
-            result = subprocess.run(
-                ["/usr/local/bin/overlay-status"],
-                capture_output=True,
-                text=True,
-                check=False
-            )
-            status_info["details"] = result.stdout
+            result = await run_command(["/usr/local/bin/overlay-status"], check=False)
+            status_info["details"] = result["output"] or ""
         except Exception:
             pass
         
@@ -71,26 +66,21 @@ async def set_overlayfs_mode(request: OverlayModeRequest, current_admin = Depend
         else:
             command = "/usr/local/bin/overlay-ro"
         
-        result = subprocess.run(
-            [command],
-            capture_output=True,
-            text=True,
-            check=False
-        )
+        result = await run_command([command], check=False)
         
-        if result.returncode == 0:
+        if result["success"]:
             # Verifica lo stato dopo il cambio
             overlay_active, new_mode = check_overlay_status()
             return {
                 "status": "success",
                 "message": f"Sistema passato a modalità {request.mode.upper()}",
                 "current_mode": new_mode or request.mode,
-                "output": result.stdout
+                "output": result["output"]
             }
         else:
             raise HTTPException(
                 status_code=500,
-                detail=f"Errore nel cambio modalità: {result.stderr or result.stdout}"
+                detail=f"Errore nel cambio modalità: {result['error'] or result['output']}"
             )
             
     except HTTPException:
@@ -102,106 +92,29 @@ async def set_overlayfs_mode(request: OverlayModeRequest, current_admin = Depend
 @router.get("/info", response_model=Dict[str, Any])
 async def get_system_info(current_admin = Depends(get_current_admin)):
     """
-    Ottiene informazioni generali sul sistema
+    Ottiene informazioni generali sul sistema (ultimo campione del campionatore in background)
     """
     try:
-        # Ottieni uptime
-        boot_time = datetime.fromtimestamp(psutil.boot_time())
-        uptime_delta = datetime.now() - boot_time
-        days = uptime_delta.days
-        hours, remainder = divmod(uptime_delta.seconds, 3600)
-        minutes, _ = divmod(remainder, 60)
-        uptime_str = f"{days}d {hours}h {minutes}m" if days > 0 else f"{hours}h {minutes}m"
-        
-        # Ottieni hostname
-        hostname = platform.node()
-        
-        # Ottieni info OS
-        os_info = f"{platform.system()} {platform.release()}"
-        
-        # Ottieni kernel
-        kernel = platform.release()
-        
-        # Ottieni info memoria
-        mem = psutil.virtual_memory()
-        mem_total_gb = round(mem.total / (1024**3), 1)
-        mem_used_gb = round(mem.used / (1024**3), 1)
-        mem_percent = round(mem.percent, 1)
-        
-        # Ottieni info CPU
-        cpu_percent = psutil.cpu_percent(interval=1)
-        
-        return {
-            "hostname": hostname,
-            "os": os_info,
-            "kernel": kernel,
-            "uptime": uptime_str,
-            "cpu_usage": round(cpu_percent, 1),
-            "memory_total": mem.total,
-            "memory_used": mem.used,
-            "memory_percent": mem_percent,
-            "memory": {
-                "total_gb": mem_total_gb,
-                "used_gb": mem_used_gb,
-                "percent": mem_percent
-            }
-        }
+        return system_sampler.get_info()
     except Exception as e:
         logger.error(f"Errore nel recupero informazioni sistema: {e}")
         raise HTTPException(status_code=500, detail=f"Errore: {str(e)}")
 
+@router.get("/history", response_model=Dict[str, Any])
+async def get_system_history(limit: Optional[int] = None, per_core: bool = False,
+                             current_admin = Depends(get_current_admin)):
+    """
+    Restituisce la storia recente di CPU, memoria, swap, load e cambi di contesto
+    """
+    return system_sampler.get_history(limit, per_core)
+
 @router.get("/services", response_model=List[Dict[str, Any]])
-async def get_services_status(current_admin = Depends(get_current_admin)):
+async def get_services(current_admin = Depends(get_current_admin)):
     """
-    Ottiene lo stato dei servizi principali del sistema
+    Ottiene lo stato dei servizi principali del sistema (una sola chiamata a systemctl, in cache)
     """
     try:
-        # Lista servizi da monitorare
-        services_to_check = [
-            "armnas-backend",
-            "nginx",
-            "smbd",
-            "vsftpd",
-            "ssh",
-            "docker"
-        ]
-        
-        services_status = []
-        
-        for service_name in services_to_check:
-            try:
-                # Verifica se attivo
-                is_active = subprocess.run(
-                    ["systemctl", "is-active", service_name],
-                    capture_output=True,
-                    text=True,
-                    check=False
-                ).returncode == 0
-                
-                # Verifica se abilitato
-                is_enabled = subprocess.run(
-                    ["systemctl", "is-enabled", service_name],
-                    capture_output=True,
-                    text=True,
-                    check=False
-                ).returncode == 0
-                
-                services_status.append({
-                    "name": service_name,
-                    "active": is_active,
-                    "enabled": is_enabled,
-                    "status": "running" if is_active else "stopped"
-                })
-            except Exception as e:
-                logger.warning(f"Errore nel controllo servizio {service_name}: {e}")
-                services_status.append({
-                    "name": service_name,
-                    "active": False,
-                    "enabled": False,
-                    "status": "unknown"
-                })
-        
-        return services_status
+        return await get_services_status()
     except Exception as e:
         logger.error(f"Errore nel recupero stato servizi: {e}")
         raise HTTPException(status_code=500, detail=f"Errore: {str(e)}")
@@ -212,17 +125,13 @@ async def restart_service(action: ServiceAction, current_admin = Depends(get_cur
     Riavvia un servizio
     """
     try:
-        result = subprocess.run(
-            ["systemctl", "restart", action.service_name],
-            capture_output=True,
-            text=True,
-            check=False
-        )
+        result = await run_command(["systemctl", "restart", action.service_name])
+        invalidate_services()
         
-        if result.returncode == 0:
+        if result["success"]:
             return {"status": "success", "message": f"Servizio {action.service_name} riavviato"}
         else:
-            raise HTTPException(status_code=500, detail=result.stderr or "Errore nel riavvio del servizio")
+            raise HTTPException(status_code=500, detail=result["error"] or "Errore nel riavvio del servizio")
     except Exception as e:
         logger.error(f"Errore nel riavvio servizio {action.service_name}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -233,17 +142,13 @@ async def start_service(action: ServiceAction, current_admin = Depends(get_curre
     Avvia un servizio
     """
     try:
-        result = subprocess.run(
-            ["systemctl", "start", action.service_name],
-            capture_output=True,
-            text=True,
-            check=False
-        )
+        result = await run_command(["systemctl", "start", action.service_name])
+        invalidate_services()
         
-        if result.returncode == 0:
+        if result["success"]:
             return {"status": "success", "message": f"Servizio {action.service_name} avviato"}
         else:
-            raise HTTPException(status_code=500, detail=result.stderr or "Errore nell'avvio del servizio")
+            raise HTTPException(status_code=500, detail=result["error"] or "Errore nell'avvio del servizio")
     except Exception as e:
         logger.error(f"Errore nell'avvio servizio {action.service_name}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -254,17 +159,13 @@ async def stop_service(action: ServiceAction, current_admin = Depends(get_curren
     Ferma un servizio
     """
     try:
-        result = subprocess.run(
-            ["systemctl", "stop", action.service_name],
-            capture_output=True,
-            text=True,
-            check=False
-        )
+        result = await run_command(["systemctl", "stop", action.service_name])
+        invalidate_services()
         
-        if result.returncode == 0:
+        if result["success"]:
             return {"status": "success", "message": f"Servizio {action.service_name} fermato"}
         else:
-            raise HTTPException(status_code=500, detail=result.stderr or "Errore nell'arresto del servizio")
+            raise HTTPException(status_code=500, detail=result["error"] or "Errore nell'arresto del servizio")
     except Exception as e:
         logger.error(f"Errore nell'arresto servizio {action.service_name}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -3,8 +3,8 @@ from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import os
 import yaml
-import subprocess
 from ..auth import get_current_admin
+from ..utils.command_runner import run_command
 
 router = APIRouter()
 
@@ -46,10 +46,7 @@ async def configure_vdsm_network(config: MacvlanConfig, current_admin = Depends(
             
             # 1. Crea rete macvlan se non esiste
             network_name = "vdsm"
-            network_exists = subprocess.run(
-                ["docker", "network", "inspect", network_name],
-                capture_output=True
-            ).returncode == 0
+            network_exists = (await run_command(["docker", "network", "inspect", network_name]))["success"]
             
             if not network_exists:
                 # Crea rete macvlan con modalità bridge esplicita
@@ -64,9 +61,9 @@ async def configure_vdsm_network(config: MacvlanConfig, current_admin = Depends(
                     network_name
                 ]
                 
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode != 0:
-                    raise HTTPException(status_code=500, detail=f"Errore creazione rete: {result.stderr}")
+                result = await run_command(cmd)
+                if not result["success"]:
+                    raise HTTPException(status_code=500, detail=f"Errore creazione rete: {result['error']}")
             
             # 2. Configura servizio con rete macvlan
             # Rimuovi mappatura porte (non necessaria con macvlan)
@@ -1,19 +1,45 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response, Request
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Any
+import time
 from ..auth import get_current_admin
 from ..utils.zfs_utils import (
     get_zfs_pools, 
     get_zfs_datasets, 
     get_available_disks,
     create_zfs_pool,
+    build_zfs_pool_create,
     destroy_zfs_pool,
     create_zfs_dataset,
     destroy_zfs_dataset,
     get_zfs_pool_status,
+    get_all_zfs_pool_status,
     get_zfs_pool_properties,
-    get_zfs_dataset_properties
+    get_zfs_dataset_properties,
+    get_zfs_bulk_properties,
+    get_zfs_inventory_generation,
+    get_zfs_snapshots,
+    create_zfs_snapshots,
+    destroy_zfs_snapshot,
+    prune_zfs_snapshots,
+    paginate
 )
+from ..utils.zpool_iostat import iostat_reader
+from ..utils.zfs_arc import arc_collector
+from ..utils.zpool_events import event_follower
+from ..utils.zfs_program import run_zfs_batch
+from ..utils.space_index import update_space_index, get_space_treemap, drop_space_index
+from ..utils.recordsize_advisor import start_recordsize_scan, get_recordsize_scan, cancel_recordsize_scan
+from ..utils.zfs_replication import (
+    start_replication,
+    get_replication_jobs,
+    get_replication_job,
+    cancel_replication,
+    abort_resumable_receive
+)
+from ..utils.benchmark import start_benchmark, BENCH_DEFAULT_DURATION
+from ..utils.jobs import submit_job
+from ..utils.streaming import sse_response
 
 router = APIRouter()
 
@@ -30,6 +56,8 @@ class ZFSDatasetCreate(BaseModel):
     mount_point: Optional[str] = None
     quota: Optional[str] = None
     compression: Optional[str] = None
+    recordsize: Optional[str] = None
+    special_small_blocks: Optional[str] = None
 
 class ZFSPoolDestroy(BaseModel):
     name: str
@@ -40,21 +68,170 @@ class ZFSDatasetDestroy(BaseModel):
     recursive: bool = False
     force: bool = False
 
+class ZFSSnapshotCreate(BaseModel):
+    datasets: List[str]
+    name: str
+    recursive: bool = False
+
+class ZFSSnapshotDestroy(BaseModel):
+    name: str  # dataset@snapshot
+    recursive: bool = False
+
+class ZFSSnapshotPrune(BaseModel):
+    dataset: str
+    keep_last: Optional[int] = None
+    older_than_days: Optional[float] = None
+    prefix: Optional[str] = None
+    recursive: bool = False
+    dry_run: bool = False
+
+class ZFSAdvisorScan(BaseModel):
+    dataset: str
+    workers: int = 4
+    max_files: int = 1000000
+    max_rate: float = 20000  # voci al secondo
+
+class ZFSAdvisorCancel(BaseModel):
+    dataset: str
+
+class ZFSSpaceIndexUpdate(BaseModel):
+    dataset: str
+    full: bool = False
+    workers: int = 4
+
+class ZFSSpaceIndexDrop(BaseModel):
+    dataset: str
+
+class ZFSBatchOperation(BaseModel):
+    op: str  # snapshot, destroy, promote
+    target: str
+
+class ZFSBatch(BaseModel):
+    operations: List[ZFSBatchOperation]
+    dry_run: bool = False
+
+class ZFSPropertiesQuery(BaseModel):
+    datasets: List[str]
+    properties: Optional[List[str]] = None
+
+class ZFSReplicationCreate(BaseModel):
+    source: str  # dataset@snapshot
+    target: str
+    base: Optional[str] = None  # snapshot di partenza per l'invio incrementale
+    compressed: bool = True
+    large_block: bool = True
+    force: bool = False
+    rate_limit: Optional[int] = None  # byte al secondo
+    resume: bool = True
+
+class ZFSReplicationAbort(BaseModel):
+    target: str
+
+class ZFSBenchmark(BaseModel):
+    dataset: str
+    tests: Optional[List[str]] = None  # seq_write, seq_read, rand_read, rand_write, fsync
+    size_mb: int = 1024
+    duration: float = BENCH_DEFAULT_DURATION
+    threads: int = 1  # operazioni in coda nei test casuali
+    direct: bool = True
+    label: Optional[str] = None
+
 # Endpoint per ottenere l'elenco dei pool ZFS
 @router.get("/pools", response_model=List[Dict[str, Any]])
-async def list_zfs_pools(current_admin = Depends(get_current_admin)):
+async def list_zfs_pools(response: Response, current_admin = Depends(get_current_admin)):
     """
     Ottiene l'elenco dei pool ZFS
     """
-    return get_zfs_pools()
+    pools = await get_zfs_pools()
+    response.headers["X-Inventory-Generation"] = str(get_zfs_inventory_generation())
+    return pools
 
 # Endpoint per ottenere l'elenco dei dataset ZFS
 @router.get("/datasets", response_model=List[Dict[str, Any]])
-async def list_zfs_datasets(current_admin = Depends(get_current_admin)):
+async def list_zfs_datasets(
+    response: Response,
+    pool: Optional[str] = None,
+    parent: Optional[str] = None,
+    depth: Optional[int] = None,
+    sort: Optional[str] = None,
+    order: str = "asc",
+    type: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    current_admin = Depends(get_current_admin)
+):
     """
     Ottiene l'elenco dei dataset ZFS
+    
+    Filtri, profondità e ordinamento vengono passati a zfs list (-d, -s/-S, -t).
+    Con limit la risposta è paginata: il cursore della pagina successiva è nell'header X-Next-Cursor.
     """
-    return get_zfs_datasets()
+    root = _list_root(pool, parent)
+    if type is not None and type not in ("filesystem", "volume", "all"):
+        raise HTTPException(status_code=400, detail=f"Tipo non valido: {type}")
+    types = "filesystem,volume" if type == "all" else type
+    
+    try:
+        datasets = await get_zfs_datasets(root, depth, sort, _is_descending(order), types)
+        page, next_cursor = paginate(datasets, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    _set_list_headers(response, len(datasets), next_cursor)
+    return page
+
+# Endpoint per ottenere l'elenco degli snapshot ZFS
+@router.get("/snapshots", response_model=List[Dict[str, Any]])
+async def list_zfs_snapshots(
+    response: Response,
+    pool: Optional[str] = None,
+    parent: Optional[str] = None,
+    depth: Optional[int] = None,
+    sort: Optional[str] = None,
+    order: str = "asc",
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    current_admin = Depends(get_current_admin)
+):
+    """
+    Ottiene l'elenco degli snapshot ZFS, con la stessa paginazione e gli stessi filtri dei dataset
+    """
+    root = _list_root(pool, parent)
+    
+    try:
+        snapshots = await get_zfs_snapshots(root, depth, sort, _is_descending(order))
+        page, next_cursor = paginate(snapshots, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    _set_list_headers(response, len(snapshots), next_cursor)
+    return page
+
+def _list_root(pool: Optional[str], parent: Optional[str]) -> Optional[str]:
+    # parent (dataset) ha la precedenza su pool e deve appartenervi
+    if parent and pool and parent != pool and not parent.startswith(f"{pool}/"):
+        raise HTTPException(status_code=400, detail=f"Il dataset '{parent}' non appartiene al pool '{pool}'")
+    return parent or pool
+
+def _is_descending(order: str) -> bool:
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="Ordine non valido: usa 'asc' o 'desc'")
+    return order == "desc"
+
+def _set_list_headers(response: Response, total: int, next_cursor: Optional[str]) -> None:
+    response.headers["X-Total-Count"] = str(total)
+    response.headers["X-Inventory-Generation"] = str(get_zfs_inventory_generation())
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+# Endpoint per ottenere la generazione corrente dell'inventario ZFS
+@router.get("/inventory/generation", response_model=Dict[str, int])
+async def get_inventory_generation(current_admin = Depends(get_current_admin)):
+    """
+    Restituisce il contatore di generazione dell'inventario ZFS:
+    i client ricaricano pool e dataset solo quando cambia
+    """
+    return {"generation": get_zfs_inventory_generation()}
 
 # Endpoint per ottenere l'elenco dei dischi disponibili per ZFS
 @router.get("/available-disks", response_model=List[Dict[str, Any]])
@@ -62,25 +239,47 @@ async def list_available_disks(current_admin = Depends(get_current_admin)):
     """
     Ottiene l'elenco dei dischi disponibili per la creazione di pool ZFS
     """
-    return get_available_disks()
+    return await get_available_disks()
 
 # Endpoint per creare un nuovo pool ZFS
 @router.post("/pools", response_model=Dict[str, Any])
 async def create_pool(pool_data: ZFSPoolCreate, current_admin = Depends(get_current_admin)):
     """
-    Crea un nuovo pool ZFS
+    Crea un nuovo pool ZFS in un job in background (su dischi USB grandi richiede minuti).
+    Restituisce subito l'id del job, da seguire su /api/jobs.
     """
-    result = create_zfs_pool(
+    prepared = await build_zfs_pool_create(
         pool_data.name,
         pool_data.raid_type,
         pool_data.disks,
         pool_data.mount_point
     )
     
+    if not prepared["success"]:
+        raise HTTPException(status_code=400, detail=prepared["error"])
+    
+    async def create(job) -> Dict[str, Any]:
+        job.set_progress(message=f"Creazione del pool '{pool_data.name}'")
+        return await create_zfs_pool(
+            pool_data.name,
+            pool_data.raid_type,
+            pool_data.disks,
+            pool_data.mount_point,
+            run=job.run_command
+        )
+    
+    # Interrompere zpool create lascerebbe i dischi in uno stato incoerente
+    result = await submit_job("zpool_create", pool_data.name, pool_data.disks, create, cancellable=False)
+    
     if not result["success"]:
-        raise HTTPException(status_code=400, detail=result["error"])
+        raise HTTPException(status_code=409, detail=result["error"])
     
-    return result
+    return {
+        "success": True,
+        "message": f"Creazione del pool ZFS '{pool_data.name}' avviata",
+        "job_id": result["job_id"],
+        "job": result["job"]
+    }
 
 # Endpoint per distruggere un pool ZFS
 @router.delete("/pools", response_model=Dict[str, Any])
@@ -88,7 +287,7 @@ async def destroy_pool(pool_data: ZFSPoolDestroy, current_admin = Depends(get_cu
     """
     Distrugge un pool ZFS
     """
-    result = destroy_zfs_pool(pool_data.name, pool_data.force)
+    result = await destroy_zfs_pool(pool_data.name, pool_data.force)
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
@@ -101,12 +300,14 @@ async def create_dataset(dataset_data: ZFSDatasetCreate, current_admin = Depends
     """
     Crea un nuovo dataset ZFS
     """
-    result = create_zfs_dataset(
+    result = await create_zfs_dataset(
         dataset_data.pool_name,
         dataset_data.dataset_name,
         dataset_data.mount_point,
         dataset_data.quota,
-        dataset_data.compression
+        dataset_data.compression,
+        dataset_data.recordsize,
+        dataset_data.special_small_blocks
     )
     
     if not result["success"]:
@@ -120,20 +321,98 @@ async def destroy_dataset(dataset_data: ZFSDatasetDestroy, current_admin = Depen
     """
     Distrugge un dataset ZFS
     """
-    result = destroy_zfs_dataset(dataset_data.name, dataset_data.recursive, dataset_data.force)
+    result = await destroy_zfs_dataset(dataset_data.name, dataset_data.recursive, dataset_data.force)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
+# Endpoint per creare snapshot ZFS
+@router.post("/snapshots", response_model=Dict[str, Any])
+async def create_snapshots(snapshot_data: ZFSSnapshotCreate, current_admin = Depends(get_current_admin)):
+    """
+    Crea in modo atomico uno snapshot con lo stesso nome su uno o più dataset
+    """
+    result = await create_zfs_snapshots(snapshot_data.datasets, snapshot_data.name, snapshot_data.recursive)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
+# Endpoint per distruggere uno snapshot ZFS
+@router.delete("/snapshots", response_model=Dict[str, Any])
+async def destroy_snapshot(snapshot_data: ZFSSnapshotDestroy, current_admin = Depends(get_current_admin)):
+    """
+    Distrugge uno snapshot ZFS
+    """
+    result = await destroy_zfs_snapshot(snapshot_data.name, snapshot_data.recursive)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
+# Endpoint per eliminare gli snapshot secondo una politica di conservazione
+@router.post("/snapshots/prune", response_model=Dict[str, Any])
+async def prune_snapshots(prune_data: ZFSSnapshotPrune, current_admin = Depends(get_current_admin)):
+    """
+    Elimina gli snapshot oltre i più recenti da conservare e/o più vecchi di N giorni.
+    Con dry_run restituisce solo l'elenco degli intervalli che verrebbero eliminati.
+    """
+    older_than = None
+    if prune_data.older_than_days is not None:
+        older_than = int(time.time() - prune_data.older_than_days * 86400)
+    
+    result = await prune_zfs_snapshots(
+        prune_data.dataset,
+        prune_data.keep_last,
+        older_than,
+        prune_data.prefix,
+        prune_data.recursive,
+        prune_data.dry_run
+    )
     
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
     
     return result
 
+# Endpoint per eseguire più operazioni ZFS in un solo transaction group
+@router.post("/batch", response_model=Dict[str, Any])
+async def run_batch(batch_data: ZFSBatch, current_admin = Depends(get_current_admin)):
+    """
+    Esegue snapshot, destroy e promote in blocco: per ogni pool channel program che verificano
+    tutti i passi prima di applicarli, oppure comandi zfs sequenziali se non sono disponibili
+    """
+    result = await run_zfs_batch([operation.dict() for operation in batch_data.operations], batch_data.dry_run)
+    
+    if not result["success"] and "pools" not in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
+# Endpoint per ottenere lo stato di tutti i pool ZFS (un solo zpool status)
+@router.get("/pools/status", response_model=Dict[str, Any])
+async def get_all_pools_status(current_admin = Depends(get_current_admin)):
+    """
+    Ottiene lo stato strutturato di tutti i pool ZFS (salute, vdev, errori, scrub/resilver)
+    """
+    result = await get_all_zfs_pool_status()
+    
+    if not result["success"]:
+        raise HTTPException(status_code=500, detail=result["error"])
+    
+    return result
+
 # Endpoint per ottenere lo stato di un pool ZFS
 @router.get("/pools/{name}/status", response_model=Dict[str, Any])
 async def get_pool_status(name: str, current_admin = Depends(get_current_admin)):
     """
     Ottiene lo stato dettagliato di un pool ZFS
     """
-    result = get_zfs_pool_status(name)
+    result = await get_zfs_pool_status(name)
     
     if not result["success"]:
         raise HTTPException(status_code=404, detail=f"Pool ZFS '{name}' non trovato")
@@ -146,22 +425,247 @@ async def get_pool_properties(name: str, current_admin = Depends(get_current_adm
     """
     Ottiene le proprietà di un pool ZFS
     """
-    result = get_zfs_pool_properties(name)
+    result = await get_zfs_pool_properties(name)
     
     if not result["success"]:
         raise HTTPException(status_code=404, detail=f"Pool ZFS '{name}' non trovato")
     
     return result
 
+# Endpoint per avviare l'analisi dei file di un dataset (consigli su recordsize)
+@router.post("/datasets/advisor", response_model=Dict[str, Any])
+async def start_dataset_advisor(scan_data: ZFSAdvisorScan, current_admin = Depends(get_current_admin)):
+    """
+    Avvia in background la scansione del mountpoint del dataset per consigliare
+    recordsize, special_small_blocks e compressione
+    """
+    result = await start_recordsize_scan(scan_data.dataset, scan_data.workers, scan_data.max_files, scan_data.max_rate)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
+# Endpoint per ottenere avanzamento e risultato dell'analisi di un dataset
+@router.get("/datasets/advisor", response_model=Dict[str, Any])
+async def get_dataset_advisor(dataset: str, current_admin = Depends(get_current_admin)):
+    """
+    Restituisce l'avanzamento della scansione e, quando è completata, istogramma e consigli
+    """
+    scan = get_recordsize_scan(dataset)
+    
+    if scan is None:
+        raise HTTPException(status_code=404, detail=f"Nessuna analisi per il dataset '{dataset}'")
+    
+    return scan
+
+# Endpoint per annullare l'analisi di un dataset
+@router.delete("/datasets/advisor", response_model=Dict[str, Any])
+async def cancel_dataset_advisor(cancel_data: ZFSAdvisorCancel, current_admin = Depends(get_current_admin)):
+    """
+    Annulla la scansione in corso
+    """
+    result = cancel_recordsize_scan(cancel_data.dataset)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
+# Endpoint per avviare un benchmark su un dataset
+@router.post("/datasets/benchmark", response_model=Dict[str, Any])
+async def run_dataset_benchmark(benchmark: ZFSBenchmark, current_admin = Depends(get_current_admin)):
+    """
+    Avvia in background un benchmark su un file temporaneo nel mountpoint del dataset.
+    Avanzamento, risultati salvati e confronti sono in /api/disk/benchmark.
+    """
+    result = await start_benchmark("dataset", benchmark.dataset, benchmark.tests, benchmark.size_mb * 1024 ** 2,
+                                   benchmark.duration, benchmark.threads, benchmark.direct, benchmark.label)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
+# Endpoint per costruire o aggiornare l'indice dello spazio occupato di un dataset
+@router.post("/space", response_model=Dict[str, Any])
+async def update_space(index_data: ZFSSpaceIndexUpdate, current_admin = Depends(get_current_admin)):
+    """
+    Costruisce l'indice dello spazio per directory (prima volta o con full) oppure lo aggiorna
+    rileggendo solo le directory cambiate secondo zfs diff. L'operazione prosegue in background.
+    """
+    result = await update_space_index(index_data.dataset, index_data.full, max(1, min(index_data.workers, 16)))
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
+# Endpoint per ottenere il treemap dello spazio occupato
+@router.get("/space", response_model=Dict[str, Any])
+async def get_space(dataset: str, path: str = "", depth: int = 2, limit: int = 20,
+                    current_admin = Depends(get_current_admin)):
+    """
+    Restituisce le directory che occupano più spazio sotto path (dall'indice, senza leggere i dischi)
+    """
+    result = get_space_treemap(dataset, path, max(0, min(depth, 5)), max(1, min(limit, 100)))
+    
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Nessun indice per il dataset '{dataset}'")
+    
+    if result["state"] == "ready" and result["tree"] is None:
+        raise HTTPException(status_code=404, detail=f"Percorso '{path}' non trovato nell'indice")
+    
+    return result
+
+# Endpoint per eliminare l'indice dello spazio di un dataset
+@router.delete("/space", response_model=Dict[str, Any])
+async def drop_space(index_data: ZFSSpaceIndexDrop, current_admin = Depends(get_current_admin)):
+    """
+    Elimina l'indice e il relativo snapshot di riferimento
+    """
+    result = await drop_space_index(index_data.dataset)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
+# Endpoint per ottenere le proprietà di più dataset con una sola chiamata
+@router.post("/datasets/properties", response_model=Dict[str, Any])
+async def get_bulk_dataset_properties(query: ZFSPropertiesQuery, current_admin = Depends(get_current_admin)):
+    """
+    Ottiene le proprietà richieste di più dataset (un solo zfs get), con valori tipizzati e origine
+    """
+    result = await get_zfs_bulk_properties(query.datasets, query.properties)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
 # Endpoint per ottenere le proprietà di un dataset ZFS
 @router.get("/datasets/{name}/properties", response_model=Dict[str, Any])
 async def get_dataset_properties(name: str, current_admin = Depends(get_current_admin)):
     """
     Ottiene le proprietà di un dataset ZFS
     """
-    result = get_zfs_dataset_properties(name)
+    result = await get_zfs_dataset_properties(name)
     
     if not result["success"]:
         raise HTTPException(status_code=404, detail=f"Dataset ZFS '{name}' non trovato")
     
-    return result
\ No newline at end of file
+    return result
+
+# Endpoint per ottenere gli ultimi campioni di I/O dei pool
+@router.get("/iostat", response_model=Dict[str, Any])
+async def get_pool_iostat(limit: Optional[int] = None, current_admin = Depends(get_current_admin)):
+    """
+    Restituisce gli ultimi campioni di zpool iostat (operazioni, banda e latenze per vdev).
+    I campioni vengono raccolti solo mentre almeno un client è collegato a /iostat/stream.
+    """
+    return iostat_reader.get_history(limit)
+
+# Endpoint Server-Sent Events con i campioni di I/O in tempo reale
+@router.get("/iostat/stream")
+async def stream_pool_iostat(request: Request, current_admin = Depends(get_current_admin)):
+    """
+    Stream in tempo reale di zpool iostat: un solo processo condiviso da tutti i client
+    """
+    return sse_response(request, iostat_reader.broadcaster, initial=iostat_reader.get_history())
+
+# Endpoint per ottenere gli ultimi eventi ZFS
+@router.get("/events", response_model=Dict[str, Any])
+async def get_zfs_events(limit: Optional[int] = None, pool: Optional[str] = None,
+                         current_admin = Depends(get_current_admin)):
+    """
+    Restituisce gli ultimi eventi ZFS (guasti, scrub/resilver, modifiche alla configurazione)
+    """
+    return event_follower.get_history(limit, pool)
+
+# Endpoint per ricevere gli eventi ZFS in tempo reale
+@router.get("/events/stream")
+async def stream_zfs_events(request: Request, current_admin = Depends(get_current_admin)):
+    """
+    Stream degli eventi ZFS (SSE, evento "zfs"): sostituisce il polling dello stato dei pool
+    """
+    return sse_response(request, event_follower.broadcaster)
+
+# Endpoint per ottenere le statistiche dell'ARC
+@router.get("/arc", response_model=Dict[str, Any])
+async def get_arc_stats(limit: Optional[int] = None, current_admin = Depends(get_current_admin)):
+    """
+    Restituisce dimensione, hit ratio, ripartizione MRU/MFU e L2ARC dell'ARC,
+    con la storia dei campioni raccolti in background
+    """
+    return arc_collector.get_summary(limit)
+
+# Endpoint per avviare una replica (zfs send | zfs recv) in background
+@router.post("/replication", response_model=Dict[str, Any])
+async def create_replication(replication_data: ZFSReplicationCreate, current_admin = Depends(get_current_admin)):
+    """
+    Avvia la replica di uno snapshot verso un altro dataset (es. un pool di backup su USB).
+    La risposta è immediata: l'avanzamento si legge da /replication/{job_id}
+    """
+    result = await start_replication(
+        replication_data.source,
+        replication_data.target,
+        replication_data.base,
+        replication_data.compressed,
+        replication_data.large_block,
+        replication_data.force,
+        replication_data.rate_limit,
+        replication_data.resume
+    )
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
+# Endpoint per ottenere l'elenco dei job di replica
+@router.get("/replication", response_model=List[Dict[str, Any]])
+async def list_replications(current_admin = Depends(get_current_admin)):
+    """
+    Ottiene l'elenco dei job di replica (in corso e conclusi)
+    """
+    return get_replication_jobs()
+
+# Endpoint per ottenere lo stato di un job di replica
+@router.get("/replication/{job_id}", response_model=Dict[str, Any])
+async def get_replication(job_id: str, current_admin = Depends(get_current_admin)):
+    """
+    Ottiene byte trasferiti, velocità e stato di un job di replica
+    """
+    job = get_replication_job(job_id)
+    
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job di replica '{job_id}' non trovato")
+    
+    return job
+
+# Endpoint per interrompere un job di replica
+@router.delete("/replication/{job_id}", response_model=Dict[str, Any])
+async def stop_replication(job_id: str, current_admin = Depends(get_current_admin)):
+    """
+    Interrompe un job di replica (potrà essere ripreso avviando di nuovo la stessa replica)
+    """
+    result = await cancel_replication(job_id)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
+
+# Endpoint per scartare lo stato di una ricezione interrotta
+@router.post("/replication/abort-resume", response_model=Dict[str, Any])
+async def abort_replication_resume(abort_data: ZFSReplicationAbort, current_admin = Depends(get_current_admin)):
+    """
+    Elimina il resume token di un dataset di destinazione (zfs recv -A)
+    """
+    result = await abort_resumable_receive(abort_data.target)
+    
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    
+    return result
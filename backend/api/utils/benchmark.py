@@ -0,0 +1,640 @@
+"""
+Benchmark di dischi e dataset
+
+Misure ripetibili su un file temporaneo nel mountpoint di un dataset o di un disco montato:
+lettura/scrittura sequenziale, lettura/scrittura casuale a 4K con più thread (ogni thread
+è un'operazione in coda, quindi threads equivale alla queue depth) e latenza di fsync.
+Dove il filesystem lo consente i file vengono aperti con O_DIRECT (buffer allineati con mmap)
+per escludere la page cache. Le latenze sono riportate in percentili e i risultati sono
+salvati nel database per confrontare le esecuzioni prima e dopo una modifica.
+"""
+
+import asyncio
+import errno
+import json
+import logging
+import math
+import mmap
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Tuple
+
+import psutil
+
+from .block_devices import get_block_devices
+from .command_runner import start_task
+from .zfs_utils import get_zfs_bulk_properties
+from ..database import SessionLocal, BenchmarkResult
+
+logger = logging.getLogger(__name__)
+
+# Test disponibili, nell'ordine di esecuzione (la scrittura sequenziale crea il file dei test di lettura)
+BENCH_TESTS = ["seq_write", "seq_read", "rand_read", "rand_write", "fsync"]
+
+# Dimensione del file di prova (byte) e limiti
+BENCH_DEFAULT_SIZE = 1024 ** 3
+BENCH_MIN_SIZE = 16 * 1024 ** 2
+BENCH_MAX_SIZE = 64 * 1024 ** 3
+
+# Durata (secondi) dei test casuali e di fsync
+BENCH_DEFAULT_DURATION = 10
+BENCH_MAX_DURATION = 120
+
+BENCH_MAX_THREADS = 32
+
+# Dimensione dei blocchi dei test sequenziali e casuali
+BENCH_SEQ_BLOCK = 1024 ** 2
+BENCH_RANDOM_BLOCK = 4096
+
+# Spazio libero richiesto oltre al file di prova
+BENCH_FREE_SPACE_MARGIN = 256 * 1024 ** 2
+
+# Prefisso dei file temporanei nel mountpoint
+BENCH_FILE_PREFIX = ".armnas-bench-"
+
+# Esecuzioni conservate in memoria (i risultati completi restano nel database)
+BENCH_RECENT_RUNS = 20
+
+# Metriche confrontate tra due esecuzioni (latency.* sono percentili in millisecondi)
+BENCH_COMPARE_METRICS = {
+    "seq_write": ["bytes_per_sec"],
+    "seq_read": ["bytes_per_sec"],
+    "rand_read": ["iops", "bytes_per_sec", "latency.p50_ms", "latency.p99_ms"],
+    "rand_write": ["iops", "bytes_per_sec", "latency.p50_ms", "latency.p99_ms"],
+    "fsync": ["ops_per_sec", "latency.p50_ms", "latency.p99_ms"]
+}
+
+_runs: Dict[str, "BenchmarkRun"] = {}
+
+class BenchmarkCancelled(Exception):
+    """
+    Sollevata quando un benchmark viene annullato
+    """
+
+def latency_summary(latencies: array) -> Dict[str, Any]:
+    """
+    Riassume le latenze (in secondi) con media e percentili in millisecondi (nearest rank)
+    """
+    count = len(latencies)
+    if not count:
+        return {"count": 0}
+
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(count - 1, max(0, math.ceil(p / 100 * count) - 1))] * 1000, 3)
+
+    return {
+        "count": count,
+        "mean_ms": round(sum(ordered) / count * 1000, 3),
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p99_ms": percentile(99),
+        "p99_9_ms": percentile(99.9),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+def _open_file(path: str, flags: int, direct: bool) -> Tuple[int, bool]:
+    # Alcuni filesystem (tmpfs, ZFS prima della 2.3 su alcune piattaforme) rifiutano O_DIRECT
+    if direct and hasattr(os, "O_DIRECT"):
+        try:
+            return os.open(path, flags | os.O_DIRECT, 0o600), True
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+    return os.open(path, flags, 0o600), False
+
+def _aligned_buffer(size: int) -> mmap.mmap:
+    # mmap anonimo: allineato alla pagina come richiesto da O_DIRECT. Dati casuali,
+    # altrimenti la compressione di ZFS renderebbe la scrittura di zeri quasi gratuita.
+    buffer = mmap.mmap(-1, size)
+    buffer.write(os.urandom(size))
+    return buffer
+
+def _drop_cache(fd: int) -> None:
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except (OSError, AttributeError):
+        pass
+
+def _filesystem_of(path: str) -> Optional[str]:
+    best = None
+    for partition in psutil.disk_partitions(all=True):
+        mountpoint = partition.mountpoint
+        if path == mountpoint or path.startswith(mountpoint.rstrip("/") + "/"):
+            if best is None or len(mountpoint) > len(best.mountpoint):
+                best = partition
+    return best.fstype if best is not None else None
+
+class BenchmarkRun:
+    """
+    Esecuzione di una serie di test in un thread separato
+    """
+
+    def __init__(self, target_type: str, target: str, directory: str, tests: List[str], size: int,
+                 duration: float, threads: int, direct: bool, label: Optional[str], filesystem: Optional[str]):
+        self.id = uuid.uuid4().hex[:12]
+        self.target_type = target_type
+        self.target = target
+        self.directory = directory
+        self.tests = tests
+        self.size = size
+        self.duration = duration
+        self.threads = threads
+        self.direct = direct
+        self.label = label
+        self.filesystem = filesystem
+        self.data_path = os.path.join(directory, f"{BENCH_FILE_PREFIX}{self.id}")
+        self.results: Dict[str, Any] = {}
+        self.warnings: List[str] = []
+        self.state = "running"  # running, completed, failed, cancelled
+        self.current_test: Optional[str] = None
+        self.progress = 0.0
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Future] = None
+        self._cancel = threading.Event()
+        self._file_ready = False
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return {
+            "tests": self.tests,
+            "size": self.size,
+            "duration": self.duration,
+            "threads": self.threads,
+            "direct": self.direct,
+            "filesystem": self.filesystem
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.id,
+            "target_type": self.target_type,
+            "target": self.target,
+            "path": self.directory,
+            "label": self.label,
+            "params": self.params,
+            "state": self.state,
+            "current_test": self.current_test,
+            "progress": round(self.progress * 100, 1),
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "results": self.results,
+            "warnings": self.warnings
+        }
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def _check(self) -> None:
+        if self._cancel.is_set():
+            raise BenchmarkCancelled()
+
+    def _write_file(self) -> Tuple[float, bool]:
+        fd, direct = _open_file(self.data_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, self.direct)
+        buffer = _aligned_buffer(BENCH_SEQ_BLOCK)
+        try:
+            start = time.perf_counter()
+            offset = 0
+            while offset < self.size:
+                self._check()
+                offset += os.pwrite(fd, buffer, offset)
+                self.progress = offset / self.size
+            os.fsync(fd)
+            elapsed = time.perf_counter() - start
+            _drop_cache(fd)
+        finally:
+            os.close(fd)
+            buffer.close()
+        self._file_ready = True
+        return elapsed, direct
+
+    def _ensure_file(self) -> None:
+        # I test di lettura e di scrittura casuale lavorano su un file già allocato
+        if not self._file_ready:
+            self._write_file()
+            self.progress = 0.0
+
+    def _seq_write(self) -> Dict[str, Any]:
+        elapsed, direct = self._write_file()
+        return {
+            "block_size": BENCH_SEQ_BLOCK,
+            "bytes": self.size,
+            "seconds": round(elapsed, 3),
+            "bytes_per_sec": round(self.size / elapsed),
+            "direct": direct
+        }
+
+    def _seq_read(self) -> Dict[str, Any]:
+        self._ensure_file()
+        fd, direct = _open_file(self.data_path, os.O_RDONLY, self.direct)
+        buffer = _aligned_buffer(BENCH_SEQ_BLOCK)
+        try:
+            _drop_cache(fd)
+            start = time.perf_counter()
+            offset = 0
+            while offset < self.size:
+                self._check()
+                read = os.preadv(fd, [buffer], offset)
+                if not read:
+                    break
+                offset += read
+                self.progress = offset / self.size
+            elapsed = time.perf_counter() - start
+        finally:
+            os.close(fd)
+            buffer.close()
+        return {
+            "block_size": BENCH_SEQ_BLOCK,
+            "bytes": offset,
+            "seconds": round(elapsed, 3),
+            "bytes_per_sec": round(offset / elapsed),
+            "direct": direct
+        }
+
+    def _random_worker(self, index: int, write: bool, deadline: float) -> Tuple[array, bool]:
+        fd, direct = _open_file(self.data_path, os.O_RDWR if write else os.O_RDONLY, self.direct)
+        buffer = _aligned_buffer(BENCH_RANDOM_BLOCK)
+        rng = random.Random(index)
+        blocks = self.size // BENCH_RANDOM_BLOCK
+        latencies = array("d")
+        try:
+            while not self._cancel.is_set():
+                offset = rng.randrange(blocks) * BENCH_RANDOM_BLOCK
+                started = time.perf_counter()
+                if write:
+                    os.pwrite(fd, buffer, offset)
+                else:
+                    os.preadv(fd, [buffer], offset)
+                finished = time.perf_counter()
+                latencies.append(finished - started)
+                if finished >= deadline:
+                    break
+                if index == 0 and len(latencies) % 256 == 0:
+                    self.progress = min(1.0, 1 - (deadline - finished) / self.duration)
+            if write:
+                # Senza O_DIRECT le scritture sono finite nella page cache: il flush fa parte del test
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+            buffer.close()
+        return latencies, direct
+
+    def _random_io(self, write: bool) -> Dict[str, Any]:
+        self._ensure_file()
+        fd = os.open(self.data_path, os.O_RDONLY)
+        _drop_cache(fd)
+        os.close(fd)
+
+        start = time.perf_counter()
+        deadline = start + self.duration
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="bench") as executor:
+            futures = [executor.submit(self._random_worker, index, write, deadline)
+                       for index in range(self.threads)]
+            results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+        self._check()
+
+        latencies = array("d")
+        for worker_latencies, _ in results:
+            latencies.extend(worker_latencies)
+        ops = len(latencies)
+        return {
+            "block_size": BENCH_RANDOM_BLOCK,
+            "threads": self.threads,
+            "ops": ops,
+            "seconds": round(elapsed, 3),
+            "iops": round(ops / elapsed, 1),
+            "bytes_per_sec": round(ops * BENCH_RANDOM_BLOCK / elapsed),
+            "direct": all(direct for _, direct in results),
+            "latency": latency_summary(latencies)
+        }
+
+    def _fsync(self) -> Dict[str, Any]:
+        # Latenza di una scrittura sincrona da 4K: su ZFS passa dallo ZIL (o dal vdev SLOG)
+        path = f"{self.data_path}.fsync"
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        buffer = _aligned_buffer(BENCH_RANDOM_BLOCK)
+        latencies = array("d")
+        try:
+            start = time.perf_counter()
+            deadline = start + self.duration
+            while True:
+                self._check()
+                started = time.perf_counter()
+                os.pwrite(fd, buffer, (len(latencies) % 256) * BENCH_RANDOM_BLOCK)
+                os.fsync(fd)
+                finished = time.perf_counter()
+                latencies.append(finished - started)
+                self.progress = min(1.0, (finished - start) / self.duration)
+                if finished >= deadline:
+                    break
+            elapsed = time.perf_counter() - start
+        finally:
+            os.close(fd)
+            buffer.close()
+            os.unlink(path)
+        return {
+            "block_size": BENCH_RANDOM_BLOCK,
+            "ops": len(latencies),
+            "seconds": round(elapsed, 3),
+            "ops_per_sec": round(len(latencies) / elapsed, 1),
+            "latency": latency_summary(latencies)
+        }
+
+    def _execute(self) -> None:
+        tests = {
+            "seq_write": self._seq_write,
+            "seq_read": self._seq_read,
+            "rand_read": lambda: self._random_io(False),
+            "rand_write": lambda: self._random_io(True),
+            "fsync": self._fsync
+        }
+        try:
+            for test in self.tests:
+                self._check()
+                self.current_test = test
+                self.progress = 0.0
+                self.results[test] = tests[test]()
+        finally:
+            self.current_test = None
+            try:
+                os.unlink(self.data_path)
+            except FileNotFoundError:
+                pass
+
+    def _add_warnings(self) -> None:
+        direct_used = [result.get("direct") for result in self.results.values() if "direct" in result]
+        if self.direct and direct_used and not all(direct_used):
+            self.warnings.append("O_DIRECT non supportato dal filesystem: i test sono passati dalla cache")
+        if self.filesystem == "zfs":
+            self.warnings.append("Su ZFS le letture possono essere servite dall'ARC: confrontare solo "
+                                 "esecuzioni con gli stessi parametri")
+        if not all(direct_used or [True]) and self.size < psutil.virtual_memory().total:
+            self.warnings.append("Il file di prova è più piccolo della RAM: le letture possono venire dalla cache")
+
+    def _save(self) -> None:
+        db = SessionLocal()
+        try:
+            db.add(BenchmarkResult(
+                run_id=self.id,
+                target_type=self.target_type,
+                target=self.target,
+                path=self.directory,
+                label=self.label,
+                created_at=self.started_at,
+                params=json.dumps(self.params),
+                results=json.dumps({"tests": self.results, "warnings": self.warnings})
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    async def run(self) -> None:
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, self._execute)
+            self._add_warnings()
+            await loop.run_in_executor(None, self._save)
+            self.state = "completed"
+        except BenchmarkCancelled:
+            self.state = "cancelled"
+        except Exception as e:
+            logger.error(f"Errore nel benchmark di {self.directory}: {e}")
+            self.state = "failed"
+            self.error = str(e)
+        self.progress = 1.0 if self.state == "completed" else self.progress
+        self.finished_at = time.time()
+
+async def _resolve_directory(target_type: str, target: str) -> Tuple[Optional[str], Optional[str]]:
+    if target_type == "dataset":
+        result = await get_zfs_bulk_properties([target], ["mountpoint", "mounted"])
+        if not result["success"] or target in result["errors"]:
+            return None, result.get("error") or result["errors"].get(target)
+        properties = result["properties"][target]
+        mountpoint = (properties.get("mountpoint") or {}).get("value")
+        if not mountpoint or not str(mountpoint).startswith("/") or \
+                (properties.get("mounted") or {}).get("value") != "yes":
+            return None, f"Il dataset '{target}' non è montato"
+        return str(mountpoint), None
+
+    if target.startswith("/dev/") and not os.path.isdir(target):
+        device = (await get_block_devices()).get(target)
+        if device is None:
+            return None, f"Dispositivo {target} non trovato"
+        mountpoints = [mp for mp in device["mountpoints"] if mp.startswith("/")]
+        if not mountpoints:
+            return None, f"Il dispositivo {target} non è montato"
+        return mountpoints[0], None
+
+    if not os.path.isdir(target):
+        return None, f"Il percorso {target} non esiste"
+    return target, None
+
+async def start_benchmark(target_type: str, target: str, tests: Optional[List[str]] = None,
+                          size: int = BENCH_DEFAULT_SIZE, duration: float = BENCH_DEFAULT_DURATION,
+                          threads: int = 1, direct: bool = True, label: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Avvia in background un benchmark su un file temporaneo
+
+    Args:
+        target_type: "dataset" (nome del dataset) oppure "mount" (punto di montaggio o dispositivo montato)
+        target: Dataset, punto di montaggio o dispositivo
+        tests: Test da eseguire (default tutti, vedi BENCH_TESTS)
+        size: Dimensione del file di prova in byte
+        duration: Durata in secondi dei test casuali e di fsync
+        threads: Thread dei test casuali (operazioni in coda)
+        direct: Usa O_DIRECT dove supportato
+        label: Etichetta libera per riconoscere l'esecuzione nei confronti
+
+    Returns:
+        Dizionario con success e lo stato del benchmark
+    """
+    if any(run.state == "running" for run in _runs.values()):
+        return {
+            "success": False,
+            "error": "Un benchmark è già in corso: i risultati sarebbero falsati"
+        }
+
+    tests = tests or BENCH_TESTS
+    unknown = [test for test in tests if test not in BENCH_TESTS]
+    if unknown:
+        return {
+            "success": False,
+            "error": f"Test sconosciuti: {', '.join(unknown)} (disponibili: {', '.join(BENCH_TESTS)})"
+        }
+    tests = [test for test in BENCH_TESTS if test in tests]
+
+    directory, error = await _resolve_directory(target_type, target)
+    if directory is None:
+        return {
+            "success": False,
+            "error": error
+        }
+    if not os.access(directory, os.W_OK):
+        return {
+            "success": False,
+            "error": f"Il percorso {directory} non è scrivibile"
+        }
+
+    size = max(BENCH_MIN_SIZE, min(int(size), BENCH_MAX_SIZE)) // BENCH_SEQ_BLOCK * BENCH_SEQ_BLOCK
+    free = shutil.disk_usage(directory).free
+    if free < size + BENCH_FREE_SPACE_MARGIN:
+        return {
+            "success": False,
+            "error": f"Spazio libero insufficiente in {directory} per un file di prova di {size // 1024 ** 2} MiB"
+        }
+
+    run = BenchmarkRun(target_type, target, directory, tests, size,
+                       max(1, min(duration, BENCH_MAX_DURATION)), max(1, min(threads, BENCH_MAX_THREADS)),
+                       direct, label, _filesystem_of(directory))
+
+    # Si conservano in memoria solo le esecuzioni più recenti
+    for run_id in sorted(_runs, key=lambda key: _runs[key].started_at)[:max(0, len(_runs) - BENCH_RECENT_RUNS + 1)]:
+        del _runs[run_id]
+    _runs[run.id] = run
+    run.task = start_task(run.run())
+
+    return {
+        "success": True,
+        "message": f"Benchmark di {directory} avviato",
+        "benchmark": run.to_dict()
+    }
+
+def _row_to_dict(row: BenchmarkResult) -> Dict[str, Any]:
+    results = json.loads(row.results or "{}")
+    return {
+        "run_id": row.run_id,
+        "target_type": row.target_type,
+        "target": row.target,
+        "path": row.path,
+        "label": row.label,
+        "params": json.loads(row.params or "{}"),
+        "state": "completed",
+        "started_at": row.created_at,
+        "results": results.get("tests", {}),
+        "warnings": results.get("warnings", [])
+    }
+
+def _load_result(run_id: str) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        row = db.query(BenchmarkResult).filter(BenchmarkResult.run_id == run_id).first()
+        return _row_to_dict(row) if row is not None else None
+    finally:
+        db.close()
+
+def get_benchmark(run_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Restituisce stato e risultati di un benchmark (in corso o salvato), None se non esiste
+    """
+    run = _runs.get(run_id)
+    if run is not None:
+        return run.to_dict()
+    return _load_result(run_id)
+
+def cancel_benchmark(run_id: str) -> Dict[str, Any]:
+    """
+    Annulla un benchmark in corso (il file di prova viene rimosso)
+    """
+    run = _runs.get(run_id)
+    if run is None or run.state != "running":
+        return {
+            "success": False,
+            "error": f"Nessun benchmark in corso con id '{run_id}'"
+        }
+    run.cancel()
+    return {
+        "success": True,
+        "message": "Annullamento del benchmark richiesto"
+    }
+
+def list_benchmark_results(target: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+    """
+    Elenca i benchmark salvati, dal più recente
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(BenchmarkResult)
+        if target:
+            query = query.filter(BenchmarkResult.target == target)
+        rows = query.order_by(BenchmarkResult.created_at.desc()).limit(limit).all()
+        return {
+            "success": True,
+            "results": [_row_to_dict(row) for row in rows]
+        }
+    finally:
+        db.close()
+
+def delete_benchmark_result(run_id: str) -> Dict[str, Any]:
+    """
+    Elimina un benchmark salvato
+    """
+    db = SessionLocal()
+    try:
+        deleted = db.query(BenchmarkResult).filter(BenchmarkResult.run_id == run_id).delete()
+        db.commit()
+    finally:
+        db.close()
+    if not deleted:
+        return {
+            "success": False,
+            "error": f"Benchmark '{run_id}' non trovato"
+        }
+    return {
+        "success": True,
+        "message": f"Benchmark '{run_id}' eliminato"
+    }
+
+def _metric(result: Dict[str, Any], name: str) -> Optional[float]:
+    value: Any = result
+    for part in name.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value if isinstance(value, (int, float)) else None
+
+def compare_benchmark_results(base_id: str, other_id: str) -> Dict[str, Any]:
+    """
+    Confronta due benchmark salvati: per ogni test comune la variazione percentuale
+    delle metriche principali (per le latenze un valore negativo è un miglioramento)
+    """
+    base = _load_result(base_id)
+    other = _load_result(other_id)
+    if base is None or other is None:
+        return {
+            "success": False,
+            "error": f"Benchmark '{base_id if base is None else other_id}' non trovato"
+        }
+
+    comparison: Dict[str, Dict[str, Any]] = {}
+    for test, metrics in BENCH_COMPARE_METRICS.items():
+        if test not in base["results"] or test not in other["results"]:
+            continue
+        comparison[test] = {}
+        for metric in metrics:
+            before = _metric(base["results"][test], metric)
+            after = _metric(other["results"][test], metric)
+            comparison[test][metric] = {
+                "base": before,
+                "other": after,
+                "change_percent": round((after - before) * 100 / before, 1)
+                if before and after is not None else None
+            }
+
+    comparable = {key: value for key, value in base["params"].items() if key != "tests"} == \
+                 {key: value for key, value in other["params"].items() if key != "tests"}
+    return {
+        "success": True,
+        "base": base,
+        "other": other,
+        "params_match": comparable,
+        "comparison": comparison
+    }
@@ -0,0 +1,189 @@
+"""
+Inventario dei dispositivi a blocchi condiviso tra le route dischi e ZFS
+
+Una sola esecuzione di `lsblk -J -b -O` (più una lettura di /dev/disk/by-id) costruisce
+l'elenco completo di dischi e partizioni, indicizzato per nome kernel, percorso,
+by-id, WWN e seriale. Il risultato resta in cache finché non scade o viene invalidato
+(operazioni sui dischi, collegamento/scollegamento di dispositivi).
+"""
+
+import json
+import os
+from typing import List, Dict, Optional, Any
+
+from .command_runner import run_command
+from .cache import TTLCache
+
+# Durata (secondi) della cache dell'inventario dei dispositivi a blocchi
+BLOCK_DEVICES_TTL = 30
+
+BY_ID_DIR = "/dev/disk/by-id"
+
+_block_cache = TTLCache(BLOCK_DEVICES_TTL)
+
+class BlockDeviceInventory:
+    """
+    Elenco piatto dei dispositivi a blocchi con indici per la ricerca in O(1)
+    """
+
+    def __init__(self, devices: List[Dict[str, Any]]):
+        self.devices = devices
+        self._index: Dict[str, Dict[str, Any]] = {}
+
+        for device in devices:
+            keys = [device["name"], device["path"]]
+            keys.extend(device["by_id"])
+            keys.extend(f"{BY_ID_DIR}/{by_id}" for by_id in device["by_id"])
+            # WWN e seriale identificano il disco, non le sue partizioni
+            if device["type"] == "disk":
+                if device["wwn"]:
+                    keys.append(device["wwn"])
+                if device["serial"]:
+                    keys.append(device["serial"])
+            for key in keys:
+                if key:
+                    self._index.setdefault(key, device)
+
+    def __eq__(self, other):
+        return isinstance(other, BlockDeviceInventory) and self.devices == other.devices
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Cerca un dispositivo per nome (sda), percorso (/dev/sda), by-id, WWN o seriale
+        """
+        return self._index.get(key)
+
+    def disks(self) -> List[Dict[str, Any]]:
+        """
+        Restituisce solo i dischi interi (tipo "disk")
+        """
+        return [device for device in self.devices if device["type"] == "disk"]
+
+    def children(self, name: str) -> List[Dict[str, Any]]:
+        """
+        Restituisce le partizioni (e gli altri figli) di un dispositivo
+        """
+        return [device for device in self.devices if device["parent"] == name]
+
+def invalidate_block_devices() -> None:
+    """
+    Invalida l'inventario (da chiamare dopo format/mount/umount o eventi hotplug)
+    """
+    _block_cache.invalidate()
+
+def set_block_devices_ttl(ttl: float) -> None:
+    """
+    Modifica la durata della cache dell'inventario (più lunga con il monitor hotplug attivo)
+    """
+    _block_cache.ttl = ttl
+
+def get_block_devices_generation() -> int:
+    """
+    Restituisce il contatore di generazione dell'inventario dei dispositivi
+    """
+    return _block_cache.generation
+
+async def get_block_devices() -> BlockDeviceInventory:
+    """
+    Restituisce l'inventario dei dispositivi a blocchi (dalla cache se ancora valida)
+    """
+    inventory = await _block_cache.get_or_load("inventory", _load_block_devices)
+    return inventory if inventory is not None else BlockDeviceInventory([])
+
+async def _load_block_devices() -> Optional[BlockDeviceInventory]:
+    # -J: JSON, -b: dimensioni in byte, -O: tutte le colonne (modello, seriale, WWN, mountpoint, ...)
+    cmd_result = await run_command(["lsblk", "-J", "-b", "-O"])
+
+    if not cmd_result["success"]:
+        print(f"Errore in lsblk: {cmd_result['error']}")
+        return None
+
+    try:
+        data = json.loads(cmd_result["output"])
+    except json.JSONDecodeError as e:
+        print(f"Errore nel parsing dell'output di lsblk: {str(e)}")
+        return None
+
+    return BlockDeviceInventory(parse_lsblk_devices(data.get("blockdevices", []), read_by_id_links()))
+
+def read_by_id_links() -> Dict[str, List[str]]:
+    """
+    Legge /dev/disk/by-id e restituisce {nome kernel -> [nomi by-id]}
+    """
+    links: Dict[str, List[str]] = {}
+    try:
+        entries = sorted(os.listdir(BY_ID_DIR))
+    except OSError:
+        return links
+
+    for entry in entries:
+        target = os.path.basename(os.path.realpath(os.path.join(BY_ID_DIR, entry)))
+        links.setdefault(target, []).append(entry)
+
+    return links
+
+def _to_int(value: Any) -> Optional[int]:
+    # Le versioni meno recenti di lsblk restituiscono i numeri come stringhe
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value in ("1", "true")
+    return bool(value)
+
+def _clean(value: Any) -> str:
+    return value.strip() if isinstance(value, str) else ""
+
+def parse_lsblk_devices(blockdevices: List[Dict[str, Any]], by_id_links: Dict[str, List[str]],
+                        parent: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Appiattisce l'albero JSON di lsblk in un elenco di dispositivi normalizzati
+    """
+    devices = []
+
+    for raw in blockdevices:
+        name = raw.get("name") or raw.get("kname")
+        if not name:
+            continue
+
+        # MOUNTPOINTS (util-linux >= 2.37) elenca tutti i punti di montaggio, anche i bind mount
+        mountpoints = raw.get("mountpoints")
+        if mountpoints is None:
+            mountpoints = [raw.get("mountpoint")]
+        mountpoints = [mp for mp in mountpoints if mp]
+
+        kname = raw.get("kname") or name
+        devices.append({
+            "name": name,
+            "kname": kname,
+            "path": raw.get("path") or f"/dev/{name}",
+            "type": raw.get("type") or "",
+            "size": _to_int(raw.get("size")) or 0,
+            "model": _clean(raw.get("model")),
+            "vendor": _clean(raw.get("vendor")),
+            "serial": _clean(raw.get("serial")),
+            "wwn": _clean(raw.get("wwn")),
+            "tran": raw.get("tran"),
+            "rotational": _to_bool(raw.get("rota")),
+            "removable": _to_bool(raw.get("rm")),
+            "hotplug": _to_bool(raw.get("hotplug")),
+            "fstype": raw.get("fstype") or "",
+            "label": raw.get("label") or "",
+            "uuid": raw.get("uuid") or "",
+            "partuuid": raw.get("partuuid") or "",
+            "mountpoints": mountpoints,
+            "fssize": _to_int(raw.get("fssize")),
+            "fsused": _to_int(raw.get("fsused")),
+            "fsavail": _to_int(raw.get("fsavail")),
+            "parent": raw.get("pkname") or parent,
+            "by_id": by_id_links.get(kname, [])
+        })
+
+        devices.extend(parse_lsblk_devices(raw.get("children", []), by_id_links, name))
+
+    return devices
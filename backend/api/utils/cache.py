@@ -0,0 +1,98 @@
+"""
+Cache in memoria con scadenza (TTL) e invalidazione esplicita
+
+Usata per evitare di rilanciare comandi costosi (zpool list, zfs list, lsblk, ...)
+ad ogni richiesta: più schede del browser che fanno polling condividono lo stesso risultato.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Valore sentinella per distinguere "non in cache" da un valore None
+MISSING = object()
+
+class TTLCache:
+    """
+    Cache chiave/valore con TTL, invalidazione esplicita e contatore di generazione.
+
+    La generazione aumenta ad ogni invalidazione e ogni volta che un valore ricaricato
+    è diverso dal precedente: i client possono confrontarla per sapere se i dati sono cambiati.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation = 0
+        # Numero di invalidazioni: un caricamento iniziato prima di un'invalidazione non va in cache
+        self._epoch = 0
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Restituisce il valore se presente e non scaduto, altrimenti MISSING
+        """
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            return MISSING
+        return entry[1]
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Restituisce l'ultimo valore noto ignorando la scadenza (non avvia mai un caricamento)
+        """
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        previous = self._entries.get(key)
+        if previous is None or previous[1] != value:
+            self.generation += 1
+        self._entries[key] = (time.monotonic(), value)
+        if len(self._entries) > self.max_entries:
+            self._purge_expired()
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if now - entry[0] > self.ttl]:
+            del self._entries[key]
+            self._locks.pop(key, None)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """
+        Invalida una chiave (o tutta la cache se key è None)
+        """
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+        self._epoch += 1
+        self.generation += 1
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Restituisce il valore in cache o lo carica con loader().
+        Le richieste concorrenti sulla stessa chiave attendono un unico caricamento.
+        Se loader() restituisce None il risultato non viene messo in cache.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+
+        async with lock:
+            # Un'altra richiesta potrebbe aver caricato il valore nel frattempo
+            value = self.get(key)
+            if value is not MISSING:
+                return value
+
+            epoch = self._epoch
+            value = await loader()
+            if value is not None and epoch == self._epoch:
+                self.set(key, value)
+            return value
@@ -0,0 +1,300 @@
+"""
+Esecutore asincrono condiviso per i comandi di sistema (zpool, zfs, docker, systemctl, ...)
+
+Tutte le route sono `async def`: usare subprocess.run bloccherebbe l'event loop di uvicorn
+per tutta la durata del comando (un `docker stop` di virtual-dsm può durare minuti).
+Questo modulo usa asyncio.create_subprocess_exec e offre:
+- timeout per singola chiamata (con kill del processo alla scadenza)
+- un semaforo di concorrenza per ogni famiglia di comandi
+- annullamento dei comandi di sola lettura quando il client HTTP si disconnette
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+from typing import Any, Awaitable, Dict, List, Optional
+
+from fastapi import Request
+
+logger = logging.getLogger(__name__)
+
+# Timeout di default (secondi) per famiglia di comandi
+DEFAULT_TIMEOUTS = {
+    "zpool": 120,
+    "zfs": 120,
+    "docker": 300,
+    "systemctl": 120,
+    "default": 60
+}
+
+# Valore di timeout per i comandi che non devono mai essere interrotti (es. rsync dei dati Docker)
+NO_TIMEOUT = 0
+
+# Numero massimo di comandi concorrenti per famiglia
+FAMILY_CONCURRENCY = {
+    "zpool": 4,
+    "zfs": 4,
+    "docker": 4,
+    "systemctl": 4,
+    "default": 8
+}
+
+# Sottocomandi di sola lettura: solo questi vengono annullati se il client si disconnette.
+# I comandi che modificano lo stato (zpool create, docker stop, ...) arrivano sempre a termine.
+READ_ONLY_SUBCOMMANDS = {
+    "zpool": {"list", "status", "get", "iostat", "events"},
+    "zfs": {"list", "get", "diff"},
+    "docker": {"inspect", "logs", "top", "ps", "version", "--version", "info"},
+    "systemctl": {"is-active", "is-enabled", "show", "status"},
+}
+READ_ONLY_COMMANDS = {"lsblk", "blkid", "findmnt", "smartctl"}
+
+# Intervallo (secondi) con cui si controlla la disconnessione del client
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Richiesta HTTP corrente, impostata dalla dependency bind_client_request
+_current_request: contextvars.ContextVar[Optional[Request]] = contextvars.ContextVar(
+    "armnas_current_request", default=None
+)
+
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_background_tasks = set()
+
+def get_command_family(command: List[str]) -> str:
+    """
+    Restituisce la famiglia di un comando (zpool, zfs, docker, systemctl o default)
+    """
+    name = os.path.basename(command[0]) if command else ""
+    if name == "docker-compose":
+        name = "docker"
+    return name if name in FAMILY_CONCURRENCY else "default"
+
+def is_read_only_command(command: List[str]) -> bool:
+    """
+    Verifica se un comando è di sola lettura (e quindi annullabile senza effetti collaterali)
+    """
+    if not command:
+        return False
+    name = os.path.basename(command[0])
+    if name in READ_ONLY_COMMANDS:
+        return True
+    subcommands = READ_ONLY_SUBCOMMANDS.get(name)
+    return bool(subcommands) and len(command) > 1 and command[1] in subcommands
+
+def _get_semaphore(family: str) -> asyncio.Semaphore:
+    # Creato in modo lazy per legarlo all'event loop in esecuzione
+    semaphore = _semaphores.get(family)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(FAMILY_CONCURRENCY[family])
+        _semaphores[family] = semaphore
+    return semaphore
+
+async def bind_client_request(request: Request) -> None:
+    """
+    Dependency FastAPI: associa la richiesta corrente ai comandi lanciati dall'handler,
+    così i comandi di sola lettura vengono annullati se il client si disconnette
+    """
+    _current_request.set(request)
+
+async def _wait_for_disconnect(request: Request) -> None:
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+async def _kill_process(process: asyncio.subprocess.Process) -> None:
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+async def run_command(command: List[str], cwd: Optional[str] = None, timeout: Optional[float] = None,
+                      check: bool = True, input_data: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Esegue un comando in modo asincrono e restituisce l'output come dizionario
+
+    Args:
+        command: Comando e argomenti
+        cwd: Directory di lavoro (opzionale)
+        timeout: Timeout in secondi (default in base alla famiglia del comando, NO_TIMEOUT per nessun limite)
+        check: Se False, l'output viene restituito anche quando il comando fallisce
+        input_data: Testo da inviare sullo stdin del comando (opzionale)
+
+    Returns:
+        Dizionario con success, output, error e returncode
+    """
+    family = get_command_family(command)
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUTS[family]
+
+    request = _current_request.get() if is_read_only_command(command) else None
+
+    async with _get_semaphore(family):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE if input_data is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd
+            )
+        except OSError as e:
+            return {
+                "success": False,
+                "output": None,
+                "error": str(e),
+                "returncode": None
+            }
+
+        communicate = asyncio.ensure_future(
+            process.communicate(input_data.encode() if input_data is not None else None)
+        )
+        waiters = {communicate}
+        disconnect = None
+        if request is not None:
+            disconnect = asyncio.ensure_future(_wait_for_disconnect(request))
+            waiters.add(disconnect)
+
+        try:
+            done, _ = await asyncio.wait(waiters, timeout=timeout or None, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            communicate.cancel()
+            await _kill_process(process)
+            raise
+        finally:
+            if disconnect is not None:
+                disconnect.cancel()
+
+        if communicate not in done:
+            communicate.cancel()
+            await _kill_process(process)
+            if disconnect is not None and disconnect in done:
+                logger.info(f"Client disconnesso, comando annullato: {' '.join(command)}")
+                error = "Comando annullato: client disconnesso"
+            else:
+                logger.warning(f"Timeout ({timeout}s) del comando: {' '.join(command)}")
+                error = f"Timeout del comando dopo {timeout} secondi"
+            return {
+                "success": False,
+                "output": None,
+                "error": error,
+                "returncode": None
+            }
+
+        stdout, stderr = communicate.result()
+
+    stdout_text = stdout.decode(errors="replace").strip()
+    stderr_text = stderr.decode(errors="replace").strip()
+
+    if process.returncode == 0:
+        return {
+            "success": True,
+            "output": stdout_text,
+            "error": None,
+            "returncode": 0
+        }
+
+    return {
+        "success": False,
+        "output": stdout_text if not check else None,
+        "error": stderr_text or f"Comando terminato con codice {process.returncode}",
+        "returncode": process.returncode
+    }
+
+async def spawn_process(command: List[str], cwd: Optional[str] = None,
+                        stdin: Any = asyncio.subprocess.DEVNULL,
+                        stdout: Any = asyncio.subprocess.PIPE,
+                        stderr: Any = asyncio.subprocess.PIPE) -> asyncio.subprocess.Process:
+    """
+    Avvia un processo di lunga durata (zpool iostat, zpool events -f, zfs send, ...)
+    di cui il chiamante legge l'output in streaming. Solleva OSError se il comando non esiste.
+    Il chiamante è responsabile di attendere o terminare il processo (vedi terminate_process).
+    """
+    return await asyncio.create_subprocess_exec(
+        *command,
+        stdin=stdin,
+        stdout=stdout,
+        stderr=stderr,
+        cwd=cwd
+    )
+
+async def terminate_process(process: asyncio.subprocess.Process, grace: float = 5) -> None:
+    """
+    Termina un processo con SIGTERM e, se non esce entro grace secondi, con SIGKILL
+    """
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+    except ProcessLookupError:
+        return
+    try:
+        await asyncio.wait_for(process.wait(), timeout=grace)
+    except asyncio.TimeoutError:
+        await _kill_process(process)
+
+async def start_background(command: List[str], cwd: Optional[str] = None,
+                           timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Avvia un comando in background senza attenderne il completamento.
+    Il processo viene comunque atteso da un task (niente processi zombie) e l'esito finisce nel log.
+
+    Returns:
+        Dizionario con success e pid del processo (o error)
+    """
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUTS[get_command_family(command)]
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd
+        )
+    except OSError as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+    async def _waiter():
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout or None)
+        except asyncio.TimeoutError:
+            await _kill_process(process)
+            logger.warning(f"Timeout ({timeout}s) del comando in background: {' '.join(command)}")
+            return
+        if process.returncode == 0:
+            logger.info(f"Comando in background completato: {' '.join(command)}")
+        else:
+            logger.error(f"Comando in background fallito: {' '.join(command)}: "
+                         f"{stderr.decode(errors='replace').strip()}")
+
+    task = asyncio.ensure_future(_waiter())
+    # Mantiene un riferimento al task finché non termina
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    return {
+        "success": True,
+        "pid": process.pid
+    }
+
+def start_task(coro: Awaitable[Any]) -> "asyncio.Future":
+    """
+    Avvia una coroutine in background (job di replica, scansioni, ...) slegata dalla richiesta HTTP
+    che l'ha avviata: i suoi comandi di sola lettura non vengono annullati quando il client
+    si disconnette o la risposta è già stata inviata.
+    """
+    async def _detached():
+        _current_request.set(None)
+        return await coro
+
+    task = asyncio.ensure_future(_detached())
+    # Mantiene un riferimento al task finché non termina
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
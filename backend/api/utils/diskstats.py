@@ -0,0 +1,236 @@
+"""
+Statistiche di I/O dei dispositivi a blocchi da /proc/diskstats
+
+Una sola lettura di /proc/diskstats riporta i contatori di tutti i dispositivi: un
+campionatore in background la ripete a intervallo fisso e calcola per ogni disco IOPS,
+banda, latenza media delle operazioni (await), profondità media della coda e utilizzo.
+Sono i numeri che distinguono un ponte USB saturo da un disco lento o dalla rete.
+La storia di ogni dispositivo è conservata in un RingBuffer.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional, Any
+
+from .ringbuffer import RingBuffer
+from .streaming import Broadcaster
+
+logger = logging.getLogger(__name__)
+
+DISKSTATS_PATH = "/proc/diskstats"
+
+# Intervallo di campionamento (secondi) e campioni conservati per dispositivo (30 minuti)
+DISKSTATS_INTERVAL = 2
+DISKSTATS_HISTORY = 900
+
+# /proc/diskstats conta sempre in settori da 512 byte, qualunque sia il settore fisico
+DISKSTATS_SECTOR_SIZE = 512
+
+# Dispositivi virtuali senza interesse
+DISKSTATS_SKIP_PREFIXES = ("loop", "ram")
+
+# Campi di /proc/diskstats dopo major, minor e nome (vedi Documentation/admin-guide/iostats.rst)
+DISKSTATS_COUNTERS = [
+    "reads", "reads_merged", "sectors_read", "read_ms",
+    "writes", "writes_merged", "sectors_written", "write_ms",
+    "in_flight", "io_ms", "weighted_io_ms",
+    "discards", "discards_merged", "sectors_discarded", "discard_ms",
+    "flushes", "flush_ms"
+]
+
+DISKSTATS_FIELDS = [
+    "timestamp",
+    "read_iops", "write_iops", "read_bytes_per_sec", "write_bytes_per_sec",
+    "read_await_ms", "write_await_ms", "queue_depth", "in_flight", "util_percent"
+]
+
+def parse_diskstats(content: str) -> Dict[str, Dict[str, int]]:
+    """
+    Analizza /proc/diskstats e restituisce {nome dispositivo -> contatori}
+    """
+    stats: Dict[str, Dict[str, int]] = {}
+    for line in content.splitlines():
+        parts = line.split()
+        if len(parts) < 14:
+            continue
+        try:
+            values = [int(value) for value in parts[3:3 + len(DISKSTATS_COUNTERS)]]
+        except ValueError:
+            continue
+        stats[parts[2]] = dict(zip(DISKSTATS_COUNTERS, values))
+    return stats
+
+def read_diskstats(path: str = DISKSTATS_PATH) -> Optional[Dict[str, Dict[str, int]]]:
+    """
+    Legge /proc/diskstats (None se non disponibile)
+    """
+    try:
+        with open(path) as f:
+            return parse_diskstats(f.read())
+    except OSError:
+        return None
+
+def compute_disk_rates(current: Dict[str, int], previous: Dict[str, int], elapsed: float) -> Optional[Dict[str, Any]]:
+    """
+    Calcola frequenze e latenze sull'intervallo tra due letture dei contatori.
+    None se i contatori sono tornati indietro (overflow a 32 bit o dispositivo ricreato).
+    """
+    delta = {}
+    for key in ("reads", "sectors_read", "read_ms", "writes", "sectors_written", "write_ms",
+                "io_ms", "weighted_io_ms"):
+        value = current.get(key, 0) - previous.get(key, 0)
+        if value < 0:
+            return None
+        delta[key] = value
+
+    elapsed_ms = elapsed * 1000
+    return {
+        "read_iops": round(delta["reads"] / elapsed, 2),
+        "write_iops": round(delta["writes"] / elapsed, 2),
+        "read_bytes_per_sec": round(delta["sectors_read"] * DISKSTATS_SECTOR_SIZE / elapsed),
+        "write_bytes_per_sec": round(delta["sectors_written"] * DISKSTATS_SECTOR_SIZE / elapsed),
+        # Tempo medio per operazione, attesa in coda compresa (come r_await/w_await di iostat)
+        "read_await_ms": round(delta["read_ms"] / delta["reads"], 2) if delta["reads"] else None,
+        "write_await_ms": round(delta["write_ms"] / delta["writes"], 2) if delta["writes"] else None,
+        "queue_depth": round(delta["weighted_io_ms"] / elapsed_ms, 2),
+        "in_flight": current.get("in_flight", 0),
+        "util_percent": round(min(delta["io_ms"] * 100 / elapsed_ms, 100), 2)
+    }
+
+class DiskStatsCollector:
+    """
+    Campionatore periodico di /proc/diskstats con storia per dispositivo
+    """
+
+    def __init__(self, path: str = DISKSTATS_PATH, interval: float = DISKSTATS_INTERVAL,
+                 history: int = DISKSTATS_HISTORY):
+        self.path = path
+        self.interval = interval
+        self.history_size = history
+        self.history: Dict[str, RingBuffer] = {}
+        self.broadcaster = Broadcaster()
+        self._previous: Optional[Dict[str, Dict[str, int]]] = None
+        self._previous_time: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                sample = self.sample()
+                if sample is not None:
+                    self.broadcaster.publish(sample)
+            except Exception as e:
+                logger.error(f"Errore nel campionamento di /proc/diskstats: {e}")
+            await asyncio.sleep(self.interval)
+
+    def sample(self) -> Optional[Dict[str, Any]]:
+        """
+        Legge /proc/diskstats e aggiunge un campione alla storia di ogni dispositivo
+        """
+        stats = read_diskstats(self.path)
+        if stats is None:
+            return None
+        stats = {name: counters for name, counters in stats.items()
+                 if not name.startswith(DISKSTATS_SKIP_PREFIXES)}
+
+        now = time.monotonic()
+        previous, previous_time = self._previous, self._previous_time
+        self._previous, self._previous_time = stats, now
+        if previous is None or now <= previous_time:
+            # Il primo campione serve solo come riferimento per l'intervallo successivo
+            return None
+
+        timestamp = time.time()
+        devices = {}
+        for name, counters in stats.items():
+            if name not in previous:
+                continue
+            rates = compute_disk_rates(counters, previous[name], now - previous_time)
+            if rates is None:
+                continue
+            rates["timestamp"] = timestamp
+
+            history = self.history.get(name)
+            if history is None:
+                history = self.history[name] = RingBuffer(DISKSTATS_FIELDS, self.history_size)
+            history.append(rates)
+            devices[name] = rates
+
+        # I dispositivi scollegati escono dalla storia
+        for name in list(self.history):
+            if name not in stats:
+                del self.history[name]
+
+        return {
+            "event": "diskstats",
+            "timestamp": timestamp,
+            "interval": self.interval,
+            "devices": devices
+        }
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        """
+        Contatori cumulativi dell'ultima lettura di /proc/diskstats (per l'esportazione Prometheus)
+        """
+        return self._previous or {}
+
+    def metrics(self, window: float = 10) -> Dict[str, Optional[float]]:
+        """
+        Medie degli ultimi `window` secondi dei dischi interi (non delle partizioni)
+        per l'archivio delle metriche
+        """
+        limit = max(1, round(window / self.interval))
+        values: Dict[str, Optional[float]] = {}
+        for name, history in self.history.items():
+            if not os.path.exists(f"/sys/block/{name}") or name.startswith("zram"):
+                continue
+            for field in ("read_bytes_per_sec", "write_bytes_per_sec", "read_await_ms",
+                          "write_await_ms", "util_percent"):
+                values[f"{name}.{field}"] = history.mean(field, limit)
+        return values
+
+    def get_history(self, device: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Restituisce gli ultimi campioni di tutti i dispositivi (o di uno solo)
+        """
+        if device is not None:
+            # Accetta anche il percorso completo (/dev/sda)
+            device = os.path.basename(device)
+        names = [device] if device is not None else sorted(self.history)
+
+        devices: Dict[str, Any] = {}
+        for name in names:
+            history = self.history.get(name)
+            if history is None:
+                continue
+            devices[name] = {
+                # Le partizioni hanno una voce in /sys/class/block ma non in /sys/block
+                "partition": not os.path.exists(f"/sys/block/{name}"),
+                "latest": history.latest(),
+                "samples": history.to_list(limit)
+            }
+
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "devices": devices
+        }
+
+# Istanza condivisa, avviata all'avvio dell'applicazione
+diskstats_collector = DiskStatsCollector()
@@ -1,32 +1,9 @@
-import subprocess
 import json
 import os
+import re
 from typing import List, Dict, Optional, Any
 from .overlayfs import ensure_rw_mode, is_filesystem_writable
-
-def run_command(command: List[str], cwd: Optional[str] = None) -> Dict[str, Any]:
-    """
-    Esegue un comando e restituisce l'output come dizionario
-    """
-    try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True,
-            cwd=cwd
-        )
-        return {
-            "success": True,
-            "output": result.stdout.strip(),
-            "error": None
-        }
-    except subprocess.CalledProcessError as e:
-        return {
-            "success": False,
-            "output": None,
-            "error": e.stderr.strip() if e.stderr else str(e)
-        }
+from .command_runner import run_command, start_background, NO_TIMEOUT
 
 def is_docker_installed() -> bool:
     """
@@ -35,14 +12,14 @@ def is_docker_installed() -> bool:
     # Ottimizzazione: controlla direttamente il file invece di subprocess
     return os.path.exists("/usr/bin/docker") or os.path.exists("/usr/local/bin/docker")
 
-def get_qemu_vm_mac_address(container_name: str) -> Optional[str]:
+async def get_qemu_vm_mac_address(container_name: str) -> Optional[str]:
     """
     Recupera il MAC address della VM QEMU che gira dentro il container Docker
     OTTIMIZZATO: usa docker top invece di exec+ps (più veloce)
     """
     try:
         # Ottimizzazione: usa docker top invece di docker exec (più veloce)
-        result = run_command(["docker", "top", container_name, "-eo", "cmd"])
+        result = await run_command(["docker", "top", container_name, "-eo", "cmd"])
         
         if not result["success"]:
             return None
@@ -62,7 +39,7 @@ def get_qemu_vm_mac_address(container_name: str) -> Optional[str]:
                 return match.group(1)
         
         # Fallback: cerca nei log SOLO le prime 50 righe (più veloce)
-        log_result = run_command(["docker", "logs", "--tail", "50", container_name])
+        log_result = await run_command(["docker", "logs", "--tail", "50", container_name])
         if log_result["success"]:
             for pattern in mac_patterns:
                 match = re.search(pattern, log_result["output"])
@@ -76,11 +53,11 @@ def get_qemu_vm_mac_address(container_name: str) -> Optional[str]:
         return None
 
 
-def get_container_status(container_name: str) -> Dict[str, Any]:
+async def get_container_status(container_name: str) -> Dict[str, Any]:
     """
     Ottiene lo stato di un container Docker
     """
-    cmd_result = run_command(["docker", "inspect", "--format", "{{json .}}", container_name])
+    cmd_result = await run_command(["docker", "inspect", "--format", "{{json .}}", container_name])
     
     if not cmd_result["success"]:
         return {
@@ -99,7 +76,7 @@ def get_container_status(container_name: str) -> Dict[str, Any]:
         
         if is_running:
             # Se il container è in esecuzione, prova a recuperare il MAC della VM QEMU
-            mac_address = get_qemu_vm_mac_address(container_name)
+            mac_address = await get_qemu_vm_mac_address(container_name)
         
         return {
             "success": True,
@@ -119,7 +96,7 @@ def get_container_status(container_name: str) -> Dict[str, Any]:
             "error": "Errore nel parsing delle informazioni del container"
         }
 
-def start_container(container_name: str, working_dir: str = "/opt/armnas") -> Dict[str, Any]:
+async def start_container(container_name: str, working_dir: str = "/opt/armnas") -> Dict[str, Any]:
     """
     Avvia un container Docker usando docker compose up -d.
     Docker Compose gestisce automaticamente la creazione e l'avvio del container.
@@ -133,35 +110,30 @@ def start_container(container_name: str, working_dir: str = "/opt/armnas") -> Di
     if not check_compose_available():
         compose_cmd = ["docker-compose", "up", "-d"]
     
-    try:
-        # Esegui in BACKGROUND usando Popen invece di run
-        # Questo permette al backend di rispondere immediatamente
-        process = subprocess.Popen(
-            compose_cmd,
-            cwd=working_dir,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        
+    # Esegui in BACKGROUND: il backend risponde immediatamente,
+    # il processo viene atteso da un task asincrono
+    result = await start_background(compose_cmd, cwd=working_dir)
+    
+    if result["success"]:
         # Non aspettiamo il completamento - ritorna subito
         # Il container si avvierà in background
         return {
             "success": True,
             "message": f"Container '{container_name}' avvio in corso (background)...",
-            "pid": process.pid
+            "pid": result["pid"]
         }
-    except Exception as e:
+    else:
         return {
             "success": False,
-            "error": f"Errore nell'avvio del container: {str(e)}"
+            "error": f"Errore nell'avvio del container: {result['error']}"
         }
 
-def stop_container(container_name: str) -> Dict[str, Any]:
+async def stop_container(container_name: str) -> Dict[str, Any]:
     """
     Ferma un container Docker
     """
-    result = run_command(["docker", "stop", container_name])
+    # virtual-dsm ha uno stop_grace_period di 2 minuti
+    result = await run_command(["docker", "stop", container_name], timeout=300)
     
     if result["success"]:
         return {
@@ -174,11 +146,11 @@ def stop_container(container_name: str) -> Dict[str, Any]:
             "error": result["error"]
         }
 
-def restart_container(container_name: str) -> Dict[str, Any]:
+async def restart_container(container_name: str) -> Dict[str, Any]:
     """
     Riavvia un container Docker
     """
-    result = run_command(["docker", "restart", container_name])
+    result = await run_command(["docker", "restart", container_name])
     
     if result["success"]:
         return {
@@ -191,11 +163,11 @@ def restart_container(container_name: str) -> Dict[str, Any]:
             "error": result["error"]
         }
 
-def get_container_logs(container_name: str, tail: int = 100) -> Dict[str, Any]:
+async def get_container_logs(container_name: str, tail: int = 100) -> Dict[str, Any]:
     """
     Ottiene i log di un container Docker
     """
-    result = run_command(["docker", "logs", "--tail", str(tail), container_name])
+    result = await run_command(["docker", "logs", "--tail", str(tail), container_name])
     
     if result["success"]:
         return {
@@ -220,18 +192,18 @@ def check_compose_available() -> bool:
     # Fallback: controlla docker-compose standalone
     return os.path.exists("/usr/bin/docker-compose") or os.path.exists("/usr/local/bin/docker-compose")
 
-def compose_up(working_dir: str = "/opt/armnas") -> Dict[str, Any]:
+async def compose_up(working_dir: str = "/opt/armnas") -> Dict[str, Any]:
     """
     Avvia i container con docker compose
     """
     if check_compose_available():
         # Prova prima con 'docker compose'
-        result = run_command(["docker", "compose", "up", "-d"], cwd=working_dir)
+        result = await run_command(["docker", "compose", "up", "-d"], cwd=working_dir)
         if not result["success"]:
             # Prova con 'docker-compose'
-            result = run_command(["docker-compose", "up", "-d"], cwd=working_dir)
+            result = await run_command(["docker-compose", "up", "-d"], cwd=working_dir)
     else:
-        result = run_command(["docker-compose", "up", "-d"], cwd=working_dir)
+        result = await run_command(["docker-compose", "up", "-d"], cwd=working_dir)
     
     if result["success"]:
         return {
@@ -244,18 +216,18 @@ def compose_up(working_dir: str = "/opt/armnas") -> Dict[str, Any]:
             "error": result["error"]
         }
 
-def compose_down(working_dir: str = "/opt/armnas") -> Dict[str, Any]:
+async def compose_down(working_dir: str = "/opt/armnas") -> Dict[str, Any]:
     """
     Ferma i container con docker compose
     """
     if check_compose_available():
         # Prova prima con 'docker compose'
-        result = run_command(["docker", "compose", "down"], cwd=working_dir)
+        result = await run_command(["docker", "compose", "down"], cwd=working_dir)
         if not result["success"]:
             # Prova con 'docker-compose'
-            result = run_command(["docker-compose", "down"], cwd=working_dir)
+            result = await run_command(["docker-compose", "down"], cwd=working_dir)
     else:
-        result = run_command(["docker-compose", "down"], cwd=working_dir)
+        result = await run_command(["docker-compose", "down"], cwd=working_dir)
     
     if result["success"]:
         return {
@@ -268,19 +240,19 @@ def compose_down(working_dir: str = "/opt/armnas") -> Dict[str, Any]:
             "error": result["error"]
         }
 
-def compose_ps() -> Dict[str, Any]:
+async def compose_ps() -> Dict[str, Any]:
     """
     Lista i container gestiti da docker compose
     """
     # Ottieni la lista dei container in formato JSON
     if check_compose_available():
         # Prova prima con 'docker compose'
-        result = run_command(["docker", "compose", "ps", "--format", "json"])
+        result = await run_command(["docker", "compose", "ps", "--format", "json"])
         if not result["success"]:
             # Prova con 'docker-compose'
-            result = run_command(["docker-compose", "ps", "--format", "json"])
+            result = await run_command(["docker-compose", "ps", "--format", "json"])
     else:
-        result = run_command(["docker-compose", "ps", "--format", "json"])
+        result = await run_command(["docker-compose", "ps", "--format", "json"])
     
     if not result["success"]:
         return {
@@ -305,6 +277,57 @@ def compose_ps() -> Dict[str, Any]:
             "error": "Errore nel parsing dei container"
         }
 
+# Ultimo risultato di docker stats (solo i container in esecuzione), None se mai letto o se
+# l'ultima lettura è fallita
+_container_stats: Optional[Dict[str, Dict[str, Any]]] = None
+
+def peek_container_stats() -> Optional[Dict[str, Dict[str, Any]]]:
+    """
+    Ultimo utilizzo noto dei container in esecuzione, senza eseguire docker
+    """
+    return _container_stats
+
+def _parse_percent(value: str) -> Optional[float]:
+    try:
+        return float(value.strip().rstrip("%"))
+    except ValueError:
+        return None
+
+async def get_container_metrics() -> Dict[str, Optional[float]]:
+    """
+    Utilizzo di CPU e memoria dei container in esecuzione per l'archivio delle metriche
+    ({"nome.cpu_percent" -> valore, ...}); vuoto se Docker non è installato o non risponde
+    """
+    global _container_stats
+    if not is_docker_installed():
+        _container_stats = None
+        return {}
+
+    result = await run_command(["docker", "stats", "--no-stream", "--format", "{{json .}}"])
+    if not result["success"]:
+        # Le statistiche precedenti non sono più affidabili (es. daemon fermo)
+        _container_stats = None
+        return {}
+
+    metrics: Dict[str, Optional[float]] = {}
+    containers: Dict[str, Dict[str, Any]] = {}
+    for line in result["output"].splitlines():
+        try:
+            stats = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        name = stats.get("Name")
+        if not name:
+            continue
+        containers[name] = {
+            "cpu_percent": _parse_percent(stats.get("CPUPerc", "")),
+            "memory_percent": _parse_percent(stats.get("MemPerc", ""))
+        }
+        metrics[f"{name}.cpu_percent"] = containers[name]["cpu_percent"]
+        metrics[f"{name}.memory_percent"] = containers[name]["memory_percent"]
+    _container_stats = containers
+    return metrics
+
 def is_kvm_available() -> bool:
     """
     Verifica se KVM è disponibile sul sistema (ottimizzato)
@@ -312,11 +335,11 @@ def is_kvm_available() -> bool:
     # Ottimizzazione: controlla direttamente il file invece di subprocess
     return os.path.exists("/dev/kvm")
 
-def get_docker_version() -> Dict[str, Any]:
+async def get_docker_version() -> Dict[str, Any]:
     """
     Ottiene la versione di Docker installata
     """
-    result = run_command(["docker", "--version"])
+    result = await run_command(["docker", "--version"])
     
     if result["success"]:
         return {
@@ -329,19 +352,19 @@ def get_docker_version() -> Dict[str, Any]:
             "error": result["error"]
         }
 
-def get_docker_compose_version() -> Dict[str, Any]:
+async def get_docker_compose_version() -> Dict[str, Any]:
     """
     Ottiene la versione di Docker Compose installata
     """
     if check_compose_available():
-        result = run_command(["docker", "compose", "version"])
+        result = await run_command(["docker", "compose", "version"])
         if result["success"]:
             return {
                 "success": True,
                 "version": result["output"]
             }
     
-    result = run_command(["docker-compose", "--version"])
+    result = await run_command(["docker-compose", "--version"])
     
     if result["success"]:
         return {
@@ -462,13 +485,13 @@ def configure_docker_data_root(data_root: str) -> Dict[str, Any]:
             "error": f"Errore nella configurazione: {str(e)}"
         }
 
-def migrate_docker_data(old_data_root: str, new_data_root: str) -> Dict[str, Any]:
+async def migrate_docker_data(old_data_root: str, new_data_root: str) -> Dict[str, Any]:
     """
     Migra i dati Docker da una directory all'altra
     """
     try:
         # Ferma Docker
-        run_command(["systemctl", "stop", "docker"])
+        await run_command(["systemctl", "stop", "docker"])
         
         # Se la nuova directory non esiste, creala
         if not os.path.exists(new_data_root):
@@ -476,17 +499,17 @@ def migrate_docker_data(old_data_root: str, new_data_root: str) -> Dict[str, Any
         
         # Se la vecchia directory esiste e ha contenuti, copiali
         if os.path.exists(old_data_root) and os.listdir(old_data_root):
-            result = run_command(["rsync", "-a", f"{old_data_root}/", f"{new_data_root}/"])
+            result = await run_command(["rsync", "-a", f"{old_data_root}/", f"{new_data_root}/"], timeout=NO_TIMEOUT)
             if not result["success"]:
                 # Riavvia Docker in caso di errore
-                run_command(["systemctl", "start", "docker"])
+                await run_command(["systemctl", "start", "docker"])
                 return {
                     "success": False,
                     "error": f"Errore durante la migrazione: {result['error']}"
                 }
         
         # Riavvia Docker
-        result = run_command(["systemctl", "start", "docker"])
+        result = await run_command(["systemctl", "start", "docker"])
         if not result["success"]:
             return {
                 "success": False,
@@ -499,7 +522,7 @@ def migrate_docker_data(old_data_root: str, new_data_root: str) -> Dict[str, Any
         }
     except Exception as e:
         # Riavvia Docker in caso di errore
-        run_command(["systemctl", "start", "docker"])
+        await run_command(["systemctl", "start", "docker"])
         return {
             "success": False,
             "error": f"Errore durante la migrazione: {str(e)}"
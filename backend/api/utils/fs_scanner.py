@@ -0,0 +1,151 @@
+"""
+Scansione parallela di alberi di directory
+
+Più thread leggono le directory con os.scandir (il tipo delle voci arriva da getdents,
+quindi serve uno stat solo per i file). La scansione si ferma sul confine del filesystem
+(i dataset figli sono filesystem separati), può essere annullata in qualsiasi momento,
+è limitata in velocità per non saturare i dischi del NAS e, nelle directory enormi,
+esamina solo un campione dei file.
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List, Optional, Tuple
+
+# Numero di thread di default per la scansione
+SCAN_WORKERS = 4
+
+# Oltre questo numero di file in una directory viene esaminato solo un campione
+SCAN_DIR_SAMPLE_LIMIT = 5000
+
+# (nome, dimensione in byte, spazio allocato in byte)
+FileInfo = Tuple[str, int, int]
+
+class ScanCancelled(Exception):
+    """
+    Sollevata quando una scansione viene annullata
+    """
+
+class ScanControl:
+    """
+    Annullamento, limite di voci e limite di velocità di una scansione (thread-safe)
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_rate: Optional[float] = None):
+        self.max_entries = max_entries
+        self.max_rate = max_rate
+        self.entries = 0
+        self.directories = 0
+        self.truncated = False
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def stopped(self) -> bool:
+        return self.cancelled or self.truncated
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def account(self, entries: int) -> None:
+        """
+        Registra le voci lette da un thread e lo rallenta se supera max_rate voci al secondo
+        """
+        with self._lock:
+            self.entries += entries
+            self.directories += 1
+            total = self.entries
+            if self.max_entries and total >= self.max_entries:
+                self.truncated = True
+
+        if self.max_rate:
+            ahead = total / self.max_rate - (time.monotonic() - self._started)
+            if ahead > 0:
+                # Attesa interrompibile dall'annullamento
+                self._cancel.wait(ahead)
+
+def _scan_directory(path: str, root_dev: Optional[int], control: ScanControl,
+                    handle_directory: Callable[[str, List[FileInfo], List[str], float], None],
+                    sample_limit: Optional[int]) -> List[str]:
+    if control.stopped:
+        return []
+
+    file_entries = []
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if root_dev is not None and entry.stat(follow_symlinks=False).st_dev != root_dev:
+                            continue
+                        subdirs.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        file_entries.append(entry)
+                except OSError:
+                    continue
+    except OSError:
+        return []
+
+    # Nelle directory enormi si esamina un campione: i valori vanno moltiplicati per factor
+    factor = 1.0
+    if sample_limit and len(file_entries) > sample_limit:
+        factor = len(file_entries) / sample_limit
+        file_entries = random.sample(file_entries, sample_limit)
+
+    files: List[FileInfo] = []
+    for entry in file_entries:
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        files.append((entry.name, st.st_size, st.st_blocks * 512))
+
+    handle_directory(path, files, subdirs, factor)
+    control.account(len(file_entries) + len(subdirs))
+    return subdirs
+
+def scan_tree(root: str, handle_directory: Callable[[str, List[FileInfo], List[str], float], None],
+              control: Optional[ScanControl] = None, workers: int = SCAN_WORKERS,
+              one_file_system: bool = True, sample_limit: Optional[int] = SCAN_DIR_SAMPLE_LIMIT) -> ScanControl:
+    """
+    Scansiona root in parallelo chiamando handle_directory(percorso, file, sottodirectory, fattore)
+    per ogni directory. handle_directory viene chiamata dai thread di lavoro e deve essere thread-safe.
+    Funzione bloccante: dal codice async va eseguita con run_in_executor.
+
+    Returns:
+        Il ScanControl con i contatori finali (truncated se è stato raggiunto max_entries)
+
+    Raises:
+        ScanCancelled: se la scansione viene annullata
+        OSError: se root non è accessibile
+    """
+    control = control or ScanControl()
+    root_dev = os.stat(root).st_dev if one_file_system else None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fs-scan") as executor:
+        pending = {executor.submit(_scan_directory, root, root_dev, control, handle_directory, sample_limit)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for subdir in future.result():
+                    if control.stopped:
+                        break
+                    pending.add(executor.submit(_scan_directory, subdir, root_dev, control,
+                                                handle_directory, sample_limit))
+            if control.cancelled:
+                for future in pending:
+                    future.cancel()
+                break
+
+    if control.cancelled:
+        raise ScanCancelled()
+    return control
@@ -0,0 +1,149 @@
+"""
+Modello di /etc/fstab
+
+Il file viene analizzato una sola volta e riletto solo quando cambia (mtime, dimensione o inode).
+Le voci sono indicizzate per percorso del dispositivo, UUID, LABEL e PARTUUID: verificare
+se un dispositivo ha l'auto mount configurato costa una ricerca in un dizionario invece di
+una lettura del file per ogni partizione.
+"""
+
+import os
+import re
+import threading
+from typing import List, Dict, Optional, Any, Tuple
+
+FSTAB_PATH = "/etc/fstab"
+
+# Prefissi delle specifiche di dispositivo in fstab e relativo indice
+SPEC_PREFIXES = {
+    "UUID=": "uuid",
+    "LABEL=": "label",
+    "PARTUUID=": "partuuid",
+    "PARTLABEL=": "partlabel"
+}
+
+# Directory dei link simbolici udev equivalenti alle specifiche UUID=/LABEL=/PARTUUID=
+_BY_DIRS = {
+    "/dev/disk/by-uuid/": "uuid",
+    "/dev/disk/by-label/": "label",
+    "/dev/disk/by-partuuid/": "partuuid",
+    "/dev/disk/by-partlabel/": "partlabel"
+}
+
+_cache: Dict[str, Tuple[Tuple[int, int, int], "Fstab"]] = {}
+_lock = threading.Lock()
+
+def _unescape(field: str) -> str:
+    # fstab codifica spazi e tabulazioni come \040 e \011
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+def parse_fstab(content: str) -> List[Dict[str, Any]]:
+    """
+    Analizza il contenuto di fstab (commenti e righe vuote esclusi)
+    """
+    entries = []
+    for number, line in enumerate(content.splitlines(), start=1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        fields = stripped.split()
+        if len(fields) < 2:
+            continue
+        entries.append({
+            "spec": _unescape(fields[0]),
+            "file": _unescape(fields[1]),
+            "vfstype": fields[2] if len(fields) > 2 else "auto",
+            "mntops": fields[3] if len(fields) > 3 else "defaults",
+            "freq": int(fields[4]) if len(fields) > 4 and fields[4].isdigit() else 0,
+            "passno": int(fields[5]) if len(fields) > 5 and fields[5].isdigit() else 0,
+            "line": number
+        })
+    return entries
+
+class Fstab:
+    """
+    Voci di fstab indicizzate per dispositivo, UUID, LABEL, PARTUUID e punto di montaggio
+    """
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.entries = entries
+        self.by_device: Dict[str, Dict[str, Any]] = {}
+        self.by_mountpoint: Dict[str, Dict[str, Any]] = {}
+        self._by_key: Dict[str, Dict[str, Dict[str, Any]]] = {key: {} for key in SPEC_PREFIXES.values()}
+
+        for entry in entries:
+            spec = entry["spec"]
+            self.by_mountpoint.setdefault(entry["file"], entry)
+
+            for prefix, key in SPEC_PREFIXES.items():
+                if spec.startswith(prefix):
+                    self._by_key[key].setdefault(spec[len(prefix):], entry)
+                    break
+            else:
+                for directory, key in _BY_DIRS.items():
+                    if spec.startswith(directory):
+                        self._by_key[key].setdefault(spec[len(directory):], entry)
+                if spec.startswith("/dev/"):
+                    self.by_device.setdefault(spec, entry)
+
+    def find(self, path: Optional[str] = None, uuid: Optional[str] = None, label: Optional[str] = None,
+             partuuid: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Cerca la voce di un dispositivo per percorso, UUID, LABEL o PARTUUID
+        """
+        if path and path in self.by_device:
+            return self.by_device[path]
+        for key, value in (("uuid", uuid), ("label", label), ("partuuid", partuuid)):
+            if value and value in self._by_key[key]:
+                return self._by_key[key][value]
+        return None
+
+    def find_device(self, device: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Cerca la voce di un dispositivo dell'inventario dei dispositivi a blocchi
+        """
+        entry = self.find(device.get("path"), device.get("uuid"), device.get("label"), device.get("partuuid"))
+        if entry is None:
+            for by_id in device.get("by_id", []):
+                entry = self.by_device.get(f"/dev/disk/by-id/{by_id}")
+                if entry is not None:
+                    break
+        return entry
+
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def get_fstab(path: str = FSTAB_PATH) -> Fstab:
+    """
+    Restituisce il modello di fstab, rileggendo il file solo se è cambiato
+    """
+    signature = _file_signature(path)
+    if signature is None:
+        return Fstab([])
+
+    with _lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        try:
+            with open(path, "r") as f:
+                content = f.read()
+        except OSError as e:
+            print(f"Errore nella lettura di {path}: {str(e)}")
+            return Fstab([])
+
+        fstab = Fstab(parse_fstab(content))
+        _cache[path] = (signature, fstab)
+        return fstab
+
+def invalidate_fstab(path: str = FSTAB_PATH) -> None:
+    """
+    Invalida il modello in cache (da chiamare dopo ogni scrittura di fstab)
+    """
+    with _lock:
+        _cache.pop(path, None)
@@ -0,0 +1,313 @@
+"""
+Rilevamento dei dischi collegati e scollegati (hotplug)
+
+Un socket netlink riceve i uevent del kernel per il sottosistema block (in alternativa, se
+netlink non è disponibile, un watch inotify su /dev/disk/by-id). Ad ogni evento l'inventario
+dei dispositivi a blocchi viene invalidato e ricaricato subito, e l'evento viene pubblicato
+sul Broadcaster: le route dei dischi possono servire l'inventario dalla cache con un TTL
+lungo invece di rilanciare lsblk ad ogni richiesta.
+
+Per le prove gli eventi possono essere iniettati con HotplugMonitor.inject_uevent.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import socket
+import struct
+import time
+from collections import deque
+from typing import List, Dict, Optional, Any, Union
+
+from .block_devices import (get_block_devices, invalidate_block_devices, set_block_devices_ttl,
+                            BLOCK_DEVICES_TTL, BY_ID_DIR)
+from .streaming import Broadcaster
+
+logger = logging.getLogger(__name__)
+
+# Famiglia netlink dei uevent e gruppo dei messaggi del kernel (il gruppo 2 è quello di udev)
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_KERNEL_GROUP = 1
+
+# Attesa (secondi) dopo un evento prima di rileggere l'inventario: udev deve creare
+# i link in /dev/disk/by-id, e un disco con più partizioni genera una raffica di eventi
+HOTPLUG_SETTLE_DELAY = 1.0
+
+# Con il monitor attivo l'inventario cambia solo per eventi noti: il TTL resta come
+# rete di sicurezza per i mount e umount eseguiti fuori dall'applicazione
+HOTPLUG_BLOCK_DEVICES_TTL = 300
+
+# Numero di eventi conservati per i client che si collegano
+HOTPLUG_HISTORY = 100
+
+# Azioni che modificano l'inventario (change: cambio di supporto, ridimensionamento)
+HOTPLUG_ACTIONS = {"add", "remove", "change"}
+
+# Dispositivi virtuali che generano eventi continui senza interesse
+HOTPLUG_SKIP_PREFIXES = ("loop", "ram", "zram")
+
+# Costanti inotify (vedi inotify(7))
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+def parse_uevent(data: bytes) -> Optional[Dict[str, str]]:
+    """
+    Analizza un uevent del kernel: "azione@devpath" seguito da coppie CHIAVE=valore
+    separate da byte nulli. None per i messaggi di udev (formato binario "libudev").
+    """
+    parts = data.split(b"\0")
+    if not parts or not parts[0] or parts[0].startswith(b"libudev"):
+        return None
+
+    uevent: Dict[str, str] = {}
+    for part in parts[1:]:
+        key, separator, value = part.decode(errors="replace").partition("=")
+        if separator:
+            uevent[key] = value
+
+    if "ACTION" not in uevent:
+        action, _, devpath = parts[0].decode(errors="replace").partition("@")
+        uevent["ACTION"] = action
+        uevent.setdefault("DEVPATH", devpath)
+    return uevent
+
+def _open_netlink() -> socket.socket:
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1024 * 1024)
+        sock.bind((0, UEVENT_KERNEL_GROUP))
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+class _Inotify:
+    """
+    Watch inotify minimale via libc (nessuna dipendenza esterna)
+    """
+
+    def __init__(self, path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.path = path
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 fallita")
+        mask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+        if libc.inotify_add_watch(self.fd, path.encode(), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch fallita su {path}")
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def read_events(self) -> List[Dict[str, Any]]:
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset + _INOTIFY_EVENT.size <= len(data):
+            _, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+            offset += _INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            events.append({"mask": mask, "name": name})
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class HotplugMonitor:
+    """
+    Monitor dei uevent block: mantiene aggiornato l'inventario e pubblica gli eventi
+    """
+
+    def __init__(self, history: int = HOTPLUG_HISTORY, settle_delay: float = HOTPLUG_SETTLE_DELAY):
+        self.events: deque = deque(maxlen=history)
+        self.broadcaster = Broadcaster()
+        self.settle_delay = settle_delay
+        self.source: Optional[str] = None
+        self._netlink: Optional[socket.socket] = None
+        self._inotify: Optional[_Inotify] = None
+        self._pending: List[Dict[str, Any]] = []
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._refresh_again = False
+
+    @property
+    def running(self) -> bool:
+        return self.source is not None
+
+    def start(self) -> None:
+        if self.running:
+            return
+        loop = asyncio.get_event_loop()
+
+        try:
+            self._netlink = _open_netlink()
+            loop.add_reader(self._netlink.fileno(), self._on_netlink)
+            self.source = "netlink"
+        except OSError as e:
+            logger.warning(f"Socket netlink dei uevent non disponibile ({e}), uso inotify")
+            self._netlink = None
+
+        if self._netlink is None:
+            path = BY_ID_DIR if os.path.isdir(BY_ID_DIR) else "/dev"
+            try:
+                self._inotify = _Inotify(path)
+                loop.add_reader(self._inotify.fileno(), self._on_inotify)
+                self.source = "inotify"
+            except OSError as e:
+                logger.warning(f"Rilevamento hotplug non disponibile: {e}")
+                return
+
+        # L'inventario viene aggiornato dagli eventi: può restare in cache più a lungo
+        set_block_devices_ttl(HOTPLUG_BLOCK_DEVICES_TTL)
+        logger.info(f"Monitor hotplug avviato ({self.source})")
+
+    async def stop(self) -> None:
+        loop = asyncio.get_event_loop()
+        if self._netlink is not None:
+            loop.remove_reader(self._netlink.fileno())
+            self._netlink.close()
+            self._netlink = None
+        if self._inotify is not None:
+            loop.remove_reader(self._inotify.fileno())
+            self._inotify.close()
+            self._inotify = None
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self.source is not None:
+            set_block_devices_ttl(BLOCK_DEVICES_TTL)
+            self.source = None
+
+    def _on_netlink(self) -> None:
+        while True:
+            try:
+                data = self._netlink.recv(64 * 1024)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                # ENOBUFS: il buffer del socket è pieno e alcuni eventi sono andati persi
+                logger.warning(f"Errore nella lettura dei uevent: {e}")
+                self._schedule_refresh()
+                break
+            uevent = parse_uevent(data)
+            if uevent is not None:
+                self.handle_uevent(uevent, "netlink")
+
+    def _on_inotify(self) -> None:
+        for event in self._inotify.read_events():
+            if event["mask"] & IN_Q_OVERFLOW:
+                self._schedule_refresh()
+                continue
+            if not event["name"]:
+                continue
+            added = bool(event["mask"] & (IN_CREATE | IN_MOVED_TO))
+            path = os.path.join(self._inotify.path, event["name"])
+            # Il link rimosso non è più risolvibile: resta solo il suo nome
+            name = os.path.basename(os.path.realpath(path)) if added else event["name"]
+            self.handle_uevent({
+                "ACTION": "add" if added else "remove",
+                "SUBSYSTEM": "block",
+                "DEVNAME": name,
+                "ID_LINK": event["name"]
+            }, "inotify")
+
+    def inject_uevent(self, uevent: Union[bytes, Dict[str, str]]) -> bool:
+        """
+        Inietta un uevent sintetico (bytes nel formato netlink o dizionario CHIAVE -> valore).
+        Restituisce True se l'evento è stato accettato.
+        """
+        if isinstance(uevent, bytes):
+            uevent = parse_uevent(uevent)
+            if uevent is None:
+                return False
+        return self.handle_uevent(uevent, "injected")
+
+    def handle_uevent(self, uevent: Dict[str, str], source: str) -> bool:
+        """
+        Accoda un uevent block e programma l'aggiornamento dell'inventario
+        """
+        action = uevent.get("ACTION")
+        name = uevent.get("DEVNAME") or os.path.basename(uevent.get("DEVPATH", ""))
+        if uevent.get("SUBSYSTEM") != "block" or action not in HOTPLUG_ACTIONS or not name:
+            return False
+        if name.startswith(HOTPLUG_SKIP_PREFIXES):
+            return False
+
+        name = name[len("/dev/"):] if name.startswith("/dev/") else name
+        self._pending.append({
+            "event": "hotplug",
+            "action": action,
+            "name": name,
+            "device": f"/dev/{name}",
+            "devtype": uevent.get("DEVTYPE") or None,
+            "link": uevent.get("ID_LINK") or None,
+            "source": source,
+            "timestamp": time.time()
+        })
+        self._schedule_refresh()
+        return True
+
+    def _schedule_refresh(self) -> None:
+        # Gli eventi ravvicinati (disco + partizioni) producono un solo aggiornamento
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_again = False
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+        else:
+            # Evento arrivato durante la rilettura di lsblk: serve un altro giro
+            self._refresh_again = True
+
+    async def _refresh(self) -> None:
+        while True:
+            await asyncio.sleep(self.settle_delay)
+            self._refresh_again = False
+            events, self._pending = self._pending, []
+            await self._reload(events)
+            if not self._refresh_again and not self._pending:
+                break
+
+    async def _reload(self, events: List[Dict[str, Any]]) -> None:
+        invalidate_block_devices()
+        try:
+            inventory = await get_block_devices()
+        except Exception as e:
+            logger.error(f"Errore nell'aggiornamento dell'inventario dopo un evento hotplug: {e}")
+            inventory = None
+
+        for event in events:
+            if inventory is not None and event["action"] != "remove":
+                device = inventory.get(event["name"])
+                if device is not None:
+                    event.update({
+                        "devtype": event["devtype"] or device["type"],
+                        "model": device["model"],
+                        "serial": device["serial"],
+                        "size": device["size"]
+                    })
+            self.events.append(event)
+            self.broadcaster.publish(event)
+
+    def get_history(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        events = list(self.events)
+        if limit:
+            events = events[-limit:]
+        return {
+            "running": self.running,
+            "source": self.source,
+            "events": events
+        }
+
+# Istanza condivisa, avviata all'avvio dell'applicazione
+hotplug_monitor = HotplugMonitor()
@@ -0,0 +1,431 @@
+"""
+Operazioni di lunga durata eseguite come job in background
+
+Formattazioni e creazione di pool su dischi USB grandi durano minuti: eseguirle dentro la
+richiesta HTTP fa scadere il timeout di nginx e l'operatore non ne conosce l'esito. Un job
+restituisce subito il proprio id, viene eseguito in un task separato, salva stato e
+risultato nella tabella jobs del database e pubblica l'avanzamento (ricavato dall'output
+del comando) sul Broadcaster. Ogni job blocca i dischi che usa: due job non possono
+lavorare sullo stesso disco, nemmeno su partizioni diverse.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .block_devices import get_block_devices
+from .command_runner import start_task, spawn_process, terminate_process
+from .streaming import Broadcaster
+from ..database import SessionLocal, JobRecord
+
+logger = logging.getLogger(__name__)
+
+# Intervallo minimo (secondi) tra due salvataggi dell'avanzamento nel database
+JOB_PROGRESS_SAVE_INTERVAL = 2
+
+# Job conservati nel database (i più vecchi vengono eliminati)
+JOB_HISTORY = 200
+
+# Righe di output conservate per ogni job (per il messaggio di errore)
+JOB_OUTPUT_LINES = 50
+
+JOB_ACTIVE_STATES = {"running"}
+
+# Separatori dell'output dei comandi: mkfs aggiorna i contatori con \b e \r
+_LINE_SPLIT_RE = re.compile(r"[\r\n\b]+")
+
+_jobs: Dict[str, "Job"] = {}
+# Disco (nome kernel o percorso) -> id del job che lo sta usando
+_device_locks: Dict[str, str] = {}
+
+broadcaster = Broadcaster()
+
+class Job:
+    """
+    Job in esecuzione: avanzamento, output del comando e annullamento
+    """
+
+    def __init__(self, job_type: str, target: str, devices: List[str], lock_keys: List[str],
+                 cancellable: bool):
+        self.id = uuid.uuid4().hex[:12]
+        self.type = job_type
+        self.target = target
+        self.devices = devices
+        self.lock_keys = lock_keys
+        self.cancellable = cancellable
+        self.state = "running"
+        self.progress: Optional[float] = None  # None: avanzamento non determinabile
+        self.message: Optional[str] = None
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.output: deque = deque(maxlen=JOB_OUTPUT_LINES)
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Future] = None
+        self._cancelled = False
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._last_save = 0.0
+        self._last_was_progress = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "target": self.target,
+            "devices": self.devices,
+            "state": self.state,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "result": self.result,
+            "cancellable": self.cancellable,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "output": list(self.output)[-10:]
+        }
+
+    def set_progress(self, progress: Optional[float] = None, message: Optional[str] = None) -> None:
+        """
+        Aggiorna avanzamento (0-100) e/o messaggio e li pubblica
+        """
+        changed = False
+        if progress is not None:
+            progress = round(max(0.0, min(progress, 100.0)), 1)
+            changed = progress != self.progress
+            self.progress = progress
+        if message is not None and message != self.message:
+            self.message = message
+            changed = True
+        if not changed:
+            return
+
+        broadcaster.publish({"event": "job", **self.to_dict()})
+        now = time.monotonic()
+        if now - self._last_save >= JOB_PROGRESS_SAVE_INTERVAL:
+            self._last_save = now
+            _save(self)
+
+    async def run_command(self, command: List[str],
+                          parse_progress: Optional[Callable[[str], Optional[float]]] = None) -> Dict[str, Any]:
+        """
+        Esegue un comando del job leggendone l'output riga per riga: parse_progress riceve
+        ogni riga e restituisce l'avanzamento (0-100) oppure None.
+        Restituisce lo stesso dizionario di command_runner.run_command.
+        """
+        if self._cancelled:
+            return {"success": False, "output": None, "error": "Job annullato", "returncode": None}
+
+        try:
+            self._process = await spawn_process(command, stderr=asyncio.subprocess.STDOUT)
+        except OSError as e:
+            return {"success": False, "output": None, "error": str(e), "returncode": None}
+
+        lines: List[str] = []
+        pending = ""
+        try:
+            while True:
+                chunk = await self._process.stdout.read(4096)
+                if not chunk:
+                    break
+                parts = _LINE_SPLIT_RE.split(pending + chunk.decode(errors="replace"))
+                pending = parts.pop()
+                for line in parts:
+                    self._handle_line(line, lines, parse_progress)
+            if pending:
+                self._handle_line(pending, lines, parse_progress)
+            await self._process.wait()
+        except asyncio.CancelledError:
+            await terminate_process(self._process)
+            raise
+        finally:
+            returncode = self._process.returncode
+            self._process = None
+
+        output = "\n".join(lines)
+        if returncode == 0:
+            return {"success": True, "output": output, "error": None, "returncode": 0}
+        error = "Job annullato" if self._cancelled else \
+            (lines[-1] if lines else f"Comando terminato con codice {returncode}")
+        return {"success": False, "output": output, "error": error, "returncode": returncode}
+
+    def _handle_line(self, line: str, lines: List[str],
+                     parse_progress: Optional[Callable[[str], Optional[float]]]) -> None:
+        line = line.strip()
+        if not line:
+            return
+        progress = parse_progress(line) if parse_progress is not None else None
+        # I contatori di avanzamento producono molte righe quasi uguali: si conserva solo l'ultima
+        if progress is not None and self._last_was_progress and self.output:
+            # Un contatore senza fase ("38/1193") aggiorna la riga precedente mantenendone la fase
+            head, separator, _ = self.output[-1].rpartition(": ")
+            self.output[-1] = f"{head}{separator}{line}" if separator and ": " not in line else line
+        else:
+            self.output.append(line)
+            lines.append(line)
+        self._last_was_progress = progress is not None
+        if progress is not None:
+            self.set_progress(progress)
+
+    async def cancel(self) -> None:
+        self._cancelled = True
+        if self._process is not None:
+            await terminate_process(self._process)
+
+def _save(job: Job) -> None:
+    db = SessionLocal()
+    try:
+        record = db.query(JobRecord).filter(JobRecord.id == job.id).first()
+        if record is None:
+            record = JobRecord(id=job.id, type=job.type, target=job.target,
+                               devices=json.dumps(job.devices), created_at=job.created_at)
+            db.add(record)
+        record.state = job.state
+        record.progress = job.progress
+        record.message = job.message
+        record.error = job.error
+        record.result = json.dumps(job.result) if job.result is not None else None
+        record.finished_at = job.finished_at
+        db.commit()
+    except Exception as e:
+        logger.error(f"Errore nel salvataggio del job {job.id}: {e}")
+    finally:
+        db.close()
+
+def _record_to_dict(record: JobRecord) -> Dict[str, Any]:
+    return {
+        "id": record.id,
+        "type": record.type,
+        "target": record.target,
+        "devices": json.loads(record.devices or "[]"),
+        "state": record.state,
+        "progress": record.progress,
+        "message": record.message,
+        "error": record.error,
+        "result": json.loads(record.result) if record.result else None,
+        "cancellable": False,
+        "created_at": record.created_at,
+        "finished_at": record.finished_at,
+        "output": []
+    }
+
+def _prune_history() -> None:
+    db = SessionLocal()
+    try:
+        old = db.query(JobRecord.id).order_by(JobRecord.created_at.desc()).offset(JOB_HISTORY).all()
+        if old:
+            db.query(JobRecord).filter(JobRecord.id.in_([row.id for row in old])).delete(synchronize_session=False)
+            db.commit()
+    finally:
+        db.close()
+
+async def _lock_keys(devices: List[str]) -> List[str]:
+    # Il blocco riguarda il disco intero: una partizione blocca il disco che la contiene
+    inventory = await get_block_devices()
+    keys = []
+    for device in devices:
+        info = inventory.get(device) or inventory.get(os.path.realpath(device))
+        while info is not None and info["parent"] and inventory.get(info["parent"]) is not None:
+            info = inventory.get(info["parent"])
+        key = info["name"] if info is not None else os.path.basename(os.path.realpath(device))
+        if key not in keys:
+            keys.append(key)
+    return keys
+
+async def get_device_job(device: str) -> Optional[Dict[str, Any]]:
+    """
+    Restituisce il job in corso che usa il disco del dispositivo (None se è libero)
+    """
+    for key in await _lock_keys([device]):
+        job_id = _device_locks.get(key)
+        if job_id is not None and job_id in _jobs:
+            return _jobs[job_id].to_dict()
+    return None
+
+async def _run(job: Job, runner: Callable[[Job], Awaitable[Dict[str, Any]]]) -> None:
+    try:
+        result = await runner(job)
+        if job.cancelled:
+            job.state = "cancelled"
+        elif result.get("success"):
+            job.state = "completed"
+            job.progress = 100.0
+            job.message = result.get("message") or job.message
+        else:
+            job.state = "failed"
+            job.error = result.get("error") or "Operazione non riuscita"
+        job.result = {key: value for key, value in result.items() if key not in ("success", "error")}
+    except asyncio.CancelledError:
+        job.state = "cancelled"
+    except Exception as e:
+        logger.error(f"Errore nel job {job.id} ({job.type}): {e}")
+        job.state = "failed"
+        job.error = str(e)
+    finally:
+        job.finished_at = time.time()
+        for key in job.lock_keys:
+            if _device_locks.get(key) == job.id:
+                del _device_locks[key]
+        _save(job)
+        broadcaster.publish({"event": "job", **job.to_dict()})
+
+async def submit_job(job_type: str, target: str, devices: List[str],
+                     runner: Callable[[Job], Awaitable[Dict[str, Any]]],
+                     cancellable: bool = True) -> Dict[str, Any]:
+    """
+    Avvia un job in background bloccando i dischi indicati
+
+    Args:
+        job_type: Tipo di operazione (format, zpool_create, ...)
+        target: Oggetto dell'operazione mostrato all'utente
+        devices: Dispositivi usati dal job
+        runner: Coroutine che esegue il job e restituisce {"success", "message"/"error", ...}
+        cancellable: Se False il job non può essere interrotto (es. zpool create)
+
+    Returns:
+        Dizionario con success e lo stato del job (o error se un disco è occupato)
+    """
+    keys = await _lock_keys(devices)
+    busy = [key for key in keys if key in _device_locks]
+    if busy:
+        other = _jobs.get(_device_locks[busy[0]])
+        return {
+            "success": False,
+            "error": f"Il disco {busy[0]} è già in uso da un'altra operazione"
+                     + (f" ({other.type} su {other.target})" if other is not None else "")
+        }
+
+    job = Job(job_type, target, devices, keys, cancellable)
+    for key in keys:
+        _device_locks[key] = job.id
+    _jobs[job.id] = job
+    _save(job)
+    _prune_history()
+
+    # Restano in memoria solo i job in corso e gli ultimi terminati
+    finished = [job_id for job_id, item in _jobs.items() if item.state not in JOB_ACTIVE_STATES]
+    for job_id in finished[:max(0, len(finished) - 20)]:
+        del _jobs[job_id]
+
+    job.task = start_task(_run(job, runner))
+    broadcaster.publish({"event": "job", **job.to_dict()})
+    return {
+        "success": True,
+        "job_id": job.id,
+        "job": job.to_dict()
+    }
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Restituisce lo stato di un job (in memoria o dal database), None se non esiste
+    """
+    job = _jobs.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    db = SessionLocal()
+    try:
+        record = db.query(JobRecord).filter(JobRecord.id == job_id).first()
+        return _record_to_dict(record) if record is not None else None
+    finally:
+        db.close()
+
+def list_jobs(limit: int = 50, state: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Elenca i job dal più recente (quelli in corso con l'avanzamento aggiornato)
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(JobRecord)
+        if state:
+            query = query.filter(JobRecord.state == state)
+        records = query.order_by(JobRecord.created_at.desc()).limit(limit).all()
+    finally:
+        db.close()
+    return [_jobs[record.id].to_dict() if record.id in _jobs else _record_to_dict(record) for record in records]
+
+async def cancel_job(job_id: str) -> Dict[str, Any]:
+    """
+    Annulla un job in corso (il comando viene terminato)
+    """
+    job = _jobs.get(job_id)
+    if job is None or job.state not in JOB_ACTIVE_STATES:
+        return {
+            "success": False,
+            "error": f"Nessun job in corso con id '{job_id}'"
+        }
+    if not job.cancellable:
+        return {
+            "success": False,
+            "error": f"Il job '{job_id}' ({job.type}) non può essere interrotto senza danni"
+        }
+    await job.cancel()
+    return {
+        "success": True,
+        "message": f"Annullamento del job '{job_id}' richiesto"
+    }
+
+def recover_interrupted_jobs() -> None:
+    """
+    All'avvio segna come interrotti i job rimasti in corso (servizio riavviato durante l'esecuzione)
+    """
+    db = SessionLocal()
+    try:
+        records = db.query(JobRecord).filter(JobRecord.state.in_(JOB_ACTIVE_STATES)).all()
+        for record in records:
+            record.state = "interrupted"
+            record.error = "Servizio riavviato durante l'esecuzione: verificare lo stato del disco"
+            record.finished_at = time.time()
+        db.commit()
+    finally:
+        db.close()
+
+# Parser dell'avanzamento dei comandi
+
+_MKE2FS_PHASES = {
+    # Fase -> (inizio, peso) in percentuale dell'intera formattazione
+    "Discarding device blocks": (0, 10),
+    "Allocating group tables": (10, 10),
+    "Writing inode tables": (20, 60),
+    "Writing superblocks and filesystem accounting information": (85, 15)
+}
+_COUNTER_RE = re.compile(r"^(?P<phase>[^:]+):\s*(?P<done>\d+)/(?P<total>\d+)")
+_BARE_COUNTER_RE = re.compile(r"^(?P<done>\d+)/(?P<total>\d+)")
+_PERCENT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+
+class Mke2fsProgress:
+    """
+    Avanzamento di mkfs.ext4 dai contatori "Writing inode tables: 37/1193". Dopo la prima
+    riga di una fase mkfs riscrive solo il contatore (con \\b), quindi la fase va ricordata.
+    """
+
+    def __init__(self):
+        self.phase: Optional[Tuple[int, int]] = None
+
+    def __call__(self, line: str) -> Optional[float]:
+        match = _COUNTER_RE.match(line)
+        if match is not None:
+            self.phase = _MKE2FS_PHASES.get(match.group("phase").strip())
+        else:
+            match = _BARE_COUNTER_RE.match(line)
+        if match is None or self.phase is None:
+            return None
+        total = int(match.group("total"))
+        if not total:
+            return None
+        return self.phase[0] + self.phase[1] * int(match.group("done")) / total
+
+def parse_percent_progress(line: str) -> Optional[float]:
+    """
+    Avanzamento dai comandi che stampano una percentuale (mkfs.ntfs: "Initializing device with zeroes:  42%")
+    """
+    match = _PERCENT_RE.search(line)
+    return float(match.group(1)) if match else None
@@ -0,0 +1,501 @@
+"""
+Archivio delle metriche a più risoluzioni (stile RRD)
+
+I campionatori in background conoscono solo l'ultima ora: per rispondere a "quando il NAS
+è diventato lento" servono giorni di storia. Ogni metrica ha una serie per livello di
+risoluzione (10 s per un'ora, 1 min per un giorno, 10 min per 30 giorni) in RingBuffer a
+dimensione fissa; ogni livello aggrega media e massimo dei valori del proprio intervallo.
+Le query scelgono il livello più fine che copre l'intervallo richiesto e riducono i punti
+con LTTB. Per limitare le scritture sulla scheda SD, ogni 15 minuti si aggiungono a un journal
+solo i punti chiusi dall'ultimo salvataggio; lo snapshot completo (un file compresso, scritto
+con rename atomico) viene riscritto solo quando il journal supera METRICS_JOURNAL_MAX_SIZE.
+
+Le sorgenti (sistema, dischi, ZFS, container) si registrano con register_collector: una
+funzione, sincrona o asincrona, che restituisce {nome metrica -> valore}.
+"""
+
+import asyncio
+import inspect
+import json
+import logging
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from typing import List, Dict, Optional, Any, Callable, Tuple
+
+from .ringbuffer import RingBuffer
+from ..database import data_dir
+
+logger = logging.getLogger(__name__)
+
+# Livelli di risoluzione: (intervallo in secondi, numero di punti)
+METRICS_TIERS: List[Tuple[int, int]] = [
+    (10, 360),     # 10 secondi per 1 ora
+    (60, 1440),    # 1 minuto per 1 giorno
+    (600, 4320)    # 10 minuti per 30 giorni
+]
+
+# Intervallo (secondi) di raccolta delle sorgenti, pari al livello più fine
+METRICS_STEP = METRICS_TIERS[0][0]
+
+# Intervallo (secondi) tra due salvataggi su disco
+METRICS_SNAPSHOT_INTERVAL = 900
+
+# Limite di serie conservate (ogni serie occupa circa 150 KB)
+METRICS_MAX_SERIES = 256
+
+# Punti restituiti di default da una query
+METRICS_DEFAULT_POINTS = 300
+
+METRICS_SNAPSHOT_PATH = os.path.join(data_dir, "metrics.bin")
+METRICS_JOURNAL_PATH = os.path.join(data_dir, "metrics.journal")
+METRICS_SNAPSHOT_VERSION = 1
+
+# Dimensione (byte) del journal oltre la quale viene riscritto lo snapshot completo
+METRICS_JOURNAL_MAX_SIZE = 8 * 1024 * 1024
+
+TIER_FIELDS = ["timestamp", "avg", "max"]
+
+def lttb(points: List[Tuple[float, float]], threshold: int) -> List[Tuple[float, float]]:
+    """
+    Largest-Triangle-Three-Buckets: riduce una serie a threshold punti conservando
+    la forma (picchi e valli) meglio di una media a intervalli fissi
+    """
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (threshold - 2)
+    selected = 0
+
+    for bucket in range(threshold - 2):
+        # Media del bucket successivo: terzo vertice del triangolo
+        next_start = int((bucket + 1) * bucket_size) + 1
+        next_end = min(int((bucket + 2) * bucket_size) + 1, len(points))
+        next_points = points[next_start:next_end] or [points[-1]]
+        avg_x = sum(point[0] for point in next_points) / len(next_points)
+        avg_y = sum(point[1] for point in next_points) / len(next_points)
+
+        # Nel bucket corrente il punto che forma il triangolo di area massima
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        anchor_x, anchor_y = points[selected]
+        best_area = -1.0
+        for index in range(start, end):
+            x, y = points[index]
+            area = abs((anchor_x - avg_x) * (y - anchor_y) - (anchor_x - x) * (avg_y - anchor_y))
+            if area > best_area:
+                best_area = area
+                selected = index
+        sampled.append(points[selected])
+
+    sampled.append(points[-1])
+    return sampled
+
+class MetricSeries:
+    """
+    Una metrica su tutti i livelli di risoluzione, con l'intervallo in corso di ogni livello
+    """
+
+    def __init__(self, tiers: List[Tuple[int, int]] = METRICS_TIERS):
+        self.tiers = tiers
+        self.buffers = [RingBuffer(TIER_FIELDS, capacity) for _, capacity in tiers]
+        # Per livello: [inizio intervallo, somma, numero di valori, massimo]
+        self._pending: List[Optional[List[float]]] = [None] * len(tiers)
+        # Per livello: punti chiusi dopo l'ultimo salvataggio
+        self.unsaved = [0] * len(tiers)
+
+    def record(self, timestamp: float, value: float) -> None:
+        for index, (step, _) in enumerate(self.tiers):
+            bucket = timestamp - timestamp % step
+            pending = self._pending[index]
+            if pending is not None and pending[0] != bucket:
+                self._flush(index)
+                pending = None
+            if pending is None:
+                self._pending[index] = [bucket, value, 1, value]
+            else:
+                pending[1] += value
+                pending[2] += 1
+                pending[3] = max(pending[3], value)
+
+    def _flush(self, index: int) -> None:
+        bucket, total, count, maximum = self._pending[index]
+        self.buffers[index].append({"timestamp": bucket, "avg": total / count, "max": maximum})
+        self._pending[index] = None
+        self.unsaved[index] = min(self.unsaved[index] + 1, self.buffers[index].capacity)
+
+    def rows(self, index: int, start: float, end: float) -> List[Dict[str, Any]]:
+        """
+        Punti di un livello nell'intervallo [start, end], compreso quello ancora in corso
+        """
+        rows = [row for row in self.buffers[index].to_list() if start <= row["timestamp"] <= end]
+        pending = self._pending[index]
+        if pending is not None and start <= pending[0] <= end:
+            rows.append({"timestamp": pending[0], "avg": pending[1] / pending[2], "max": pending[3]})
+        return rows
+
+class MetricsStore:
+    """
+    Archivio delle metriche: raccoglie le sorgenti registrate e salva periodicamente su disco
+    """
+
+    def __init__(self, tiers: List[Tuple[int, int]] = METRICS_TIERS, path: str = METRICS_SNAPSHOT_PATH,
+                 journal_path: str = METRICS_JOURNAL_PATH, snapshot_interval: float = METRICS_SNAPSHOT_INTERVAL):
+        self.tiers = tiers
+        self.path = path
+        self.journal_path = journal_path
+        self.snapshot_interval = snapshot_interval
+        self.series: Dict[str, MetricSeries] = {}
+        self.last_snapshot: Optional[float] = None
+        # Sorgente -> (funzione, intervallo, prossima raccolta)
+        self._collectors: Dict[str, List[Any]] = {}
+        # saved_at dello snapshot a cui si riferisce il journal (None: serve uno snapshot completo)
+        self._base: Optional[float] = None
+        self._journal_size = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def register_collector(self, source: str, collector: Callable[[], Any], interval: float = METRICS_STEP) -> None:
+        """
+        Registra una sorgente: collector() (anche async) restituisce {nome -> valore} e le
+        metriche vengono salvate come "sorgente.nome"
+        """
+        self._collectors[source] = [collector, interval, 0.0]
+
+    def record(self, name: str, value: Optional[float], timestamp: Optional[float] = None) -> None:
+        """
+        Registra un valore (i None e i NaN vengono ignorati)
+        """
+        if value is None or isinstance(value, bool) or math.isnan(value):
+            return
+        series = self.series.get(name)
+        if series is None:
+            if len(self.series) >= METRICS_MAX_SERIES:
+                logger.warning(f"Limite di {METRICS_MAX_SERIES} serie raggiunto, metrica {name} ignorata")
+                return
+            series = self.series[name] = MetricSeries(self.tiers)
+        series.record(timestamp if timestamp is not None else time.time(), float(value))
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.load()
+        self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            # Ultimo salvataggio: i dati dall'ultimo snapshot non vanno persi
+            self.save()
+
+    async def _loop(self) -> None:
+        next_snapshot = time.monotonic() + self.snapshot_interval
+        while True:
+            await self.collect()
+            if time.monotonic() >= next_snapshot:
+                next_snapshot = time.monotonic() + self.snapshot_interval
+                try:
+                    await self.save_async()
+                except Exception as e:
+                    logger.error(f"Errore nel salvataggio delle metriche: {e}")
+            await asyncio.sleep(self.tiers[0][0])
+
+    async def collect(self) -> None:
+        """
+        Interroga le sorgenti scadute (in parallelo) e registra i valori
+        """
+        now = time.monotonic()
+        due = []
+        for source, entry in self._collectors.items():
+            if entry[2] <= now:
+                entry[2] = now + entry[1]
+                due.append(source)
+        results = await asyncio.gather(*(self._run_collector(source) for source in due))
+
+        timestamp = time.time()
+        for source, values in zip(due, results):
+            for name, value in (values or {}).items():
+                self.record(f"{source}.{name}", value, timestamp)
+
+    async def _run_collector(self, source: str) -> Optional[Dict[str, Any]]:
+        try:
+            values = self._collectors[source][0]()
+            if inspect.isawaitable(values):
+                values = await values
+            return values
+        except Exception as e:
+            logger.error(f"Errore nella raccolta delle metriche di {source}: {e}")
+            return None
+
+    def list_metrics(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "tiers": [{"step": step, "points": capacity, "retention": step * capacity}
+                      for step, capacity in self.tiers],
+            "sources": sorted(self._collectors),
+            "metrics": sorted(self.series),
+            "last_snapshot": self.last_snapshot
+        }
+
+    def query(self, name: str, start: Optional[float] = None, end: Optional[float] = None,
+              points: int = METRICS_DEFAULT_POINTS) -> Optional[Dict[str, Any]]:
+        """
+        Restituisce una metrica nell'intervallo [start, end] (default l'ultima ora) dal livello
+        più fine che lo copre, ridotta con LTTB a circa `points` punti. None se non esiste.
+        """
+        series = self.series.get(name)
+        if series is None:
+            return None
+
+        now = time.time()
+        end = end if end is not None else now
+        start = start if start is not None else end - 3600
+
+        tier = len(self.tiers) - 1
+        for index, (step, capacity) in enumerate(self.tiers):
+            if start >= now - step * capacity:
+                tier = index
+                break
+
+        rows = series.rows(tier, start, end)
+        if len(rows) > points:
+            # LTTB sceglie i punti sulla media; il massimo segue il punto scelto
+            maxima = {row["timestamp"]: row["max"] for row in rows}
+            sampled = lttb([(row["timestamp"], row["avg"]) for row in rows], points)
+            rows = [{"timestamp": timestamp, "avg": value, "max": maxima[timestamp]}
+                    for timestamp, value in sampled]
+
+        return {
+            "metric": name,
+            "step": self.tiers[tier][0],
+            "start": start,
+            "end": end,
+            "points": rows
+        }
+
+    def _payload(self, saved_at: float, delta: bool = False) -> bytes:
+        # Solo i punti validi di ogni livello, in ordine cronologico: prima l'intestazione
+        # JSON (serie e numero di punti), poi le colonne come array binari.
+        # Per il journal (delta) solo i punti chiusi dopo l'ultimo salvataggio.
+        header: Dict[str, Any] = {
+            "version": METRICS_SNAPSHOT_VERSION,
+            "byteorder": sys.byteorder,
+            "tiers": [list(tier) for tier in self.tiers],
+            "fields": TIER_FIELDS,
+            "saved_at": saved_at,
+            "series": {}
+        }
+        if delta:
+            header["base"] = self._base
+        body = bytearray()
+        for name, series in self.series.items():
+            counts = [series.unsaved[index] if delta else len(buffer)
+                      for index, buffer in enumerate(series.buffers)]
+            if delta and not any(counts):
+                continue
+            for buffer, count in zip(series.buffers, counts):
+                columns = buffer.export_columns(count)
+                for field in TIER_FIELDS:
+                    body += columns[field].tobytes()
+            header["series"][name] = counts
+
+        encoded = json.dumps(header).encode()
+        return struct.pack("<I", len(encoded)) + encoded + bytes(body)
+
+    def _prepare_save(self) -> Optional[Tuple[bool, float, bytes]]:
+        # I nuovi punti vanno nel journal; lo snapshot completo solo se il journal manca
+        # di una base valida o è diventato troppo grande
+        if not any(any(series.unsaved) for series in self.series.values()):
+            return None
+        full = self._base is None or self._journal_size >= METRICS_JOURNAL_MAX_SIZE
+        saved_at = time.time()
+        payload = self._payload(saved_at, delta=not full)
+        for series in self.series.values():
+            series.unsaved = [0] * len(self.tiers)
+        return full, saved_at, payload
+
+    def _write_snapshot(self, payload: bytes) -> None:
+        data = zlib.compress(payload, 6)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def _write(self, full: bool, payload: bytes) -> int:
+        if full:
+            self._write_snapshot(payload)
+            # I punti del journal sono già nel nuovo snapshot
+            with open(self.journal_path, "wb"):
+                pass
+            return 0
+        data = zlib.compress(payload, 6)
+        with open(self.journal_path, "ab") as f:
+            f.write(struct.pack("<I", len(data)) + data)
+            f.flush()
+            os.fsync(f.fileno())
+        return 4 + len(data)
+
+    def _mark_saved(self, full: bool, saved_at: float, written: int) -> None:
+        if full:
+            self._base = saved_at
+            self._journal_size = 0
+        else:
+            self._journal_size += written
+        self.last_snapshot = saved_at
+
+    def save(self) -> bool:
+        """
+        Salva su disco i punti chiusi dall'ultimo salvataggio (solo se ce ne sono)
+        """
+        prepared = self._prepare_save()
+        if prepared is None:
+            return False
+        full, saved_at, payload = prepared
+        try:
+            written = self._write(full, payload)
+        except OSError as e:
+            # Il journal non contiene questi punti: il prossimo salvataggio è completo
+            self._base = None
+            logger.error(f"Errore nel salvataggio delle metriche in {self.path}: {e}")
+            return False
+        self._mark_saved(full, saved_at, written)
+        return True
+
+    async def save_async(self) -> bool:
+        """
+        Come save, ma compressione e scrittura avvengono in un thread separato
+        """
+        prepared = self._prepare_save()
+        if prepared is None:
+            return False
+        full, saved_at, payload = prepared
+        try:
+            written = await asyncio.get_event_loop().run_in_executor(None, self._write, full, payload)
+        except OSError:
+            self._base = None
+            raise
+        self._mark_saved(full, saved_at, written)
+        return True
+
+    @staticmethod
+    def _read_header(payload: bytes) -> Tuple[Dict[str, Any], int]:
+        (length,) = struct.unpack_from("<I", payload)
+        return json.loads(payload[4:4 + length]), 4 + length
+
+    def _compatible(self, header: Dict[str, Any]) -> bool:
+        return (header.get("version") == METRICS_SNAPSHOT_VERSION and header.get("fields") == TIER_FIELDS
+                and [tuple(tier) for tier in header.get("tiers", [])] == list(self.tiers))
+
+    @staticmethod
+    def _read_series(header: Dict[str, Any], payload: bytes, offset: int):
+        # (nome, colonne di ogni livello) nell'ordine dell'intestazione
+        swap = header.get("byteorder") != sys.byteorder
+        for name, counts in header["series"].items():
+            tiers = []
+            for count in counts:
+                columns = {}
+                for field in TIER_FIELDS:
+                    column = array("d")
+                    column.frombytes(payload[offset:offset + count * column.itemsize])
+                    offset += count * column.itemsize
+                    if swap:
+                        column.byteswap()
+                    columns[field] = column
+                tiers.append(columns)
+            yield name, tiers
+
+    def load(self) -> bool:
+        """
+        Ricarica le serie salvate (snapshot più journal). Un file con livelli diversi da quelli
+        attuali viene ignorato.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                payload = zlib.decompress(f.read())
+            header, offset = self._read_header(payload)
+        except FileNotFoundError:
+            return False
+        except (OSError, zlib.error, struct.error, ValueError) as e:
+            logger.warning(f"Snapshot delle metriche {self.path} non leggibile: {e}")
+            return False
+
+        if not self._compatible(header):
+            logger.warning("Snapshot delle metriche con formato diverso, ignorato")
+            return False
+
+        series_map: Dict[str, MetricSeries] = {}
+        for name, tiers in self._read_series(header, payload, offset):
+            series = MetricSeries(self.tiers)
+            for buffer, columns in zip(series.buffers, tiers):
+                buffer.load_columns(columns)
+            series_map[name] = series
+
+        self.series = series_map
+        self.last_snapshot = header.get("saved_at")
+        self._base = self.last_snapshot
+        replayed = self._replay_journal()
+        logger.info(f"Caricate {len(series_map)} serie di metriche da {self.path} "
+                    f"({replayed} salvataggi dal journal)")
+        return True
+
+    def _replay_journal(self) -> int:
+        """
+        Aggiunge allo snapshot appena caricato i punti salvati nel journal dopo di esso
+        """
+        try:
+            with open(self.journal_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning(f"Journal delle metriche {self.journal_path} non leggibile: {e}")
+            self._base = None
+            return 0
+
+        base = self._base
+        offset = 0
+        replayed = 0
+        while offset < len(data):
+            try:
+                (size,) = struct.unpack_from("<I", data, offset)
+                payload = zlib.decompress(data[offset + 4:offset + 4 + size])
+                header, body = self._read_header(payload)
+            except (zlib.error, struct.error, ValueError) as e:
+                # Scrittura interrotta: il prossimo salvataggio riscrive lo snapshot completo
+                logger.warning(f"Journal delle metriche {self.journal_path} troncato: {e}")
+                self._base = None
+                break
+            offset += 4 + size
+            if header.get("base") != base or not self._compatible(header):
+                # Journal di uno snapshot precedente, rimasto se la riscrittura è stata interrotta
+                self._base = None
+                continue
+
+            for name, tiers in self._read_series(header, payload, body):
+                series = self.series.get(name)
+                if series is None:
+                    if len(self.series) >= METRICS_MAX_SERIES:
+                        continue
+                    series = self.series[name] = MetricSeries(self.tiers)
+                for buffer, columns in zip(series.buffers, tiers):
+                    for values in zip(*(columns[field] for field in TIER_FIELDS)):
+                        buffer.append(dict(zip(TIER_FIELDS, values)))
+            self.last_snapshot = header.get("saved_at")
+            replayed += 1
+
+        self._journal_size = offset
+        return replayed
+
+# Istanza condivisa, avviata all'avvio dell'applicazione
+metrics_store = MetricsStore()
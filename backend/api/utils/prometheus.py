@@ -0,0 +1,232 @@
+"""
+Esportazione delle metriche in formato testo Prometheus (text exposition 0.0.4)
+
+Lo scrape legge solo lo stato già in memoria: ultimi valori delle cache (pool, dataset,
+servizi), contatori di /proc/diskstats e arcstats, stato SMART, ultimo docker stats e
+istogramma delle latenze dell'API. Nessun comando viene eseguito durante lo scrape: i dati
+sono tenuti aggiornati dai campionatori in background e dall'archivio delle metriche.
+"""
+
+import bisect
+from typing import List, Dict, Optional, Any, Tuple
+
+from .diskstats import diskstats_collector, DISKSTATS_SECTOR_SIZE
+from .docker_utils import peek_container_stats
+from .metrics_store import metrics_store
+from .services import peek_services_status
+from .smart import smart_monitor
+from .system_sampler import system_sampler
+from .zfs_arc import arc_collector, read_arcstats
+from .zfs_utils import peek_zfs_inventory
+
+# Starlette aggiunge "; charset=utf-8" ai tipi text/*
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# Limiti (secondi) dei bucket dell'istogramma delle latenze
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Container di Virtual DSM, esportato anche quando è fermo
+VDSM_CONTAINER = "virtual-dsm"
+
+# Campi SMART esportati come gauge
+SMART_GAUGES = {
+    "temperature": "armnas_smart_temperature_celsius",
+    "power_on_hours": "armnas_smart_power_on_hours",
+    "reallocated_sectors": "armnas_smart_reallocated_sectors",
+    "pending_sectors": "armnas_smart_pending_sectors",
+    "offline_uncorrectable": "armnas_smart_offline_uncorrectable",
+    "crc_errors": "armnas_smart_crc_errors",
+    "percentage_used": "armnas_smart_percentage_used",
+    "media_errors": "armnas_smart_media_errors"
+}
+
+class LatencyHistogram:
+    """
+    Istogramma delle latenze per metodo, route e codice di stato
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # (metodo, route, stato) -> [conteggi per bucket, somma, totale]
+        self._series: Dict[Tuple[str, str, str], List[Any]] = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float) -> None:
+        key = (method, route, str(status))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect.bisect_left(self.buckets, seconds)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += seconds
+        series[2] += 1
+
+    def render(self, name: str, lines: List[str]) -> None:
+        lines.append(f"# HELP {name} Durata delle richieste HTTP all'API")
+        lines.append(f"# TYPE {name} histogram")
+        for (method, route, status), (counts, total, count) in sorted(self._series.items()):
+            labels = _labels({"method": method, "route": route, "status": status})[1:-1]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {_format(total)}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+
+# Istanza condivisa, alimentata dal middleware in main.py
+request_latency = LatencyHistogram()
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+def _format(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+def _family(lines: List[str], name: str, metric_type: str, description: str,
+            samples: List[Tuple[Dict[str, Any], Optional[float]]]) -> None:
+    # I valori None (non disponibili) vengono omessi; una famiglia vuota non viene scritta
+    samples = [(labels, value) for labels, value in samples if value is not None]
+    if not samples:
+        return
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} {metric_type}")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {_format(value)}")
+
+def _render_system(lines: List[str]) -> None:
+    sample = system_sampler.history.latest()
+    if sample is None:
+        return
+    _family(lines, "armnas_system_cpu_percent", "gauge", "Utilizzo della CPU (%)",
+            [({}, sample["cpu_percent"])])
+    _family(lines, "armnas_system_load1", "gauge", "Load average a 1 minuto", [({}, sample["load1"])])
+    _family(lines, "armnas_system_memory_total_bytes", "gauge", "Memoria totale",
+            [({}, system_sampler.memory_total)])
+    _family(lines, "armnas_system_memory_used_bytes", "gauge", "Memoria utilizzata",
+            [({}, sample["memory_used"])])
+    _family(lines, "armnas_system_swap_used_bytes", "gauge", "Swap utilizzato", [({}, sample["swap_used"])])
+
+def _render_zfs(lines: List[str]) -> None:
+    inventory = peek_zfs_inventory()
+    pools = inventory["pools"] or []
+    _family(lines, "armnas_zfs_pool_size_bytes", "gauge", "Dimensione del pool",
+            [({"pool": pool["name"]}, pool["size"]) for pool in pools])
+    _family(lines, "armnas_zfs_pool_allocated_bytes", "gauge", "Spazio allocato nel pool",
+            [({"pool": pool["name"]}, pool["allocated"]) for pool in pools])
+    _family(lines, "armnas_zfs_pool_free_bytes", "gauge", "Spazio libero nel pool",
+            [({"pool": pool["name"]}, pool["free"]) for pool in pools])
+    _family(lines, "armnas_zfs_pool_capacity_percent", "gauge", "Occupazione del pool (%)",
+            [({"pool": pool["name"]}, int(pool["capacity"]) if pool["capacity"].isdigit() else None)
+             for pool in pools])
+    _family(lines, "armnas_zfs_pool_health", "gauge", "Stato del pool (1 per lo stato attuale)",
+            [({"pool": pool["name"], "health": pool["health"]}, 1) for pool in pools])
+    _family(lines, "armnas_zfs_pool_online", "gauge", "1 se il pool è ONLINE",
+            [({"pool": pool["name"]}, int(pool["health"] == "ONLINE")) for pool in pools])
+
+    datasets = inventory["datasets"] or []
+    _family(lines, "armnas_zfs_dataset_used_bytes", "gauge", "Spazio usato dal dataset e dai discendenti",
+            [({"dataset": dataset["name"]}, dataset["used"]) for dataset in datasets])
+    _family(lines, "armnas_zfs_dataset_available_bytes", "gauge", "Spazio disponibile per il dataset",
+            [({"dataset": dataset["name"]}, dataset["available"]) for dataset in datasets])
+    _family(lines, "armnas_zfs_dataset_referenced_bytes", "gauge", "Dati referenziati dal dataset",
+            [({"dataset": dataset["name"]}, dataset["referenced"]) for dataset in datasets])
+
+    # arcstats è un file kstat: leggerlo non avvia processi
+    stats = read_arcstats(arc_collector.path)
+    if stats is None:
+        return
+    for field, name, description in (("size", "size_bytes", "Dimensione attuale dell'ARC"),
+                                      ("c", "target_bytes", "Dimensione obiettivo dell'ARC"),
+                                      ("c_max", "max_bytes", "Dimensione massima dell'ARC"),
+                                      ("l2_size", "l2_size_bytes", "Dati nella L2ARC")):
+        _family(lines, f"armnas_zfs_arc_{name}", "gauge", description, [({}, stats.get(field))])
+    for field, description in (("hits", "Accessi all'ARC trovati in cache"),
+                               ("misses", "Accessi all'ARC non trovati in cache"),
+                               ("l2_hits", "Accessi alla L2ARC trovati in cache"),
+                               ("l2_misses", "Accessi alla L2ARC non trovati in cache")):
+        _family(lines, f"armnas_zfs_arc_{field}_total", "counter", description, [({}, stats.get(field))])
+    latest = arc_collector.history.latest()
+    if latest is not None:
+        _family(lines, "armnas_zfs_arc_hit_ratio_percent", "gauge", "Hit ratio dell'ARC nell'ultimo intervallo (%)",
+                [({}, latest["hit_ratio"])])
+
+def _render_disks(lines: List[str]) -> None:
+    counters = sorted(diskstats_collector.counters().items())
+    for field, name, scale, description in (
+            ("reads", "reads_completed_total", 1, "Letture completate"),
+            ("writes", "writes_completed_total", 1, "Scritture completate"),
+            ("sectors_read", "read_bytes_total", DISKSTATS_SECTOR_SIZE, "Byte letti"),
+            ("sectors_written", "written_bytes_total", DISKSTATS_SECTOR_SIZE, "Byte scritti"),
+            ("read_ms", "read_time_seconds_total", 0.001, "Tempo speso nelle letture"),
+            ("write_ms", "write_time_seconds_total", 0.001, "Tempo speso nelle scritture"),
+            ("io_ms", "io_time_seconds_total", 0.001, "Tempo con I/O in corso")):
+        _family(lines, f"armnas_disk_{name}", "counter", description,
+                [({"device": device}, values[field] * scale) for device, values in counters])
+    _family(lines, "armnas_disk_io_now", "gauge", "Operazioni di I/O in corso",
+            [({"device": device}, values["in_flight"]) for device, values in counters])
+
+def _render_smart(lines: List[str]) -> None:
+    disks = sorted(smart_monitor.disks.values(), key=lambda disk: disk["device"])
+    _family(lines, "armnas_smart_status", "gauge", "Stato SMART del disco (1 per lo stato attuale)",
+            [({"device": disk["device"], "model": disk.get("model") or "", "status": disk["status"]}, 1)
+             for disk in disks])
+    _family(lines, "armnas_smart_passed", "gauge", "1 se il test di salute SMART è superato",
+            [({"device": disk["device"]}, None if disk.get("passed") is None else int(disk["passed"]))
+             for disk in disks])
+    for field, name in SMART_GAUGES.items():
+        _family(lines, name, "gauge", f"Valore SMART {field}",
+                [({"device": disk["device"]}, disk.get(field)) for disk in disks])
+    _family(lines, "armnas_smart_last_poll_timestamp_seconds", "gauge", "Ultima interrogazione SMART",
+            [({}, smart_monitor.last_poll)])
+
+def _render_services(lines: List[str]) -> None:
+    services = peek_services_status() or []
+    _family(lines, "armnas_service_active", "gauge", "1 se il servizio systemd è attivo",
+            [({"service": service["name"]}, int(service["active"])) for service in services])
+    _family(lines, "armnas_service_enabled", "gauge", "1 se il servizio systemd è abilitato all'avvio",
+            [({"service": service["name"]}, int(service["enabled"])) for service in services])
+    _family(lines, "armnas_service_memory_bytes", "gauge", "Memoria usata dal servizio",
+            [({"service": service["name"]}, service.get("memory")) for service in services])
+    _family(lines, "armnas_service_cpu_seconds_total", "counter", "Tempo CPU usato dal servizio",
+            [({"service": service["name"]},
+              service["cpu_usage_nsec"] / 1e9 if service.get("cpu_usage_nsec") is not None else None)
+             for service in services])
+
+def _render_containers(lines: List[str]) -> None:
+    containers = peek_container_stats()
+    if containers is None:
+        return
+    # docker stats elenca solo i container in esecuzione
+    names = sorted(set(containers) | {VDSM_CONTAINER})
+    _family(lines, "armnas_container_running", "gauge", "1 se il container è in esecuzione",
+            [({"container": name}, int(name in containers)) for name in names])
+    _family(lines, "armnas_container_cpu_percent", "gauge", "Utilizzo della CPU del container (%)",
+            [({"container": name}, stats["cpu_percent"]) for name, stats in sorted(containers.items())])
+    _family(lines, "armnas_container_memory_percent", "gauge", "Memoria usata dal container (%)",
+            [({"container": name}, stats["memory_percent"]) for name, stats in sorted(containers.items())])
+
+def render_metrics() -> str:
+    """
+    Restituisce tutte le metriche nel formato testo di Prometheus
+    """
+    lines: List[str] = []
+    _render_system(lines)
+    _render_zfs(lines)
+    _render_disks(lines)
+    _render_smart(lines)
+    _render_services(lines)
+    _render_containers(lines)
+    _family(lines, "armnas_metrics_store_series", "gauge", "Serie conservate nell'archivio delle metriche",
+            [({}, len(metrics_store.series))])
+    request_latency.render("armnas_http_request_duration_seconds", lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,409 @@
+"""
+Consigli su recordsize, special_small_blocks e compressione di un dataset
+
+La scansione parallela del mountpoint costruisce un istogramma delle dimensioni dei file
+(numero e byte per classe di dimensione) e calcola per ogni recordsize candidato lo spazio
+allocato e il numero di record. Da questi dati si ricavano i valori consigliati con una
+stima dell'impatto su spazio occupato e numero di operazioni di I/O.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from typing import List, Dict, Optional, Any
+
+from .fs_scanner import scan_tree, ScanControl, ScanCancelled, FileInfo, SCAN_WORKERS
+from .command_runner import start_task
+from .zfs_utils import get_zfs_bulk_properties, get_zfs_pool_status, parse_property_value
+
+logger = logging.getLogger(__name__)
+
+# Limiti di default della scansione: voci massime e voci al secondo
+ADVISOR_MAX_FILES = 1000000
+ADVISOR_MAX_RATE = 20000
+
+# Dimensione del settore assunta per l'allocazione (ashift=12)
+SECTOR_SIZE = 4096
+
+# Limiti superiori delle classi dell'istogramma: da 4K a 16M, poi "oltre"
+HISTOGRAM_BOUNDS = [2 ** exp for exp in range(12, 25)]
+
+CANDIDATE_RECORDSIZES = [16 * 1024, 32 * 1024, 64 * 1024, 128 * 1024, 256 * 1024, 512 * 1024, 1024 * 1024]
+
+SMALL_BLOCK_THRESHOLDS = [4 * 1024, 8 * 1024, 16 * 1024, 32 * 1024, 64 * 1024]
+
+# Quota massima dei dati che può finire sul vdev special con special_small_blocks
+SPECIAL_MAX_BYTES_SHARE = 0.05
+
+VM_IMAGE_EXTENSIONS = {".img", ".qcow2", ".vmdk", ".vdi", ".raw", ".vhd", ".vhdx"}
+DATABASE_EXTENSIONS = {".db", ".sqlite", ".sqlite3", ".ibd", ".mdb", ".accdb"}
+COMPRESSED_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".heif", ".avif",
+    ".mp4", ".mkv", ".mov", ".avi", ".webm", ".m4v", ".mp3", ".m4a", ".aac", ".flac", ".ogg", ".opus",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".rar", ".lz4", ".deb", ".rpm", ".iso",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".odt", ".epub"
+}
+
+_scans: Dict[str, "AdvisorScan"] = {}
+
+def _size_label(size: int) -> str:
+    for unit, factor in (("M", 1024 ** 2), ("K", 1024)):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return str(size)
+
+def _file_class(name: str) -> str:
+    ext = os.path.splitext(name)[1].lower()
+    if ext in VM_IMAGE_EXTENSIONS:
+        return "vm_image"
+    if ext in DATABASE_EXTENSIONS:
+        return "database"
+    if ext in COMPRESSED_EXTENSIONS:
+        return "compressed"
+    return "other"
+
+def allocated_size(size: int, recordsize: int, compressed: bool = False) -> int:
+    """
+    Spazio allocato da un file con un dato recordsize: i file più piccoli del recordsize
+    usano un solo blocco arrotondato al settore, gli altri blocchi interi. Con la compressione
+    attiva il riempimento dell'ultimo blocco (zeri) viene compresso e non occupa spazio.
+    """
+    if size <= recordsize:
+        return math.ceil(size / SECTOR_SIZE) * SECTOR_SIZE
+    if compressed:
+        return size // recordsize * recordsize + math.ceil(size % recordsize / SECTOR_SIZE) * SECTOR_SIZE
+    return math.ceil(size / recordsize) * recordsize
+
+class FileSizeStats:
+    """
+    Istogramma delle dimensioni dei file e totali per recordsize candidato (thread-safe)
+    """
+
+    def __init__(self, recordsizes: List[int] = CANDIDATE_RECORDSIZES):
+        # Candidati più il recordsize attuale del dataset, per confrontarli con lo stato di partenza
+        self.recordsizes = sorted(set(recordsizes))
+        self.files = 0.0
+        self.bytes = 0.0
+        self.histogram_files = [0.0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.histogram_bytes = [0.0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.allocated = {size: 0.0 for size in self.recordsizes}
+        self.allocated_uncompressed = {size: 0.0 for size in self.recordsizes}
+        self.records = {size: 0.0 for size in self.recordsizes}
+        self.small_files = {size: 0.0 for size in SMALL_BLOCK_THRESHOLDS}
+        self.small_bytes = {size: 0.0 for size in SMALL_BLOCK_THRESHOLDS}
+        self.class_bytes = {"vm_image": 0.0, "database": 0.0, "compressed": 0.0, "other": 0.0}
+        self._lock = threading.Lock()
+
+    def add_directory(self, path: str, files: List[FileInfo], subdirs: List[str], factor: float) -> None:
+        # Accumulo locale e fusione sotto lock: i thread si contendono il lock una volta per directory
+        histogram_files = [0] * len(self.histogram_files)
+        histogram_bytes = [0] * len(self.histogram_bytes)
+        allocated = dict.fromkeys(self.recordsizes, 0)
+        allocated_uncompressed = dict.fromkeys(self.recordsizes, 0)
+        records = dict.fromkeys(self.recordsizes, 0)
+        small_files = dict.fromkeys(SMALL_BLOCK_THRESHOLDS, 0)
+        small_bytes = dict.fromkeys(SMALL_BLOCK_THRESHOLDS, 0)
+        class_bytes = dict.fromkeys(self.class_bytes, 0)
+        total = 0
+
+        for name, size, _ in files:
+            total += size
+            bucket = next((i for i, bound in enumerate(HISTOGRAM_BOUNDS) if size <= bound), len(HISTOGRAM_BOUNDS))
+            histogram_files[bucket] += 1
+            histogram_bytes[bucket] += size
+            for recordsize in self.recordsizes:
+                allocated[recordsize] += allocated_size(size, recordsize, compressed=True)
+                allocated_uncompressed[recordsize] += allocated_size(size, recordsize)
+                records[recordsize] += math.ceil(size / recordsize)
+            for threshold in SMALL_BLOCK_THRESHOLDS:
+                if size <= threshold:
+                    small_files[threshold] += 1
+                    small_bytes[threshold] += allocated_size(size, threshold)
+            class_bytes[_file_class(name)] += size
+
+        with self._lock:
+            self.files += len(files) * factor
+            self.bytes += total * factor
+            for i in range(len(self.histogram_files)):
+                self.histogram_files[i] += histogram_files[i] * factor
+                self.histogram_bytes[i] += histogram_bytes[i] * factor
+            for recordsize in self.recordsizes:
+                self.allocated[recordsize] += allocated[recordsize] * factor
+                self.allocated_uncompressed[recordsize] += allocated_uncompressed[recordsize] * factor
+                self.records[recordsize] += records[recordsize] * factor
+            for threshold in SMALL_BLOCK_THRESHOLDS:
+                self.small_files[threshold] += small_files[threshold] * factor
+                self.small_bytes[threshold] += small_bytes[threshold] * factor
+            for key, value in class_bytes.items():
+                self.class_bytes[key] += value * factor
+
+    def histogram(self) -> List[Dict[str, Any]]:
+        result = []
+        lower = 0
+        for i, count in enumerate(self.histogram_files):
+            upper = HISTOGRAM_BOUNDS[i] if i < len(HISTOGRAM_BOUNDS) else None
+            result.append({
+                "label": f"<= {_size_label(upper)}" if upper else f"> {_size_label(lower)}",
+                "min": lower,
+                "max": upper,
+                "files": round(count),
+                "bytes": round(self.histogram_bytes[i])
+            })
+            lower = upper or lower
+        return result
+
+    def byte_weighted_median(self) -> Optional[int]:
+        """
+        Classe di dimensione che contiene la metà dei byte (il "file tipico" per i dati)
+        """
+        if not self.bytes:
+            return None
+        accumulated = 0.0
+        for i, value in enumerate(self.histogram_bytes):
+            accumulated += value
+            if accumulated >= self.bytes / 2:
+                return HISTOGRAM_BOUNDS[i] if i < len(HISTOGRAM_BOUNDS) else HISTOGRAM_BOUNDS[-1] * 2
+        return None
+
+def _share(part: float, total: float) -> float:
+    return round(part * 100 / total, 1) if total else 0.0
+
+def _impact(stats: FileSizeStats, current: int, recommended: int) -> Dict[str, Any]:
+    if current not in stats.allocated or recommended not in stats.allocated:
+        return {}
+    current_allocated = stats.allocated[current]
+    recommended_allocated = stats.allocated[recommended]
+    current_uncompressed = stats.allocated_uncompressed[current]
+    recommended_uncompressed = stats.allocated_uncompressed[recommended]
+    current_records = stats.records[current]
+    recommended_records = stats.records[recommended]
+    return {
+        # Stime con compressione attiva (consigliata) e senza compressione
+        "allocated_current": round(current_allocated),
+        "allocated_recommended": round(recommended_allocated),
+        "space_change_percent": round((recommended_allocated - current_allocated) * 100 / current_allocated, 1)
+        if current_allocated else 0.0,
+        "space_change_percent_uncompressed": round(
+            (recommended_uncompressed - current_uncompressed) * 100 / current_uncompressed, 1
+        ) if current_uncompressed else 0.0,
+        "records_current": round(current_records),
+        "records_recommended": round(recommended_records),
+        # Le letture/scritture sequenziali di interi file richiedono un'operazione per record
+        "sequential_iops_change_percent": round((recommended_records - current_records) * 100 / current_records, 1)
+        if current_records else 0.0,
+        # Una lettura casuale di 4K dentro un file grande legge un intero record
+        "random_read_amplification": recommended // SECTOR_SIZE
+    }
+
+def recommend(stats: FileSizeStats, current_recordsize: int, has_special_vdev: bool) -> Dict[str, Any]:
+    """
+    Calcola recordsize, special_small_blocks e compressione consigliati dalle statistiche
+    """
+    total = stats.bytes
+    vm_share = _share(stats.class_bytes["vm_image"], total)
+    db_share = _share(stats.class_bytes["database"], total)
+    compressed_share = _share(stats.class_bytes["compressed"], total)
+    median = stats.byte_weighted_median()
+
+    # recordsize
+    if not total:
+        recordsize, reason = current_recordsize, "Dataset vuoto: nessun dato su cui basare un consiglio"
+    elif vm_share >= 50:
+        recordsize = 64 * 1024
+        reason = (f"Il {vm_share}% dei dati sono immagini di macchine virtuali con I/O casuale: "
+                  "record da 64K riducono l'amplificazione di lettura/scrittura")
+    elif db_share >= 50:
+        recordsize = 16 * 1024
+        reason = f"Il {db_share}% dei dati sono database: record piccoli seguono le loro pagine"
+    elif median and median >= 1024 * 1024:
+        recordsize = 1024 * 1024
+        reason = (f"Metà dei dati è in file da oltre {_size_label(median // 2)}, letti e scritti in sequenza: "
+                  "record da 1M riducono metadati e operazioni di I/O")
+    else:
+        recordsize = 128 * 1024
+        reason = "Dati misti o file piccoli: il valore di default di 128K è adeguato"
+
+    # special_small_blocks: la soglia più alta che manda sul vdev special al massimo il 5% dei dati
+    special = 0
+    for threshold in SMALL_BLOCK_THRESHOLDS:
+        if threshold < recordsize and total and stats.small_bytes[threshold] <= total * SPECIAL_MAX_BYTES_SHARE:
+            special = threshold
+
+    special_reason = (
+        f"I file fino a {_size_label(special)} sono il {_share(stats.small_files[special], stats.files)}% "
+        f"dei file ma solo il {_share(stats.small_bytes[special], total)}% dello spazio"
+        if special else "Troppi dati in file piccoli per un vdev special"
+    )
+    if not has_special_vdev:
+        special_reason += " (richiede un vdev special nel pool)"
+
+    # compressione
+    if compressed_share >= 80:
+        compression = "lz4"
+        compression_reason = (f"Il {compressed_share}% dei dati è già compresso (foto, video, archivi): "
+                              "lz4 rinuncia subito ai blocchi incomprimibili")
+    elif compressed_share <= 30 and vm_share < 50:
+        compression = "zstd"
+        compression_reason = (f"Solo il {compressed_share}% dei dati è già compresso: zstd ottiene rapporti "
+                              "migliori di lz4 al costo di più CPU")
+    else:
+        compression = "lz4"
+        compression_reason = "Dati misti: lz4 offre il miglior compromesso tra CPU e spazio"
+
+    return {
+        "recordsize": {
+            "current": _size_label(current_recordsize),
+            "recommended": _size_label(recordsize),
+            "reason": reason,
+            "impact": _impact(stats, current_recordsize, recordsize)
+        },
+        "special_small_blocks": {
+            "recommended": _size_label(special) if special else "0",
+            "applicable": has_special_vdev and special > 0,
+            "files_percent": _share(stats.small_files[special], stats.files) if special else 0.0,
+            "bytes": round(stats.small_bytes[special]) if special else 0,
+            "reason": special_reason
+        },
+        "compression": {
+            "recommended": compression,
+            "compressed_percent": compressed_share,
+            "reason": compression_reason
+        }
+    }
+
+class AdvisorScan:
+    """
+    Scansione in background del mountpoint di un dataset
+    """
+
+    def __init__(self, dataset: str, mountpoint: str, current_recordsize: int, has_special_vdev: bool,
+                 workers: int, max_files: int, max_rate: float):
+        self.dataset = dataset
+        self.mountpoint = mountpoint
+        self.current_recordsize = current_recordsize
+        self.has_special_vdev = has_special_vdev
+        self.workers = workers
+        self.control = ScanControl(max_entries=max_files, max_rate=max_rate)
+        self.stats = FileSizeStats(CANDIDATE_RECORDSIZES + [current_recordsize])
+        self.state = "running"  # running, completed, failed, cancelled
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Future] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {
+            "dataset": self.dataset,
+            "mountpoint": self.mountpoint,
+            "state": self.state,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "directories": self.control.directories,
+            "entries": self.control.entries,
+            "truncated": self.control.truncated,
+            "files": round(self.stats.files),
+            "bytes": round(self.stats.bytes)
+        }
+        if self.state == "completed":
+            result["histogram"] = self.stats.histogram()
+            result["recommendations"] = recommend(self.stats, self.current_recordsize, self.has_special_vdev)
+        return result
+
+    async def run(self) -> None:
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, lambda: scan_tree(
+                self.mountpoint, self.stats.add_directory, self.control, self.workers
+            ))
+            self.state = "completed"
+        except ScanCancelled:
+            self.state = "cancelled"
+        except OSError as e:
+            self.state = "failed"
+            self.error = str(e)
+        except Exception as e:
+            logger.error(f"Errore nella scansione di {self.mountpoint}: {e}")
+            self.state = "failed"
+            self.error = str(e)
+        self.finished_at = time.time()
+
+async def start_recordsize_scan(dataset: str, workers: int = SCAN_WORKERS, max_files: int = ADVISOR_MAX_FILES,
+                                max_rate: float = ADVISOR_MAX_RATE) -> Dict[str, Any]:
+    """
+    Avvia la scansione del mountpoint di un dataset per i consigli su recordsize e compressione
+
+    Args:
+        dataset: Nome del dataset
+        workers: Numero di thread di scansione
+        max_files: Numero massimo di voci esaminate (oltre, il risultato è su un campione parziale)
+        max_rate: Voci al secondo massime, per non rallentare il NAS
+
+    Returns:
+        Dizionario con success e lo stato della scansione
+    """
+    existing = _scans.get(dataset)
+    if existing is not None and existing.state == "running":
+        return {
+            "success": False,
+            "error": f"Una scansione di '{dataset}' è già in corso"
+        }
+
+    result = await get_zfs_bulk_properties([dataset], ["mountpoint", "mounted", "recordsize"])
+    if not result["success"] or dataset in result["errors"]:
+        return {
+            "success": False,
+            "error": result.get("error") or result["errors"].get(dataset)
+        }
+
+    properties = result["properties"][dataset]
+    mountpoint = (properties.get("mountpoint") or {}).get("value")
+    mounted = (properties.get("mounted") or {}).get("value")
+    if not mountpoint or not str(mountpoint).startswith("/") or mounted != "yes":
+        return {
+            "success": False,
+            "error": f"Il dataset '{dataset}' non è montato"
+        }
+
+    recordsize = parse_property_value((properties.get("recordsize") or {}).get("raw", "131072"))
+    pool = dataset.split("/", 1)[0]
+    status = await get_zfs_pool_status(pool)
+    has_special = bool(status.get("success") and status["pool"] and status["pool"].get("special"))
+
+    scan = AdvisorScan(dataset, mountpoint, recordsize or 131072, has_special,
+                       max(1, min(workers, 16)), max_files, max_rate)
+    _scans[dataset] = scan
+    scan.task = start_task(scan.run())
+
+    return {
+        "success": True,
+        "message": f"Scansione di '{mountpoint}' avviata",
+        "scan": scan.to_dict()
+    }
+
+def get_recordsize_scan(dataset: str) -> Optional[Dict[str, Any]]:
+    """
+    Restituisce avanzamento e, a scansione completata, istogramma e consigli (None se non esiste)
+    """
+    scan = _scans.get(dataset)
+    return scan.to_dict() if scan is not None else None
+
+def cancel_recordsize_scan(dataset: str) -> Dict[str, Any]:
+    """
+    Annulla la scansione in corso di un dataset
+    """
+    scan = _scans.get(dataset)
+    if scan is None or scan.state != "running":
+        return {
+            "success": False,
+            "error": f"Nessuna scansione in corso per '{dataset}'"
+        }
+
+    scan.control.cancel()
+    return {
+        "success": True,
+        "message": f"Scansione di '{dataset}' annullata"
+    }
@@ -0,0 +1,111 @@
+"""
+Buffer circolare compatto per serie temporali numeriche
+
+Ogni campo è una colonna `array('d')` a dimensione fissa: la memoria occupata non cresce
+con il tempo di attività e un campione costa 8 byte per campo invece di un dizionario Python.
+"""
+
+import math
+from array import array
+from typing import List, Dict, Optional, Any
+
+class RingBuffer:
+    """
+    Serie temporale a capacità fissa: i campioni più vecchi vengono sovrascritti.
+    I valori None vengono memorizzati come NaN e restituiti di nuovo come None.
+    """
+
+    def __init__(self, fields: List[str], capacity: int):
+        self.fields = list(fields)
+        self.capacity = capacity
+        self._columns = {field: array("d", [math.nan]) * capacity for field in self.fields}
+        # Posizione del prossimo campione e numero di campioni validi
+        self._head = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, values: Dict[str, Optional[float]]) -> None:
+        """
+        Aggiunge un campione (i campi mancanti diventano None)
+        """
+        for field, column in self._columns.items():
+            value = values.get(field)
+            column[self._head] = math.nan if value is None else value
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def clear(self) -> None:
+        self._head = 0
+        self._count = 0
+
+    def _positions(self, limit: Optional[int]) -> range:
+        count = self._count if not limit else min(limit, self._count)
+        start = self._head - count
+        return range(start, self._head)
+
+    @staticmethod
+    def _value(value: float) -> Optional[float]:
+        if math.isnan(value):
+            return None
+        return int(value) if value.is_integer() else value
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """
+        Restituisce l'ultimo campione (None se il buffer è vuoto)
+        """
+        items = self.to_list(1)
+        return items[0] if items else None
+
+    def to_list(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Restituisce gli ultimi campioni (tutti se limit è None), dal più vecchio al più recente
+        """
+        return [
+            {field: self._value(column[position]) for field, column in self._columns.items()}
+            for position in self._positions(limit)
+        ]
+
+    def column(self, field: str, limit: Optional[int] = None) -> List[Optional[float]]:
+        """
+        Restituisce i valori di un solo campo, dal più vecchio al più recente
+        """
+        column = self._columns[field]
+        return [self._value(column[position]) for position in self._positions(limit)]
+
+    def mean(self, field: str, limit: Optional[int] = None) -> Optional[float]:
+        """
+        Media degli ultimi valori di un campo (i None vengono ignorati, None se non ce ne sono)
+        """
+        column = self._columns[field]
+        values = [column[position] for position in self._positions(limit)]
+        values = [value for value in values if not math.isnan(value)]
+        return sum(values) / len(values) if values else None
+
+    def export_columns(self, limit: Optional[int] = None) -> Dict[str, array]:
+        """
+        Restituisce una copia delle colonne in ordine cronologico (per il salvataggio su disco),
+        limitata agli ultimi `limit` campioni se indicato
+        """
+        positions = self._positions(limit) if limit != 0 else range(0)
+        return {field: array("d", (column[position] for position in positions))
+                for field, column in self._columns.items()}
+
+    def load_columns(self, columns: Dict[str, array]) -> None:
+        """
+        Sostituisce il contenuto con colonne in ordine cronologico (inverso di export_columns).
+        Se le colonne hanno più campioni della capacità restano i più recenti.
+        """
+        count = min(min((len(values) for values in columns.values()), default=0), self.capacity)
+        self.clear()
+        if count == 0:
+            return
+        for field, column in self._columns.items():
+            values = columns.get(field)
+            if values is None:
+                column[:count] = array("d", [math.nan]) * count
+            else:
+                column[:count] = array("d", values[len(values) - count:])
+        self._head = count % self.capacity
+        self._count = count
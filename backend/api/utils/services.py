@@ -0,0 +1,156 @@
+"""
+Stato dei servizi systemd con una sola chiamata a systemctl
+
+Un solo `systemctl show -p ... unità...` restituisce stato, abilitazione, PID, memoria e
+tempo CPU di tutti i servizi monitorati, invece di due processi (is-active e is-enabled)
+per ogni servizio. Il risultato resta in cache per pochi secondi e viene invalidato
+dopo start/stop/restart; l'utilizzo CPU è calcolato sulla differenza tra due letture.
+"""
+
+import logging
+import time
+from typing import List, Dict, Optional, Any, Tuple
+
+from .command_runner import run_command
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Servizi mostrati nella dashboard
+MONITORED_SERVICES = [
+    "armnas-backend",
+    "nginx",
+    "smbd",
+    "vsftpd",
+    "ssh",
+    "docker"
+]
+
+# Durata (secondi) della cache dello stato dei servizi
+SERVICES_TTL = 5
+
+SERVICE_PROPERTIES = ["Id", "LoadState", "ActiveState", "SubState", "UnitFileState",
+                      "MainPID", "MemoryCurrent", "CPUUsageNSec"]
+
+# Stati di UnitFileState per cui `systemctl is-enabled` restituisce successo
+ENABLED_STATES = {"enabled", "enabled-runtime", "static", "alias", "indirect", "generated", "transient"}
+
+# systemd usa UINT64_MAX per "non disponibile" (accounting disattivato)
+_UINT64_MAX = 2 ** 64 - 1
+
+_services_cache = TTLCache(SERVICES_TTL)
+
+# Unità -> (CPUUsageNSec, istante della lettura) per il calcolo dell'utilizzo CPU
+_cpu_samples: Dict[str, Tuple[int, float]] = {}
+
+def parse_systemctl_show(output: str) -> List[Dict[str, str]]:
+    """
+    Analizza l'output di `systemctl show` con più unità: un blocco CHIAVE=valore per unità,
+    separato da una riga vuota, nello stesso ordine delle unità richieste
+    """
+    blocks: List[Dict[str, str]] = []
+    current: Dict[str, str] = {}
+    for line in output.splitlines():
+        if not line.strip():
+            if current:
+                blocks.append(current)
+                current = {}
+            continue
+        key, separator, value = line.partition("=")
+        if separator:
+            current[key] = value
+    if current:
+        blocks.append(current)
+    return blocks
+
+def _to_counter(value: Optional[str]) -> Optional[int]:
+    if not value or not value.isdigit():
+        return None
+    number = int(value)
+    return None if number == _UINT64_MAX else number
+
+def _service_entry(name: str, properties: Dict[str, str], now: float) -> Dict[str, Any]:
+    active_state = properties.get("ActiveState", "unknown")
+    unit_file_state = properties.get("UnitFileState", "")
+    cpu_nsec = _to_counter(properties.get("CPUUsageNSec"))
+    main_pid = _to_counter(properties.get("MainPID"))
+
+    cpu_percent = None
+    previous = _cpu_samples.get(name)
+    if cpu_nsec is not None:
+        if previous is not None and now > previous[1] and cpu_nsec >= previous[0]:
+            cpu_percent = round((cpu_nsec - previous[0]) / ((now - previous[1]) * 1e9) * 100, 1)
+        _cpu_samples[name] = (cpu_nsec, now)
+
+    active = active_state in ("active", "reloading")
+    return {
+        "name": name,
+        "unit": properties.get("Id") or name,
+        "active": active,
+        "enabled": unit_file_state in ENABLED_STATES,
+        "status": "running" if active else ("unknown" if properties.get("LoadState") == "not-found" else "stopped"),
+        "load_state": properties.get("LoadState"),
+        "active_state": active_state,
+        "sub_state": properties.get("SubState"),
+        "unit_file_state": unit_file_state or None,
+        "main_pid": main_pid or None,
+        "memory": _to_counter(properties.get("MemoryCurrent")),
+        "cpu_usage_nsec": cpu_nsec,
+        "cpu_percent": cpu_percent
+    }
+
+async def _load_services(services: Tuple[str, ...]) -> Optional[List[Dict[str, Any]]]:
+    result = await run_command(["systemctl", "show", "--no-pager", "-p", ",".join(SERVICE_PROPERTIES),
+                                *services])
+    if not result["success"]:
+        logger.error(f"Errore in systemctl show: {result['error']}")
+        return None
+
+    blocks = parse_systemctl_show(result["output"])
+    if len(blocks) != len(services):
+        logger.error(f"Output di systemctl show inatteso: {len(blocks)} unità invece di {len(services)}")
+        return None
+
+    now = time.monotonic()
+    return [_service_entry(name, properties, now) for name, properties in zip(services, blocks)]
+
+async def get_services_status(services: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Restituisce stato, abilitazione, memoria e CPU dei servizi (dalla cache se ancora valida)
+
+    Returns:
+        Una voce per servizio; se systemctl non risponde lo stato è "unknown"
+    """
+    services = tuple(services or MONITORED_SERVICES)
+    entries = await _services_cache.get_or_load(services, lambda: _load_services(services))
+    if entries is None:
+        return [{
+            "name": name,
+            "active": False,
+            "enabled": False,
+            "status": "unknown"
+        } for name in services]
+    return entries
+
+def peek_services_status() -> Optional[List[Dict[str, Any]]]:
+    """
+    Ultimo stato noto dei servizi monitorati, senza eseguire systemctl (None se mai letto)
+    """
+    return _services_cache.peek(tuple(MONITORED_SERVICES))
+
+async def get_service_metrics() -> Dict[str, Optional[float]]:
+    """
+    Stato, memoria e CPU dei servizi per l'archivio delle metriche
+    """
+    metrics: Dict[str, Optional[float]] = {}
+    for entry in await get_services_status():
+        metrics[f"{entry['name']}.active"] = int(entry["active"])
+        metrics[f"{entry['name']}.memory"] = entry.get("memory")
+        metrics[f"{entry['name']}.cpu_percent"] = entry.get("cpu_percent")
+    return metrics
+
+def invalidate_services() -> None:
+    """
+    Invalida lo stato in cache (da chiamare dopo start/stop/restart di un servizio)
+    """
+    _services_cache.invalidate()
@@ -0,0 +1,309 @@
+"""
+Stato di salute SMART di tutti i dischi
+
+Un monitor in background interroga periodicamente tutti i dischi in parallelo con
+`smartctl -j -a -n standby` (i dischi in standby non vengono risvegliati), estrae gli
+attributi rilevanti (settori riallocati e in attesa, errori CRC, temperatura, usura NVMe),
+conserva l'ultimo risultato e una breve serie storica per disco in un RingBuffer, usata
+per segnalare i contatori in aumento. Le route leggono solo lo stato in memoria.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import List, Dict, Optional, Any
+
+from .block_devices import get_block_devices
+from .command_runner import run_command
+from .ringbuffer import RingBuffer
+
+logger = logging.getLogger(__name__)
+
+# Intervallo di interrogazione (secondi) e campioni conservati per disco (una settimana)
+SMART_POLL_INTERVAL = 1800
+SMART_HISTORY = 336
+
+# Timeout (secondi) di una singola esecuzione di smartctl
+SMART_TIMEOUT = 60
+
+# Temperature (°C) oltre le quali il disco viene segnalato
+SMART_TEMPERATURE_WARNING = 55
+
+# Usura NVMe (percentage_used) oltre la quale il disco viene segnalato
+SMART_WEAR_WARNING = 90
+
+# Bit dell'exit status di smartctl (vedi smartctl(8), sezione EXIT STATUS)
+SMARTCTL_OPEN_FAILED = 1 << 1
+SMARTCTL_DISK_FAILING = 1 << 3
+SMARTCTL_PREFAIL = 1 << 4
+
+# Dispositivi senza SMART
+SMART_SKIP_PREFIXES = ("zram", "loop", "ram", "mmcblk", "nbd")
+
+SMART_FIELDS = [
+    "timestamp", "passed", "temperature", "power_on_hours",
+    "reallocated_sectors", "pending_sectors", "offline_uncorrectable", "crc_errors",
+    "percentage_used", "available_spare", "media_errors"
+]
+
+# Contatori che non dovrebbero mai aumentare: un incremento indica un disco in degrado
+SMART_TREND_COUNTERS = ["reallocated_sectors", "pending_sectors", "offline_uncorrectable",
+                        "crc_errors", "media_errors"]
+
+# Attributi ATA (id -> campo)
+ATA_ATTRIBUTES = {
+    5: "reallocated_sectors",
+    9: "power_on_hours",
+    197: "pending_sectors",
+    198: "offline_uncorrectable",
+    199: "crc_errors"
+}
+
+def _ata_raw(attribute: Dict[str, Any]) -> Optional[int]:
+    raw = attribute.get("raw") or {}
+    value = raw.get("value")
+    if attribute.get("id") in (9, 194, 190) and isinstance(raw.get("string"), str):
+        # Ore e temperatura: alcuni dischi impacchettano altri valori nei byte alti
+        first = raw["string"].split()[0].rstrip("h")
+        if first.isdigit():
+            return int(first)
+    return value if isinstance(value, int) else None
+
+def parse_smartctl_json(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Estrae dall'output JSON di `smartctl -j -a` le informazioni di salute di un disco
+    """
+    smartctl = data.get("smartctl") or {}
+    exit_status = smartctl.get("exit_status") or 0
+    messages = [message.get("string", "") for message in smartctl.get("messages", [])]
+    device = data.get("device") or {}
+
+    result: Dict[str, Any] = {
+        "protocol": device.get("protocol"),
+        "model": data.get("model_name") or data.get("model_family"),
+        "serial": data.get("serial_number"),
+        "firmware": data.get("firmware_version"),
+        "capacity": (data.get("user_capacity") or {}).get("bytes"),
+        "passed": (data.get("smart_status") or {}).get("passed"),
+        "temperature": (data.get("temperature") or {}).get("current"),
+        "power_on_hours": (data.get("power_on_time") or {}).get("hours"),
+        "reallocated_sectors": None,
+        "pending_sectors": None,
+        "offline_uncorrectable": None,
+        "crc_errors": None,
+        "percentage_used": None,
+        "available_spare": None,
+        "media_errors": None,
+        "failing_attributes": [],
+        "exit_status": exit_status,
+        "messages": messages
+    }
+
+    table = (data.get("ata_smart_attributes") or {}).get("table") or []
+    attributes = []
+    for attribute in table:
+        attribute_id = attribute.get("id")
+        raw_value = _ata_raw(attribute)
+        attributes.append({
+            "id": attribute_id,
+            "name": attribute.get("name"),
+            "value": attribute.get("value"),
+            "worst": attribute.get("worst"),
+            "thresh": attribute.get("thresh"),
+            "raw": raw_value,
+            "when_failed": attribute.get("when_failed") or ""
+        })
+        if attribute_id in ATA_ATTRIBUTES:
+            result[ATA_ATTRIBUTES[attribute_id]] = raw_value
+        elif attribute_id in (194, 190) and result["temperature"] is None:
+            result["temperature"] = raw_value
+        if attribute.get("when_failed"):
+            result["failing_attributes"].append(attribute.get("name"))
+    result["attributes"] = attributes
+
+    nvme = data.get("nvme_smart_health_information_log")
+    if nvme:
+        result["percentage_used"] = nvme.get("percentage_used")
+        result["available_spare"] = nvme.get("available_spare")
+        result["media_errors"] = nvme.get("media_errors")
+        if result["temperature"] is None:
+            result["temperature"] = nvme.get("temperature")
+        if result["power_on_hours"] is None:
+            result["power_on_hours"] = nvme.get("power_on_hours")
+        if nvme.get("critical_warning"):
+            result["failing_attributes"].append(f"critical_warning=0x{nvme['critical_warning']:02x}")
+
+    return result
+
+def classify_health(info: Dict[str, Any], trends: List[str]) -> str:
+    """
+    Riassume lo stato di un disco: failing, warning oppure ok
+    """
+    if info.get("passed") is False or info.get("exit_status", 0) & SMARTCTL_DISK_FAILING:
+        return "failing"
+    if (info.get("failing_attributes") or trends or
+            info.get("exit_status", 0) & SMARTCTL_PREFAIL or
+            any(info.get(field) for field in ("reallocated_sectors", "pending_sectors",
+                                              "offline_uncorrectable", "media_errors")) or
+            (info.get("temperature") or 0) >= SMART_TEMPERATURE_WARNING or
+            (info.get("percentage_used") or 0) >= SMART_WEAR_WARNING):
+        return "warning"
+    return "ok"
+
+def detect_trends(history: RingBuffer) -> List[str]:
+    """
+    Restituisce i contatori di errore aumentati nell'arco della storia conservata
+    """
+    trends = []
+    for field in SMART_TREND_COUNTERS:
+        values = [value for value in history.column(field) if value is not None]
+        if len(values) >= 2 and values[-1] > values[0]:
+            trends.append(field)
+    return trends
+
+def _is_standby(data: Dict[str, Any]) -> bool:
+    messages = (data.get("smartctl") or {}).get("messages", [])
+    return any("STANDBY" in message.get("string", "").upper() or
+               "SLEEP" in message.get("string", "").upper() for message in messages)
+
+class SmartMonitor:
+    """
+    Interrogazione periodica e parallela di smartctl con ultimo risultato e storia per disco
+    """
+
+    def __init__(self, interval: float = SMART_POLL_INTERVAL, history: int = SMART_HISTORY):
+        self.interval = interval
+        self.history_size = history
+        self.disks: Dict[str, Dict[str, Any]] = {}
+        self.history: Dict[str, RingBuffer] = {}
+        self.last_poll: Optional[float] = None
+        self._poll_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Errore nell'interrogazione SMART: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _query(self, device: Dict[str, Any]) -> Dict[str, Any]:
+        path = device["path"]
+        result = await run_command(["smartctl", "-j", "-a", "-n", "standby", path],
+                                   timeout=SMART_TIMEOUT, check=False)
+        base = {
+            "device": path,
+            "name": device["name"],
+            "model": device["model"],
+            "serial": device["serial"],
+            "rotational": device["rotational"],
+            "updated": time.time()
+        }
+
+        try:
+            data = json.loads(result["output"] or "")
+        except ValueError:
+            return {**base, "status": "unavailable", "error": result["error"] or "Output di smartctl non valido"}
+
+        if _is_standby(data):
+            return {**base, "status": "standby"}
+
+        exit_status = (data.get("smartctl") or {}).get("exit_status") or 0
+        if exit_status & SMARTCTL_OPEN_FAILED:
+            messages = [message.get("string", "") for message in (data.get("smartctl") or {}).get("messages", [])]
+            return {**base, "status": "unavailable", "error": "; ".join(messages) or result["error"]}
+
+        # Modello e seriale restano quelli di lsblk, coerenti con le altre viste dei dischi
+        return {**parse_smartctl_json(data), **base, "status": None}
+
+    def _record(self, entry: Dict[str, Any]) -> None:
+        path = entry["device"]
+        previous = self.disks.get(path)
+
+        if entry["status"] == "standby" and previous is not None and "passed" in previous:
+            # Il disco dorme: si mantengono gli ultimi valori letti
+            self.disks[path] = {**previous, "status_detail": "standby", "standby_since": entry["updated"]}
+            return
+
+        if entry["status"] is None:
+            history = self.history.get(path)
+            if history is None:
+                history = self.history[path] = RingBuffer(SMART_FIELDS, self.history_size)
+            sample = {field: entry.get(field) for field in SMART_FIELDS}
+            sample["timestamp"] = entry["updated"]
+            sample["passed"] = None if entry.get("passed") is None else int(entry["passed"])
+            history.append(sample)
+
+            entry["trends"] = detect_trends(history)
+            entry["status"] = classify_health(entry, entry["trends"])
+            entry["status_detail"] = "active"
+
+        self.disks[path] = entry
+
+    async def poll(self) -> Dict[str, Any]:
+        """
+        Interroga in parallelo tutti i dischi e aggiorna lo stato in memoria
+        """
+        async with self._poll_lock:
+            inventory = await get_block_devices()
+            disks = [device for device in inventory.disks()
+                     if not device["name"].startswith(SMART_SKIP_PREFIXES)]
+
+            results = await asyncio.gather(*(self._query(device) for device in disks), return_exceptions=True)
+            for device, entry in zip(disks, results):
+                if isinstance(entry, Exception):
+                    logger.error(f"Errore nella lettura SMART di {device['path']}: {entry}")
+                    continue
+                self._record(entry)
+
+            # I dischi scollegati escono dallo stato (la storia resta per un eventuale ricollegamento)
+            present = {device["path"] for device in disks}
+            for path in list(self.disks):
+                if path not in present:
+                    del self.disks[path]
+
+            self.last_poll = time.time()
+            return self.get_summary()
+
+    def get_summary(self) -> Dict[str, Any]:
+        """
+        Restituisce l'ultimo stato noto di tutti i dischi (senza eseguire comandi)
+        """
+        disks = sorted(self.disks.values(), key=lambda disk: disk["device"])
+        return {
+            "last_poll": self.last_poll,
+            "interval": self.interval,
+            "disks": [{key: value for key, value in disk.items() if key != "attributes"} for disk in disks]
+        }
+
+    def get_disk(self, device: str, limit: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Restituisce lo stato completo di un disco (attributi inclusi) e la sua storia
+        """
+        disk = self.disks.get(device)
+        if disk is None:
+            return None
+        history = self.history.get(device)
+        return {
+            **disk,
+            "history": history.to_list(limit) if history is not None else []
+        }
+
+# Istanza condivisa, avviata all'avvio dell'applicazione
+smart_monitor = SmartMonitor()
@@ -0,0 +1,474 @@
+"""
+Indice dello spazio occupato per directory, aggiornato in modo incrementale con `zfs diff`
+
+La prima costruzione crea uno snapshot di riferimento (ancora) e scansiona il mountpoint
+con lo scanner parallelo, registrando per ogni directory i byte allocati dai suoi file.
+Gli aggiornamenti successivi creano un nuovo snapshot, chiedono a `zfs diff` quali percorsi
+sono cambiati rispetto all'ancora e rileggono solo le directory coinvolte: su un disco USB
+da diversi terabyte un aggiornamento costa secondi invece delle ore di un `du` completo.
+
+Finché esiste, lo snapshot di riferimento trattiene i dati cancellati dopo la sua creazione:
+ogni aggiornamento lo sostituisce con uno nuovo.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import List, Dict, Optional, Any, Set, Tuple
+
+from .command_runner import run_command, start_task
+from .fs_scanner import scan_tree, ScanControl, ScanCancelled, FileInfo, SCAN_WORKERS
+from .zfs_utils import get_zfs_bulk_properties, invalidate_zfs_inventory
+
+logger = logging.getLogger(__name__)
+
+# Prefisso degli snapshot di riferimento creati per l'indice
+SPACE_SNAPSHOT_PREFIX = "armnas-space-"
+
+# Timeout (secondi) di zfs diff su dataset molto grandi
+ZFS_DIFF_TIMEOUT = 3600
+
+# Nome del nodo che raggruppa le directory oltre il limite del treemap
+OTHER_NODE_NAME = "(altro)"
+
+_indexes: Dict[str, "SpaceIndex"] = {}
+
+def _unescape_diff_path(path: str) -> str:
+    # zfs diff codifica i caratteri non stampabili (spazi inclusi) come \\ooo in ottale
+    if "\\" not in path:
+        return path
+    raw = re.sub(rb"\\([0-7]{3})", lambda m: bytes([int(m.group(1), 8)]), path.encode())
+    return raw.decode("utf-8", errors="replace")
+
+def parse_zfs_diff(output: str) -> List[Tuple[str, str, str, Optional[str]]]:
+    """
+    Analizza l'output di `zfs diff -H -F` in (modifica, tipo, percorso, nuovo percorso)
+
+    modifica: "+" creato, "-" rimosso, "M" modificato, "R" rinominato
+    tipo: "F" file, "/" directory, "@" link simbolico, ...
+    """
+    changes = []
+    for line in output.splitlines():
+        parts = line.split("\t")
+        if len(parts) < 3:
+            continue
+        new_path = _unescape_diff_path(parts[3]) if len(parts) > 3 else None
+        changes.append((parts[0], parts[1], _unescape_diff_path(parts[2]), new_path))
+    return changes
+
+class SpaceIndex:
+    """
+    Spazio occupato dai file di ogni directory di un dataset (percorsi relativi al mountpoint)
+    """
+
+    def __init__(self, dataset: str, mountpoint: str):
+        self.dataset = dataset
+        self.mountpoint = mountpoint.rstrip("/") or "/"
+        # percorso relativo -> [byte allocati, byte apparenti, numero di file] dei soli file diretti
+        self.dirs: Dict[str, List[float]] = {}
+        self.children: Dict[str, Set[str]] = {}
+        self.anchor: Optional[str] = None
+        self.state = "idle"  # idle, building, refreshing, ready, failed
+        self.error: Optional[str] = None
+        self.built_at: Optional[float] = None
+        self.refreshed_at: Optional[float] = None
+        self.last_changes = 0
+        self.control: Optional[ScanControl] = None
+        # Task di costruzione o aggiornamento in corso
+        self.task: Optional[asyncio.Future] = None
+        self._totals: Optional[Dict[str, List[float]]] = None
+        self._lock = threading.Lock()
+
+    def _relative(self, path: str) -> Optional[str]:
+        if path == self.mountpoint:
+            return ""
+        prefix = self.mountpoint if self.mountpoint.endswith("/") else self.mountpoint + "/"
+        if not path.startswith(prefix):
+            return None
+        return path[len(prefix):]
+
+    def _absolute(self, relative: str) -> str:
+        return os.path.join(self.mountpoint, relative) if relative else self.mountpoint
+
+    def add_directory(self, path: str, files: List[FileInfo], subdirs: List[str], factor: float) -> None:
+        relative = self._relative(path)
+        if relative is None:
+            return
+        allocated = sum(info[2] for info in files)
+        size = sum(info[1] for info in files)
+        with self._lock:
+            self.dirs[relative] = [allocated, size, len(files)]
+            self.children.setdefault(relative, set())
+            if relative:
+                self.children.setdefault(os.path.dirname(relative), set()).add(relative)
+            self._totals = None
+
+    def remove_subtree(self, relative: str) -> None:
+        with self._lock:
+            pending = [relative]
+            while pending:
+                current = pending.pop()
+                self.dirs.pop(current, None)
+                pending.extend(self.children.pop(current, ()))
+            if relative:
+                self.children.get(os.path.dirname(relative), set()).discard(relative)
+            self._totals = None
+
+    def move_subtree(self, relative: str, new_relative: str) -> None:
+        # Directory rinominata: il contenuto non cambia, cambiano solo i percorsi
+        with self._lock:
+            moved = {}
+            pending = [relative]
+            while pending:
+                current = pending.pop()
+                suffix = current[len(relative):]
+                if current in self.dirs:
+                    moved[new_relative + suffix] = (self.dirs.pop(current),
+                                                    {new_relative + child[len(relative):]
+                                                     for child in self.children.get(current, ())})
+                pending.extend(self.children.pop(current, ()))
+            if relative:
+                self.children.get(os.path.dirname(relative), set()).discard(relative)
+            for path, (values, children) in moved.items():
+                self.dirs[path] = values
+                self.children[path] = children
+            if moved and new_relative:
+                self.children.setdefault(os.path.dirname(new_relative), set()).add(new_relative)
+            self._totals = None
+
+    def totals(self) -> Dict[str, List[float]]:
+        """
+        Totali per sottoalbero (ricalcolati solo dopo una modifica dell'indice)
+        """
+        with self._lock:
+            if self._totals is not None:
+                return self._totals
+            totals = {path: list(values) for path, values in self.dirs.items()}
+            # Dal più profondo alla radice: ogni directory somma il proprio totale al genitore
+            for path in sorted(totals, key=lambda p: p.count("/") if p else -1, reverse=True):
+                if not path:
+                    continue
+                parent = os.path.dirname(path)
+                if parent in totals:
+                    for i in range(3):
+                        totals[parent][i] += totals[path][i]
+            self._totals = totals
+            return totals
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            "dataset": self.dataset,
+            "mountpoint": self.mountpoint,
+            "state": self.state,
+            "error": self.error,
+            "anchor": self.anchor,
+            "directories": len(self.dirs),
+            "built_at": self.built_at,
+            "refreshed_at": self.refreshed_at,
+            "last_changes": self.last_changes,
+            "scanned_entries": self.control.entries if self.control else 0
+        }
+
+    def treemap(self, path: str = "", depth: int = 2, limit: int = 20) -> Optional[Dict[str, Any]]:
+        """
+        Restituisce il sottoalbero di path fino a depth livelli, con al massimo limit figli
+        per nodo (i più grandi; gli altri vengono sommati in un nodo "(altro)")
+        """
+        relative = path.strip("/")
+        totals = self.totals()
+        if relative not in totals:
+            return None
+        return self._node(relative, totals, depth, limit)
+
+    def _node(self, relative: str, totals: Dict[str, List[float]], depth: int, limit: int) -> Dict[str, Any]:
+        allocated, size, files = totals[relative]
+        own = self.dirs.get(relative, [0, 0, 0])
+        node = {
+            "name": os.path.basename(relative) or self.dataset,
+            "path": "/" + relative,
+            "allocated": int(allocated),
+            "size": int(size),
+            "files": int(files),
+            "own_allocated": int(own[0]),
+            "children": []
+        }
+        if depth <= 0:
+            return node
+
+        with self._lock:
+            children = list(self.children.get(relative, ()))
+        children.sort(key=lambda p: totals.get(p, [0])[0], reverse=True)
+        for child in children[:limit]:
+            if child in totals:
+                node["children"].append(self._node(child, totals, depth - 1, limit))
+
+        rest = [totals[child] for child in children[limit:] if child in totals]
+        if rest:
+            node["children"].append({
+                "name": OTHER_NODE_NAME,
+                "path": None,
+                "allocated": int(sum(values[0] for values in rest)),
+                "size": int(sum(values[1] for values in rest)),
+                "files": int(sum(values[2] for values in rest)),
+                "own_allocated": 0,
+                "directories": len(rest),
+                "children": []
+            })
+        return node
+
+    def _rescan_directory(self, relative: str) -> None:
+        # Rilettura non ricorsiva: aggiorna solo i file diretti della directory
+        path = self._absolute(relative)
+        files: List[FileInfo] = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            files.append((entry.name, st.st_size, st.st_blocks * 512))
+                    except OSError:
+                        continue
+        except OSError:
+            # La directory non esiste più
+            self.remove_subtree(relative)
+            return
+        self.add_directory(path, files, [], 1.0)
+
+    def apply_changes(self, changes: List[Tuple[str, str, str, Optional[str]]], workers: int) -> None:
+        """
+        Aggiorna l'indice con le modifiche di zfs diff (funzione bloccante, da eseguire in un thread)
+        """
+        dirty: Set[str] = set()
+        new_trees: Set[str] = set()
+
+        for change, kind, path, new_path in changes:
+            relative = self._relative(path)
+            if relative is None:
+                continue
+            new_relative = self._relative(new_path) if new_path else None
+
+            if kind == "/":
+                if change == "-":
+                    self.remove_subtree(relative)
+                elif change == "+":
+                    new_trees.add(relative)
+                elif change == "R":
+                    if new_relative is not None:
+                        self.move_subtree(relative, new_relative)
+                        dirty.add(os.path.dirname(new_relative))
+                    else:
+                        self.remove_subtree(relative)
+                else:
+                    # Directory modificata: cambiano le sue voci, rileggi i file diretti
+                    dirty.add(relative)
+                if relative:
+                    dirty.add(os.path.dirname(relative))
+            else:
+                dirty.add(os.path.dirname(relative))
+                if new_relative is not None:
+                    dirty.add(os.path.dirname(new_relative))
+
+        # Nuove directory: scansione completa del sottoalbero (solo le radici dei nuovi rami)
+        for relative in sorted(new_trees):
+            if any(relative.startswith(other + "/") for other in new_trees if other != relative):
+                continue
+            if os.path.isdir(self._absolute(relative)):
+                self.remove_subtree(relative)
+                scan_tree(self._absolute(relative), self.add_directory, self.control, workers, sample_limit=None)
+
+        for relative in dirty:
+            if self.control is not None and self.control.cancelled:
+                raise ScanCancelled()
+            if any(relative == tree or relative.startswith(tree + "/") for tree in new_trees):
+                # Già letta dalla scansione del nuovo ramo
+                continue
+            if relative in self.dirs or os.path.isdir(self._absolute(relative)):
+                self._rescan_directory(relative)
+
+async def _create_anchor(dataset: str) -> Optional[str]:
+    name = f"{SPACE_SNAPSHOT_PREFIX}{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    result = await run_command(["zfs", "snapshot", f"{dataset}@{name}"])
+    invalidate_zfs_inventory()
+    if not result["success"]:
+        logger.error(f"Impossibile creare lo snapshot di riferimento di {dataset}: {result['error']}")
+        return None
+    return name
+
+async def _destroy_anchor(dataset: str, name: str) -> None:
+    result = await run_command(["zfs", "destroy", f"{dataset}@{name}"])
+    invalidate_zfs_inventory()
+    if not result["success"]:
+        logger.warning(f"Impossibile eliminare lo snapshot {dataset}@{name}: {result['error']}")
+
+async def _destroy_stale_anchors(dataset: str, keep: Optional[str] = None) -> None:
+    # Snapshot di riferimento lasciati da un indice precedente (es. prima di un riavvio)
+    result = await run_command(["zfs", "list", "-H", "-o", "name", "-t", "snapshot", "-d", "1", dataset])
+    if not result["success"]:
+        return
+    for line in result["output"].splitlines():
+        snapshot = line.strip().split("@", 1)[-1]
+        if snapshot.startswith(SPACE_SNAPSHOT_PREFIX) and snapshot != keep:
+            await _destroy_anchor(dataset, snapshot)
+
+async def _build(index: SpaceIndex, workers: int) -> None:
+    loop = asyncio.get_event_loop()
+    index.state = "building"
+    index.error = None
+    index.control = ScanControl()
+    anchor = None
+    try:
+        await _destroy_stale_anchors(index.dataset)
+        # Lo snapshot precede la scansione: le modifiche fatte durante la scansione
+        # compariranno nel prossimo zfs diff e la rilettura delle directory è idempotente
+        anchor = await _create_anchor(index.dataset)
+        if anchor is None:
+            raise RuntimeError("Impossibile creare lo snapshot di riferimento")
+        if index.control.cancelled:
+            raise ScanCancelled()
+        index.dirs.clear()
+        index.children.clear()
+        await loop.run_in_executor(None, lambda: scan_tree(
+            index.mountpoint, index.add_directory, index.control, workers, sample_limit=None
+        ))
+        index.anchor, anchor = anchor, None
+        index.state = "ready"
+        index.built_at = index.refreshed_at = time.time()
+    except ScanCancelled:
+        index.state = "failed"
+        index.error = "Scansione annullata"
+    except Exception as e:
+        logger.error(f"Errore nella costruzione dell'indice di {index.dataset}: {e}")
+        index.state = "failed"
+        index.error = str(e)
+    finally:
+        # Uno snapshot non adottato dall'indice tratterrebbe i dati eliminati
+        if anchor is not None:
+            await _destroy_anchor(index.dataset, anchor)
+
+async def _refresh(index: SpaceIndex, workers: int) -> None:
+    loop = asyncio.get_event_loop()
+    index.state = "refreshing"
+    index.error = None
+    index.control = ScanControl()
+    anchor = None
+    try:
+        anchor = await _create_anchor(index.dataset)
+        if anchor is None:
+            raise RuntimeError("Impossibile creare lo snapshot di riferimento")
+
+        result = await run_command(["zfs", "diff", "-H", "-F", f"{index.dataset}@{index.anchor}",
+                                    f"{index.dataset}@{anchor}"], timeout=ZFS_DIFF_TIMEOUT)
+        if not result["success"]:
+            raise RuntimeError(result["error"])
+
+        changes = parse_zfs_diff(result["output"])
+        # I percorsi di zfs diff tra due snapshot sono riferiti al mountpoint del dataset
+        await loop.run_in_executor(None, lambda: index.apply_changes(changes, workers))
+
+        # Il nuovo snapshot diventa l'ancora: nel finally si elimina quello precedente
+        index.anchor, anchor = anchor, index.anchor
+        index.last_changes = len(changes)
+        index.state = "ready"
+        index.refreshed_at = time.time()
+    except ScanCancelled:
+        # L'ancora non è cambiata: il prossimo aggiornamento rilegge le stesse modifiche
+        index.state = "ready" if index.built_at else "failed"
+        index.error = "Aggiornamento annullato"
+    except Exception as e:
+        logger.error(f"Errore nell'aggiornamento dell'indice di {index.dataset}: {e}")
+        # L'indice precedente resta valido: il prossimo aggiornamento riparte dalla stessa ancora
+        index.state = "ready" if index.built_at else "failed"
+        index.error = str(e)
+    finally:
+        if anchor is not None:
+            await _destroy_anchor(index.dataset, anchor)
+
+async def update_space_index(dataset: str, full: bool = False, workers: int = SCAN_WORKERS) -> Dict[str, Any]:
+    """
+    Costruisce l'indice dello spazio di un dataset o, se esiste già, lo aggiorna con zfs diff
+
+    Args:
+        dataset: Nome del dataset
+        full: Se True, ricostruisce l'indice da zero con una scansione completa
+        workers: Numero di thread della scansione
+
+    Returns:
+        Dizionario con success e lo stato dell'indice
+    """
+    index = _indexes.get(dataset)
+    if index is not None and index.state in ("building", "refreshing"):
+        return {
+            "success": False,
+            "error": f"L'indice di '{dataset}' è già in aggiornamento"
+        }
+
+    result = await get_zfs_bulk_properties([dataset], ["mountpoint", "mounted"])
+    if not result["success"] or dataset in result["errors"]:
+        return {
+            "success": False,
+            "error": result.get("error") or result["errors"].get(dataset)
+        }
+
+    properties = result["properties"][dataset]
+    mountpoint = (properties.get("mountpoint") or {}).get("value")
+    mounted = (properties.get("mounted") or {}).get("value")
+    if not mountpoint or not str(mountpoint).startswith("/") or mounted != "yes":
+        return {
+            "success": False,
+            "error": f"Il dataset '{dataset}' non è montato"
+        }
+
+    if index is None or full or index.anchor is None or index.mountpoint != mountpoint.rstrip("/"):
+        index = SpaceIndex(dataset, mountpoint)
+        _indexes[dataset] = index
+        index.state = "building"
+        index.task = start_task(_build(index, workers))
+    else:
+        index.state = "refreshing"
+        index.task = start_task(_refresh(index, workers))
+
+    return {
+        "success": True,
+        "index": index.to_status()
+    }
+
+def get_space_treemap(dataset: str, path: str = "", depth: int = 2, limit: int = 20) -> Optional[Dict[str, Any]]:
+    """
+    Restituisce lo stato dell'indice e il treemap di un percorso (None se l'indice non esiste)
+    """
+    index = _indexes.get(dataset)
+    if index is None:
+        return None
+
+    result = index.to_status()
+    result["tree"] = index.treemap(path, depth, limit) if index.built_at else None
+    return result
+
+async def drop_space_index(dataset: str) -> Dict[str, Any]:
+    """
+    Elimina l'indice di un dataset e il suo snapshot di riferimento
+    """
+    index = _indexes.get(dataset)
+    if index is None:
+        return {
+            "success": False,
+            "error": f"Nessun indice per il dataset '{dataset}'"
+        }
+
+    del _indexes[dataset]
+    if index.task is not None and not index.task.done():
+        # Si attende la fine del task: uno snapshot ancora in creazione resterebbe orfano
+        if index.control is not None:
+            index.control.cancel()
+        await asyncio.gather(index.task, return_exceptions=True)
+    await _destroy_stale_anchors(dataset)
+
+    return {
+        "success": True,
+        "message": f"Indice di '{dataset}' eliminato"
+    }
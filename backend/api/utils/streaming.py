@@ -0,0 +1,107 @@
+"""
+Pub/sub in memoria e Server-Sent Events
+
+Un Broadcaster distribuisce gli eventi prodotti da un'unica sorgente (un processo
+`zpool iostat`, un campionatore, ...) a tutti i client collegati. La sorgente può essere
+avviata al primo sottoscrittore e fermata quando non ne resta nessuno.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Set
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+# Intervallo (secondi) tra i commenti keep-alive inviati sugli stream SSE
+SSE_KEEPALIVE_INTERVAL = 15
+
+class Broadcaster:
+    """
+    Distribuisce gli eventi pubblicati a una coda limitata per ogni sottoscrittore.
+    Se un client è troppo lento gli eventi più vecchi nella sua coda vengono scartati.
+    """
+
+    def __init__(self, on_first_subscriber: Optional[Callable[[], Awaitable[None]]] = None,
+                 on_no_subscribers: Optional[Callable[[], Awaitable[None]]] = None,
+                 queue_size: int = 100, idle_grace: float = 5):
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._on_first_subscriber = on_first_subscriber
+        self._on_no_subscribers = on_no_subscribers
+        self._queue_size = queue_size
+        # Attesa prima di fermare la sorgente: una riconnessione rapida non la riavvia
+        self._idle_grace = idle_grace
+        self._idle_task: Optional[asyncio.Task] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._queue_size)
+        first = not self._subscribers
+        self._subscribers.add(queue)
+
+        if self._idle_task is not None:
+            self._idle_task.cancel()
+            self._idle_task = None
+        elif first and self._on_first_subscriber is not None:
+            await self._on_first_subscriber()
+
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+        if not self._subscribers and self._on_no_subscribers is not None and self._idle_task is None:
+            self._idle_task = asyncio.ensure_future(self._stop_when_idle())
+
+    async def _stop_when_idle(self) -> None:
+        await asyncio.sleep(self._idle_grace)
+        self._idle_task = None
+        if not self._subscribers:
+            await self._on_no_subscribers()
+
+    def publish(self, item: Any) -> None:
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(item)
+
+async def _sse_events(request: Request, broadcaster: Broadcaster,
+                      initial: Optional[Any] = None) -> AsyncIterator[str]:
+    queue = await broadcaster.subscribe()
+    try:
+        if initial is not None:
+            yield f"data: {json.dumps(initial)}\n\n"
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            event = item.get("event") if isinstance(item, dict) else None
+            if event:
+                yield f"event: {event}\ndata: {json.dumps(item)}\n\n"
+            else:
+                yield f"data: {json.dumps(item)}\n\n"
+    finally:
+        broadcaster.unsubscribe(queue)
+
+def sse_response(request: Request, broadcaster: Broadcaster, initial: Optional[Any] = None) -> StreamingResponse:
+    """
+    Crea una risposta Server-Sent Events che inoltra al client gli eventi del broadcaster
+    """
+    return StreamingResponse(
+        _sse_events(request, broadcaster, initial),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Disabilita il buffering di nginx, altrimenti gli eventi arrivano a blocchi
+            "X-Accel-Buffering": "no"
+        }
+    )
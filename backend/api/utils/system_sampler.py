@@ -0,0 +1,200 @@
+"""
+Campionatore in background delle risorse di sistema
+
+psutil.cpu_percent(interval=1) dentro un handler async blocca l'event loop per un secondo
+ad ogni aggiornamento della dashboard. Un task in background legge invece a intervallo
+fisso CPU (totale e per core), memoria, swap, load average e cambi di contesto con chiamate
+non bloccanti (i valori si riferiscono all'intervallo dal campione precedente) e conserva
+la storia in RingBuffer: /api/system/info restituisce l'ultimo campione senza attese.
+"""
+
+import asyncio
+import logging
+import os
+import platform
+import time
+from typing import Dict, Optional, Any
+
+import psutil
+
+from .ringbuffer import RingBuffer
+
+logger = logging.getLogger(__name__)
+
+# Intervallo di campionamento (secondi) e campioni conservati (1 ora)
+SYSTEM_SAMPLE_INTERVAL = 2
+SYSTEM_HISTORY = 1800
+
+SYSTEM_FIELDS = [
+    "timestamp",
+    "cpu_percent", "cpu_user", "cpu_system", "cpu_iowait",
+    "load1", "load5", "load15",
+    "memory_used", "memory_available", "memory_percent",
+    "swap_total", "swap_used", "swap_percent",
+    "ctx_switches_per_sec", "interrupts_per_sec"
+]
+
+def format_uptime(seconds: float) -> str:
+    """
+    Formatta l'uptime come "3d 4h 12m" (o "4h 12m" nel primo giorno)
+    """
+    days, remainder = divmod(int(seconds), 86400)
+    hours, remainder = divmod(remainder, 3600)
+    minutes = remainder // 60
+    return f"{days}d {hours}h {minutes}m" if days > 0 else f"{hours}h {minutes}m"
+
+class SystemSampler:
+    """
+    Campionatore periodico di CPU, memoria, swap, load e cambi di contesto
+    """
+
+    def __init__(self, interval: float = SYSTEM_SAMPLE_INTERVAL, history: int = SYSTEM_HISTORY):
+        self.interval = interval
+        self.cpu_count = psutil.cpu_count() or 1
+        self.history = RingBuffer(SYSTEM_FIELDS, history)
+        self.cores = RingBuffer(["timestamp"] + [f"cpu{index}" for index in range(self.cpu_count)], history)
+        self.boot_time = psutil.boot_time()
+        # Informazioni statiche, lette una sola volta
+        self.memory_total = psutil.virtual_memory().total
+        self.platform = {
+            "hostname": platform.node(),
+            "os": f"{platform.system()} {platform.release()}",
+            "kernel": platform.release()
+        }
+        self._previous_stats = None
+        self._previous_time: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        # Prima lettura di riferimento: cpu_percent(interval=None) misura dall'ultima chiamata
+        psutil.cpu_percent(interval=None, percpu=True)
+        psutil.cpu_times_percent(interval=None)
+        self._previous_stats = psutil.cpu_stats()
+        self._previous_time = time.monotonic()
+        self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Errore nel campionamento delle risorse di sistema: {e}")
+
+    def sample(self) -> Dict[str, Any]:
+        """
+        Legge le risorse di sistema (chiamate non bloccanti) e aggiunge un campione alla storia
+        """
+        timestamp = time.time()
+        per_core = psutil.cpu_percent(interval=None, percpu=True)
+        times = psutil.cpu_times_percent(interval=None)
+        memory = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+        load1, load5, load15 = os.getloadavg()
+
+        stats = psutil.cpu_stats()
+        now = time.monotonic()
+        ctx_rate = interrupts_rate = None
+        if self._previous_stats is not None and now > self._previous_time:
+            elapsed = now - self._previous_time
+            ctx_rate = round((stats.ctx_switches - self._previous_stats.ctx_switches) / elapsed, 1)
+            interrupts_rate = round((stats.interrupts - self._previous_stats.interrupts) / elapsed, 1)
+        self._previous_stats, self._previous_time = stats, now
+
+        sample = {
+            "timestamp": timestamp,
+            "cpu_percent": round(sum(per_core) / len(per_core), 1) if per_core else 0.0,
+            "cpu_user": times.user,
+            "cpu_system": times.system,
+            "cpu_iowait": getattr(times, "iowait", None),
+            "load1": round(load1, 2),
+            "load5": round(load5, 2),
+            "load15": round(load15, 2),
+            "memory_used": memory.used,
+            "memory_available": memory.available,
+            "memory_percent": round(memory.percent, 1),
+            "swap_total": swap.total,
+            "swap_used": swap.used,
+            "swap_percent": round(swap.percent, 1),
+            "ctx_switches_per_sec": ctx_rate,
+            "interrupts_per_sec": interrupts_rate
+        }
+        self.history.append(sample)
+
+        cores = {f"cpu{index}": value for index, value in enumerate(per_core)}
+        cores["timestamp"] = timestamp
+        self.cores.append(cores)
+        return sample
+
+    def get_info(self) -> Dict[str, Any]:
+        """
+        Restituisce le informazioni di sistema con l'ultimo campione (nessuna attesa)
+        """
+        sample = self.history.latest()
+        if sample is None:
+            # Il primo campione non è ancora disponibile: lettura immediata
+            sample = self.sample()
+        cores = self.cores.latest() or {}
+        memory_total = self.memory_total
+        uptime = time.time() - self.boot_time
+
+        return {
+            **self.platform,
+            "uptime": format_uptime(uptime),
+            "uptime_seconds": int(uptime),
+            "cpu_usage": sample["cpu_percent"],
+            "cpu_count": self.cpu_count,
+            "cpu_per_core": [cores.get(f"cpu{index}") for index in range(self.cpu_count)],
+            "cpu_iowait": sample["cpu_iowait"],
+            "load": [sample["load1"], sample["load5"], sample["load15"]],
+            "memory_total": memory_total,
+            "memory_used": sample["memory_used"],
+            "memory_percent": sample["memory_percent"],
+            "memory": {
+                "total_gb": round(memory_total / (1024 ** 3), 1),
+                "used_gb": round(sample["memory_used"] / (1024 ** 3), 1),
+                "percent": sample["memory_percent"]
+            },
+            "swap": {
+                "total": sample["swap_total"],
+                "used": sample["swap_used"],
+                "percent": sample["swap_percent"]
+            },
+            "ctx_switches_per_sec": sample["ctx_switches_per_sec"],
+            "sampled_at": sample["timestamp"]
+        }
+
+    def metrics(self, window: float = 10) -> Dict[str, Optional[float]]:
+        """
+        Medie degli ultimi `window` secondi per l'archivio delle metriche
+        """
+        limit = max(1, round(window / self.interval))
+        return {field: self.history.mean(field, limit) for field in
+                ("cpu_percent", "cpu_iowait", "load1", "memory_percent", "memory_used", "swap_percent")}
+
+    def get_history(self, limit: Optional[int] = None, per_core: bool = False) -> Dict[str, Any]:
+        """
+        Restituisce gli ultimi campioni (e, se richiesto, l'utilizzo per core)
+        """
+        result: Dict[str, Any] = {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": self.history.to_list(limit)
+        }
+        if per_core:
+            result["cores"] = self.cores.to_list(limit)
+        return result
+
+# Istanza condivisa, avviata all'avvio dell'applicazione
+system_sampler = SystemSampler()
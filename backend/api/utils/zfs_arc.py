@@ -0,0 +1,193 @@
+"""
+Statistiche dell'ARC di ZFS da /proc/spl/kstat/zfs/arcstats
+
+Sulla scheda ARM la RAM è condivisa con la VM di Virtual DSM: dimensione e hit ratio
+dell'ARC determinano le prestazioni del NAS. Un campionatore in background legge arcstats
+a intervalli regolari, calcola hit/miss ratio sull'intervallo, occupazione rispetto a c_max,
+ripartizione MRU/MFU e statistiche L2ARC, e conserva la storia in un RingBuffer.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Any
+
+from .ringbuffer import RingBuffer
+
+logger = logging.getLogger(__name__)
+
+ARCSTATS_PATH = "/proc/spl/kstat/zfs/arcstats"
+
+# Intervallo di campionamento (secondi) e numero di campioni conservati (1 ora)
+ARC_SAMPLE_INTERVAL = 5
+ARC_HISTORY = 720
+
+ARC_FIELDS = [
+    "timestamp",
+    "size", "target", "c_min", "c_max", "size_percent",
+    "mru_size", "mfu_size", "mru_percent",
+    "hits_per_sec", "misses_per_sec", "hit_ratio", "demand_hit_ratio",
+    "l2_size", "l2_asize", "l2_hits_per_sec", "l2_misses_per_sec", "l2_hit_ratio"
+]
+
+def read_arcstats(path: str = ARCSTATS_PATH) -> Optional[Dict[str, int]]:
+    """
+    Legge il file kstat arcstats e restituisce {nome -> valore}. None se ZFS non è caricato.
+    """
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+
+    stats: Dict[str, int] = {}
+    # Le prime due righe sono l'intestazione kstat e "name type data"
+    for line in lines[2:]:
+        parts = line.split()
+        if len(parts) == 3:
+            try:
+                stats[parts[0]] = int(parts[2])
+            except ValueError:
+                continue
+    return stats
+
+def _ratio(part: float, total: float) -> Optional[float]:
+    return round(part * 100 / total, 2) if total > 0 else None
+
+def _delta(current: Dict[str, int], previous: Optional[Dict[str, int]], key: str) -> int:
+    value = current.get(key, 0)
+    if previous is None:
+        return value
+    # I contatori si azzerano se il modulo zfs viene ricaricato
+    return max(value - previous.get(key, 0), 0)
+
+def compute_arc_sample(current: Dict[str, int], previous: Optional[Dict[str, int]] = None,
+                       elapsed: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Calcola un campione dalle statistiche correnti. Con previous ed elapsed i ratio e le
+    frequenze si riferiscono all'intervallo, altrimenti ai contatori dall'avvio del sistema.
+    """
+    hits = _delta(current, previous, "hits")
+    misses = _delta(current, previous, "misses")
+    demand_hits = (_delta(current, previous, "demand_data_hits") +
+                   _delta(current, previous, "demand_metadata_hits"))
+    demand_misses = (_delta(current, previous, "demand_data_misses") +
+                     _delta(current, previous, "demand_metadata_misses"))
+    l2_hits = _delta(current, previous, "l2_hits")
+    l2_misses = _delta(current, previous, "l2_misses")
+
+    size = current.get("size", 0)
+    c_max = current.get("c_max", 0)
+    mru_size = current.get("mru_size", 0)
+    mfu_size = current.get("mfu_size", 0)
+    per_second = elapsed if previous is not None and elapsed else None
+
+    return {
+        "timestamp": time.time(),
+        "size": size,
+        "target": current.get("c", 0),
+        "c_min": current.get("c_min", 0),
+        "c_max": c_max,
+        "size_percent": _ratio(size, c_max),
+        "mru_size": mru_size,
+        "mfu_size": mfu_size,
+        "mru_percent": _ratio(mru_size, mru_size + mfu_size),
+        "hits_per_sec": round(hits / per_second, 2) if per_second else None,
+        "misses_per_sec": round(misses / per_second, 2) if per_second else None,
+        "hit_ratio": _ratio(hits, hits + misses),
+        "demand_hit_ratio": _ratio(demand_hits, demand_hits + demand_misses),
+        "l2_size": current.get("l2_size", 0),
+        "l2_asize": current.get("l2_asize", 0),
+        "l2_hits_per_sec": round(l2_hits / per_second, 2) if per_second else None,
+        "l2_misses_per_sec": round(l2_misses / per_second, 2) if per_second else None,
+        "l2_hit_ratio": _ratio(l2_hits, l2_hits + l2_misses)
+    }
+
+class ArcCollector:
+    """
+    Campionatore periodico di arcstats con storia in un buffer circolare
+    """
+
+    def __init__(self, path: str = ARCSTATS_PATH, interval: float = ARC_SAMPLE_INTERVAL,
+                 history: int = ARC_HISTORY):
+        self.path = path
+        self.interval = interval
+        self.history = RingBuffer(ARC_FIELDS, history)
+        self._previous: Optional[Dict[str, int]] = None
+        self._previous_time: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def sample(self) -> Optional[Dict[str, Any]]:
+        """
+        Legge arcstats e aggiunge un campione alla storia (None se arcstats non è disponibile)
+        """
+        stats = read_arcstats(self.path)
+        if stats is None:
+            return None
+
+        now = time.monotonic()
+        if self._previous is not None:
+            # Il primo campione serve solo come riferimento per l'intervallo successivo
+            sample = compute_arc_sample(stats, self._previous, now - self._previous_time)
+            self.history.append(sample)
+        else:
+            sample = None
+
+        self._previous = stats
+        self._previous_time = now
+        return sample
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.ensure_future(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Errore nel campionamento di arcstats: {e}")
+            await asyncio.sleep(self.interval)
+
+    def metrics(self, window: float = 10) -> Dict[str, Optional[float]]:
+        """
+        Medie degli ultimi `window` secondi per l'archivio delle metriche
+        """
+        limit = max(1, round(window / self.interval))
+        return {f"arc.{field}": self.history.mean(field, limit)
+                for field in ("size", "target", "hit_ratio", "l2_hit_ratio")}
+
+    def get_summary(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Restituisce lo stato attuale dell'ARC (contatori dall'avvio) e la storia dei campioni
+        """
+        stats = read_arcstats(self.path)
+        if stats is None:
+            return {
+                "available": False,
+                "interval": self.interval,
+                "current": None,
+                "history": []
+            }
+
+        current = compute_arc_sample(stats)
+        current["l2_present"] = stats.get("l2_size", 0) > 0
+        return {
+            "available": True,
+            "interval": self.interval,
+            "current": current,
+            "history": self.history.to_list(limit)
+        }
+
+# Istanza condivisa, avviata all'avvio dell'applicazione
+arc_collector = ArcCollector()
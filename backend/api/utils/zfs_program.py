@@ -0,0 +1,374 @@
+"""
+Operazioni ZFS in blocco con i channel program (`zfs program`)
+
+Creare 50 snapshot o distruggere un albero di dataset con un comando per elemento costa
+un fork e una sincronizzazione di transaction group per ognuno. Un channel program Lua
+esegue più passi di un pool nello stesso TXG: prima verifica tutti i passi con zfs.check.*
+e, solo se nessuna verifica fallisce, li applica con zfs.sync.*. Le chiamate zfs.sync.* già
+eseguite non vengono annullate da un errore successivo, per questo nessun passo viene
+applicato prima che tutti siano stati verificati.
+Un passo che dipende da uno precedente (es. destroy del padre dopo quello dei figli) non si
+può verificare sullo stato attuale: va in un channel program successivo, eseguito solo se
+i precedenti sono stati applicati.
+Se i channel program non sono disponibili si ripiega su comandi zfs sequenziali.
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+from typing import List, Dict, Optional, Any
+
+from .command_runner import run_command
+from .zfs_utils import invalidate_zfs_inventory
+
+logger = logging.getLogger(__name__)
+
+# Operazioni supportate e relativo comando zfs per l'esecuzione sequenziale
+BATCH_OPERATIONS = {
+    "snapshot": ["zfs", "snapshot"],
+    "destroy": ["zfs", "destroy"],
+    "promote": ["zfs", "promote"]
+}
+
+# Timeout (secondi) dell'intero channel program di un pool
+ZFS_PROGRAM_TIMEOUT = 300
+
+# argv: [dry_run, op1, target1, op2, target2, ...]. Prima passata: verifica di tutti i passi;
+# fuori prova il primo errore interrompe il programma con error() prima di qualunque modifica.
+# Seconda passata: applicazione dei passi nell'ordine ricevuto; un errore qui (raro, le
+# verifiche sono già passate) lascia applicati i passi precedenti. Il messaggio di error()
+# indica passo, fase ed errno. Restituisce l'esito (errno) della verifica di ogni passo con
+# chiave "1", "2", ...
+BATCH_LUA = """
+args = ...
+argv = args["argv"]
+dry_run = argv[1] == "1"
+ops = {
+    snapshot = {zfs.check.snapshot, zfs.sync.snapshot},
+    destroy = {zfs.check.destroy, zfs.sync.destroy},
+    promote = {zfs.check.promote, zfs.sync.promote}
+}
+
+results = {}
+failed = 0
+n = 0
+for i = 2, #argv, 2 do
+    n = n + 1
+    op = ops[argv[i]]
+    if op == nil then
+        err = 22
+    else
+        err = op[1](argv[i + 1])
+    end
+    if err ~= 0 then
+        if not dry_run then
+            error(string.format("armnas-batch: step %d check %d", n, err))
+        end
+        failed = failed + 1
+    end
+    results[tostring(n)] = err
+end
+
+if not dry_run then
+    n = 0
+    for i = 2, #argv, 2 do
+        n = n + 1
+        err = ops[argv[i]][2](argv[i + 1])
+        if err ~= 0 then
+            error(string.format("armnas-batch: step %d sync %d", n, err))
+        end
+    end
+end
+
+return {applied = not dry_run, failed = failed, results = results}
+"""
+
+BATCH_ERROR_RE = re.compile(r"armnas-batch: step (\d+) (check|sync) (\d+)")
+
+# None finché non si è provato a eseguire un channel program
+_channel_programs_supported: Optional[bool] = None
+
+def validate_batch_operation(operation: Dict[str, Any]) -> Optional[str]:
+    """
+    Verifica un passo del batch e restituisce un messaggio di errore (None se valido)
+    """
+    op = operation.get("op")
+    target = operation.get("target") or ""
+
+    if op not in BATCH_OPERATIONS:
+        return f"Operazione non supportata: '{op}'"
+    if not target or target.startswith("-") or " " in target:
+        return f"Destinazione non valida: '{target}'"
+    if op == "snapshot" and "@" not in target:
+        return f"'{target}' non è il nome di uno snapshot (formato dataset@snapshot)"
+    if op == "promote" and "@" in target:
+        return f"'{target}' non è un clone"
+    return None
+
+def _related(first: str, second: str) -> bool:
+    # Stesso dataset, discendente o snapshot dell'altro
+    return any(a == b or b.startswith(a + "/") or b.startswith(a + "@")
+               for a, b in ((first, second), (second, first)))
+
+def _depends_on(operation: Dict[str, Any], previous: Dict[str, Any]) -> bool:
+    # Un promote sposta gli snapshot tra dataset: tutto ciò che segue dipende da lui
+    if previous["op"] == "promote":
+        return True
+    # Creare o distruggere uno snapshot non cambia la verifica di un altro snapshot
+    if "@" in operation["target"] and "@" in previous["target"]:
+        return operation["target"] == previous["target"]
+    return _related(previous["target"].split("@", 1)[0], operation["target"].split("@", 1)[0])
+
+def split_dependent_steps(operations: List[Dict[str, Any]]) -> List[bool]:
+    """
+    Per ogni passo indica se dipende da un passo precedente (stesso albero di dataset,
+    oppure preceduto da un promote che sposta gli snapshot tra dataset). Un passo
+    dipendente non si può verificare sullo stato attuale.
+    """
+    return [any(_depends_on(operation, step) for step in operations[:index])
+            for index, operation in enumerate(operations)]
+
+def split_programs(operations: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Divide i passi in channel program consecutivi: un nuovo programma inizia a ogni passo
+    che dipende da un passo del programma in corso
+    """
+    programs: List[List[Dict[str, Any]]] = []
+    for operation in operations:
+        if not programs or any(_depends_on(operation, step) for step in programs[-1]):
+            programs.append([])
+        programs[-1].append(operation)
+    return programs
+
+def _pool_of(target: str) -> str:
+    return target.split("/", 1)[0].split("@", 1)[0]
+
+def _is_unsupported(error: str) -> bool:
+    error = (error or "").lower()
+    # Solo i casi in cui zfs program non esiste (ENOTSUP o comando sconosciuto): un errore
+    # su un dataset inesistente non deve ripiegare sull'esecuzione sequenziale non atomica
+    return ("unrecognized command" in error or "unknown command" in error
+            or "operation not supported" in error)
+
+async def _run_channel_program(pool: str, operations: List[Dict[str, Any]], dry_run: bool) -> Dict[str, Any]:
+    argv = ["1" if dry_run else "0"]
+    for operation in operations:
+        argv.extend([operation["op"], operation["target"]])
+
+    fd, script_path = tempfile.mkstemp(suffix=".lua", prefix="armnas-batch-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(BATCH_LUA)
+        result = await run_command(["zfs", "program", "-j", pool, script_path, *argv],
+                                   timeout=ZFS_PROGRAM_TIMEOUT)
+    finally:
+        os.unlink(script_path)
+
+    if not result["success"]:
+        failure = BATCH_ERROR_RE.search(result["error"] or "")
+        if failure is None:
+            return {
+                "success": False,
+                "unsupported": _is_unsupported(result["error"]),
+                "error": result["error"]
+            }
+        # Verifica fallita: nessun passo applicato. Esecuzione fallita: i passi precedenti
+        # sono già stati applicati (zfs.sync.* non viene annullato da error())
+        step, phase, code = int(failure.group(1)), failure.group(2), int(failure.group(3))
+        applied_steps = step - 1 if phase == "sync" else 0
+        items = []
+        for index, operation in enumerate(operations, start=1):
+            items.append({
+                "op": operation["op"],
+                "target": operation["target"],
+                "success": index <= applied_steps,
+                "error": os.strerror(code) if index == step else None
+            })
+        failed = operations[step - 1]
+        return {
+            "success": False,
+            "applied": applied_steps > 0,
+            "items": items,
+            "error": (f"{failed['op']} {failed['target']} non riuscito "
+                      f"({'verifica' if phase == 'check' else 'esecuzione'}): {os.strerror(code)}")
+        }
+
+    try:
+        returned = json.loads(result["output"]).get("return", {})
+    except json.JSONDecodeError as e:
+        return {
+            "success": False,
+            "unsupported": False,
+            "error": f"Output di zfs program non valido: {str(e)}"
+        }
+
+    codes = returned.get("results", {})
+    items = []
+    for index, operation in enumerate(operations, start=1):
+        code = int(codes.get(str(index), 0))
+        items.append({
+            "op": operation["op"],
+            "target": operation["target"],
+            "success": code == 0 and bool(returned.get("applied")),
+            "error": os.strerror(code) if code else None
+        })
+
+    return {
+        "success": not returned.get("failed"),
+        "applied": bool(returned.get("applied")),
+        "items": items
+    }
+
+async def _run_channel_programs(pool: str, operations: List[Dict[str, Any]], dry_run: bool) -> Dict[str, Any]:
+    items: List[Dict[str, Any]] = []
+    applied = False
+    programs = split_programs(operations)
+    for index, program in enumerate(programs):
+        result = await _run_channel_program(pool, program, dry_run)
+        if "items" not in result:
+            if index == 0:
+                # Nessun passo eseguito: il chiamante può ripiegare sull'esecuzione sequenziale
+                return result
+            result["items"] = [{"op": operation["op"], "target": operation["target"], "success": False,
+                                "error": None} for operation in program]
+        items.extend(result["items"])
+        applied = applied or result["applied"]
+        if result["success"]:
+            continue
+
+        # I programmi successivi non vengono eseguiti
+        for operation in (operation for later in programs[index + 1:] for operation in later):
+            items.append({"op": operation["op"], "target": operation["target"], "success": False,
+                          "error": None, "skipped": True, "reason": "non eseguito: un passo precedente è fallito"})
+        error = result.get("error") or "alcune operazioni non sono riuscite"
+        if not dry_run:
+            error = (f"Applicati solo i passi precedenti: {error}" if applied
+                     else f"Nessuna operazione applicata: {error}")
+        return {
+            "success": False,
+            "applied": applied,
+            "items": items,
+            "error": error
+        }
+
+    return {
+        "success": True,
+        "applied": applied,
+        "items": items
+    }
+
+async def _run_sequential(operations: List[Dict[str, Any]], dry_run: bool) -> Dict[str, Any]:
+    items = []
+    for operation in operations:
+        command = BATCH_OPERATIONS[operation["op"]] + [operation["target"]]
+        if dry_run:
+            # Solo zfs destroy ha una modalità di prova (-n)
+            if operation["op"] != "destroy":
+                items.append({"op": operation["op"], "target": operation["target"],
+                              "success": False, "error": None, "skipped": True})
+                continue
+            command = ["zfs", "destroy", "-n", operation["target"]]
+        result = await run_command(command)
+        items.append({
+            "op": operation["op"],
+            "target": operation["target"],
+            "success": result["success"] and not dry_run,
+            "error": result["error"]
+        })
+
+    return {
+        "success": all(item["error"] is None for item in items),
+        "applied": not dry_run and any(item["success"] for item in items),
+        "items": items
+    }
+
+async def run_zfs_batch(operations: List[Dict[str, Any]], dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Esegue un elenco di operazioni snapshot/destroy/promote
+
+    I passi vengono raggruppati per pool ed eseguiti con channel program: ogni programma
+    verifica tutti i suoi passi prima di applicarli. I passi che dipendono da uno precedente
+    vanno in un programma successivo, eseguito solo se i precedenti sono riusciti: l'esito di
+    ogni passo indica cosa è stato applicato. Senza supporto ai channel program i passi
+    vengono eseguiti uno alla volta con zfs.
+
+    Args:
+        operations: Elenco di {"op": "snapshot"|"destroy"|"promote", "target": nome}
+        dry_run: Se True, verifica soltanto i passi senza applicarli (i passi che dipendono
+            da un passo precedente vengono saltati)
+
+    Returns:
+        Dizionario con l'esito di ogni pool e di ogni passo
+    """
+    global _channel_programs_supported
+
+    if not operations:
+        return {
+            "success": False,
+            "error": "Nessuna operazione specificata"
+        }
+
+    for operation in operations:
+        error = validate_batch_operation(operation)
+        if error:
+            return {
+                "success": False,
+                "error": error
+            }
+
+    by_pool: Dict[str, List[Dict[str, Any]]] = {}
+    for operation in operations:
+        by_pool.setdefault(_pool_of(operation["target"]), []).append(operation)
+
+    pools = []
+    for pool, pool_operations in by_pool.items():
+        skipped: List[Dict[str, Any]] = []
+        if dry_run:
+            # In prova si verificano solo i passi indipendenti: gli altri vedrebbero lo
+            # stato precedente ai passi da cui dipendono
+            dependent = split_dependent_steps(pool_operations)
+            skipped = [operation for operation, flag in zip(pool_operations, dependent) if flag]
+            pool_operations = [operation for operation, flag in zip(pool_operations, dependent) if not flag]
+
+        result = None
+        if not pool_operations:
+            result = {"success": True, "applied": False, "items": [], "method": "none"}
+        elif _channel_programs_supported is not False:
+            result = await _run_channel_programs(pool, pool_operations, dry_run)
+            if result.get("unsupported"):
+                logger.warning(f"Channel program non disponibili, esecuzione sequenziale: {result['error']}")
+                _channel_programs_supported = False
+                result = None
+            elif "items" in result:
+                _channel_programs_supported = True
+
+        if result is None:
+            result = await _run_sequential(pool_operations, dry_run)
+            result["method"] = "sequential"
+        else:
+            result.setdefault("method", "channel_program")
+
+        for operation in skipped:
+            result["items"].append({"op": operation["op"], "target": operation["target"], "success": False,
+                                    "error": None, "skipped": True, "reason": "dipende da un passo precedente"})
+
+        result["pool"] = pool
+        result.pop("unsupported", None)
+        pools.append(result)
+
+    if not dry_run:
+        invalidate_zfs_inventory()
+
+    failed = [pool for pool in pools if not pool["success"]]
+    response = {
+        "success": not failed,
+        "dry_run": dry_run,
+        "pools": pools
+    }
+    if failed:
+        response["error"] = "; ".join(
+            f"{pool['pool']}: {pool.get('error') or 'alcune operazioni non sono riuscite'}" for pool in failed
+        )
+    return response
@@ -0,0 +1,406 @@
+"""
+Replica di dataset ZFS con `zfs send | zfs recv`
+
+Ogni replica è un job in background: `zfs send` (completo o incrementale, con -c/-L)
+viene collegato a `zfs recv -s` tramite un ciclo di copia in Python che conta i byte,
+calcola la velocità e può limitare la banda. Con `recv -s` un trasferimento interrotto
+lascia un receive_resume_token sul dataset di destinazione: la replica successiva dello
+stesso snapshot riprende da lì con `zfs send -t` invece di ricominciare da capo; la replica
+di un altro snapshot viene rifiutata finché il trasferimento interrotto non viene ripreso
+o annullato (zfs recv -A).
+"""
+
+import asyncio
+import logging
+import re
+import time
+import uuid
+from typing import List, Dict, Optional, Any
+
+from .command_runner import run_command, spawn_process, terminate_process, start_task
+from .zfs_utils import invalidate_zfs_inventory
+
+logger = logging.getLogger(__name__)
+
+# Dimensione dei blocchi copiati da zfs send a zfs recv
+REPLICATION_CHUNK_SIZE = 1024 * 1024
+
+# Intervallo (secondi) su cui viene calcolata la velocità istantanea
+REPLICATION_RATE_WINDOW = 2
+
+# Numero massimo di job conclusi conservati in memoria
+REPLICATION_HISTORY = 50
+
+# Riga di avanzamento di `zfs send -v -P`: "HH:MM:SS<tab>byte<tab>snapshot"
+_PROGRESS_RE = re.compile(r"^\d{2}:\d{2}:\d{2}\t(\d+)\t")
+
+# Snapshot di destinazione nel contenuto di un resume token (zfs send -n -v -t)
+_TONAME_RE = re.compile(r"^\s*toname\s*=\s*(\S+)\s*$", re.MULTILINE)
+
+_jobs: Dict[str, "ReplicationJob"] = {}
+
+class ReplicationJob:
+    """
+    Stato di una replica: comandi, byte trasferiti, velocità ed esito
+    """
+
+    def __init__(self, source: str, target: str, base: Optional[str] = None,
+                 compressed: bool = True, large_block: bool = True, force: bool = False,
+                 rate_limit: Optional[int] = None, resume: bool = True):
+        self.id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.target = target
+        self.base = base
+        self.compressed = compressed
+        self.large_block = large_block
+        self.force = force
+        self.rate_limit = rate_limit
+        self.resume = resume
+
+        self.state = "pending"  # pending, running, completed, failed, cancelled
+        self.resumed = False
+        self.bytes_transferred = 0
+        self.bytes_reported = 0
+        self.bytes_total: Optional[int] = None
+        self.rate = 0.0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self._send: Optional[asyncio.subprocess.Process] = None
+        self._recv: Optional[asyncio.subprocess.Process] = None
+        self._cancelled = False
+        self._rate_samples: List[Any] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("completed", "failed", "cancelled")
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        percent = None
+        if self.bytes_total:
+            percent = min(round(self.bytes_transferred * 100 / self.bytes_total, 1), 100.0)
+
+        return {
+            "id": self.id,
+            "source": self.source,
+            "target": self.target,
+            "base": self.base,
+            "compressed": self.compressed,
+            "large_block": self.large_block,
+            "rate_limit": self.rate_limit,
+            "state": self.state,
+            "resumed": self.resumed,
+            "bytes_transferred": self.bytes_transferred,
+            "bytes_reported": self.bytes_reported,
+            "bytes_total": self.bytes_total,
+            "percent": percent,
+            "rate": round(self.rate),
+            "average_rate": round(self.bytes_transferred / elapsed) if elapsed else 0,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+    def _update_rate(self) -> None:
+        now = time.monotonic()
+        self._rate_samples.append((now, self.bytes_transferred))
+        while len(self._rate_samples) > 2 and now - self._rate_samples[0][0] > REPLICATION_RATE_WINDOW:
+            self._rate_samples.pop(0)
+        first_time, first_bytes = self._rate_samples[0]
+        if now > first_time:
+            self.rate = (self.bytes_transferred - first_bytes) / (now - first_time)
+
+def build_send_command(job: ReplicationJob, resume_token: Optional[str] = None) -> List[str]:
+    """
+    Costruisce il comando zfs send di un job (ripresa con -t se c'è un resume token)
+    """
+    # -P -v: stima della dimensione e avanzamento in formato analizzabile su stderr
+    if resume_token:
+        return ["zfs", "send", "-P", "-v", "-t", resume_token]
+
+    command = ["zfs", "send", "-P", "-v"]
+    if job.compressed:
+        command.append("-c")
+    if job.large_block:
+        command.append("-L")
+    if job.base:
+        command.extend(["-i", job.base])
+    command.append(job.source)
+    return command
+
+def build_recv_command(job: ReplicationJob) -> List[str]:
+    """
+    Costruisce il comando zfs recv di un job (-s: trasferimento riprendibile)
+    """
+    command = ["zfs", "recv", "-s"]
+    if job.force:
+        command.append("-F")
+    command.append(job.target)
+    return command
+
+async def get_receive_resume_token(dataset: str) -> Optional[str]:
+    """
+    Restituisce il receive_resume_token di un dataset, se un trasferimento è stato interrotto
+    """
+    result = await run_command(["zfs", "get", "-H", "-o", "value", "receive_resume_token", dataset])
+    if not result["success"]:
+        return None
+    token = result["output"].strip()
+    return token if token and token != "-" else None
+
+async def _read_send_progress(job: ReplicationJob, stream: asyncio.StreamReader, errors: List[str]) -> None:
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        text = line.decode(errors="replace").rstrip("\n")
+        parts = text.split("\t")
+
+        match = _PROGRESS_RE.match(text)
+        if match:
+            job.bytes_reported = int(match.group(1))
+        elif parts[0] == "size" and len(parts) > 1 and parts[1].isdigit():
+            job.bytes_total = int(parts[1])
+        elif parts[0] in ("full", "incremental") and parts[-1].isdigit():
+            job.bytes_total = int(parts[-1])
+        elif text.strip():
+            errors.append(text.strip())
+
+async def _pump(job: ReplicationJob, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    started = time.monotonic()
+    chunk_size = min(REPLICATION_CHUNK_SIZE, job.rate_limit) if job.rate_limit else REPLICATION_CHUNK_SIZE
+
+    try:
+        while True:
+            chunk = await reader.read(chunk_size)
+            if not chunk or job._cancelled:
+                break
+            writer.write(chunk)
+            await writer.drain()
+            job.bytes_transferred += len(chunk)
+            job._update_rate()
+
+            if job.rate_limit:
+                # Limite di banda: attende finché la media dall'inizio non rientra nel limite
+                ahead = job.bytes_transferred / job.rate_limit - (time.monotonic() - started)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+    finally:
+        try:
+            writer.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+async def get_resume_token_target(token: str) -> Optional[str]:
+    """
+    Restituisce lo snapshot (toname) del trasferimento interrotto descritto da un resume token
+    """
+    # Con -n il contenuto del token viene stampato su stdout
+    result = await run_command(["zfs", "send", "-n", "-v", "-t", token], check=False)
+    match = _TONAME_RE.search(result["output"] or "")
+    return match.group(1) if match else None
+
+async def _run_job(job: ReplicationJob) -> None:
+    job.state = "running"
+    job.started_at = time.time()
+
+    try:
+        resume_token = await get_receive_resume_token(job.target) if job.resume else None
+        if resume_token:
+            # Il token riprende lo stream interrotto, non quello richiesto: si riprende solo
+            # se è lo stesso snapshot, altrimenti va prima ripreso o annullato
+            interrupted = await get_resume_token_target(resume_token)
+            if interrupted != job.source:
+                job.state = "failed"
+                job.error = (f"'{job.target}' ha un trasferimento interrotto"
+                             f"{f' di {interrupted}' if interrupted else ''}: va ripreso o annullato "
+                             f"(zfs recv -A) prima di inviare '{job.source}'")
+                return
+        job.resumed = resume_token is not None
+
+        await _transfer(job, build_send_command(job, resume_token), build_recv_command(job))
+    except Exception as e:
+        logger.error(f"Errore nella replica {job.id}: {e}")
+        job.state = "failed"
+        job.error = str(e)
+    finally:
+        # Nessun processo deve restare attivo, qualunque sia l'esito
+        for process in (job._send, job._recv):
+            if process is not None and process.returncode is None:
+                await terminate_process(process)
+        if job.state == "running":
+            job.state = "failed"
+            job.error = job.error or "Replica interrotta"
+        job.finished_at = time.time()
+        if job._recv is not None:
+            invalidate_zfs_inventory()
+        logger.info(f"Replica {job.id} terminata: {job.state} ({job.bytes_transferred} byte)")
+
+async def _transfer(job: ReplicationJob, send_command: List[str], recv_command: List[str]) -> None:
+    logger.info(f"Replica {job.id}: {' '.join(send_command)} | {' '.join(recv_command)}")
+
+    job._recv = await spawn_process(recv_command, stdin=asyncio.subprocess.PIPE,
+                                    stdout=asyncio.subprocess.DEVNULL)
+    job._send = await spawn_process(send_command)
+
+    send_errors: List[str] = []
+    try:
+        await asyncio.gather(
+            _pump(job, job._send.stdout, job._recv.stdin),
+            _read_send_progress(job, job._send.stderr, send_errors)
+        )
+    except (BrokenPipeError, ConnectionResetError):
+        # zfs recv è uscito prima della fine dello stream: l'errore è nel suo stderr
+        await terminate_process(job._send)
+
+    recv_stderr = (await job._recv.stderr.read()).decode(errors="replace").strip()
+    await job._send.wait()
+    await job._recv.wait()
+
+    if job._cancelled:
+        job.state = "cancelled"
+    elif job._send.returncode == 0 and job._recv.returncode == 0:
+        job.state = "completed"
+    else:
+        job.state = "failed"
+        # Se zfs send fallisce, zfs recv riceve uno stream troncato: l'errore utile è quello di send
+        send_error = "\n".join(send_errors) if job._send.returncode != 0 else None
+        job.error = send_error or recv_stderr or (
+            f"zfs send terminato con codice {job._send.returncode}, "
+            f"zfs recv con codice {job._recv.returncode}"
+        )
+
+def _prune_history() -> None:
+    finished = sorted((job for job in _jobs.values() if job.finished), key=lambda job: job.created_at)
+    for job in finished[:max(len(finished) - REPLICATION_HISTORY, 0)]:
+        del _jobs[job.id]
+
+async def start_replication(source: str, target: str, base: Optional[str] = None,
+                            compressed: bool = True, large_block: bool = True, force: bool = False,
+                            rate_limit: Optional[int] = None, resume: bool = True) -> Dict[str, Any]:
+    """
+    Avvia in background la replica di uno snapshot verso un dataset di destinazione
+
+    Args:
+        source: Snapshot da inviare (dataset@snapshot)
+        target: Dataset di destinazione (es. backup/tank)
+        base: Snapshot di partenza per l'invio incrementale (es. @ieri o dataset@ieri)
+        compressed: Invia i blocchi già compressi (-c)
+        large_block: Mantiene i blocchi più grandi di 128K (-L)
+        force: Riporta la destinazione all'ultimo snapshot prima di ricevere (recv -F)
+        rate_limit: Limite di banda in byte al secondo (opzionale)
+        resume: Riprende un trasferimento interrotto se la destinazione ha un resume token
+
+    Returns:
+        Dizionario con success e lo stato del job creato
+    """
+    if "@" not in source:
+        return {
+            "success": False,
+            "error": f"'{source}' non è il nome di uno snapshot (formato dataset@snapshot)"
+        }
+
+    if not target or "@" in target:
+        return {
+            "success": False,
+            "error": "Il dataset di destinazione non è valido"
+        }
+
+    if rate_limit is not None and rate_limit <= 0:
+        return {
+            "success": False,
+            "error": "Il limite di banda deve essere maggiore di zero"
+        }
+
+    for job in _jobs.values():
+        if job.target == target and not job.finished:
+            return {
+                "success": False,
+                "error": f"Una replica verso '{target}' è già in corso (job {job.id})"
+            }
+
+    job = ReplicationJob(source, target, base, compressed, large_block, force, rate_limit, resume)
+    _jobs[job.id] = job
+    _prune_history()
+
+    start_task(_run_job(job))
+
+    return {
+        "success": True,
+        "message": f"Replica di '{source}' verso '{target}' avviata",
+        "job": job.to_dict()
+    }
+
+def get_replication_jobs() -> List[Dict[str, Any]]:
+    """
+    Restituisce tutti i job di replica, dal più recente
+    """
+    jobs = sorted(_jobs.values(), key=lambda job: job.created_at, reverse=True)
+    return [job.to_dict() for job in jobs]
+
+def get_replication_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Restituisce lo stato di un job di replica (None se non esiste)
+    """
+    job = _jobs.get(job_id)
+    return job.to_dict() if job is not None else None
+
+async def cancel_replication(job_id: str) -> Dict[str, Any]:
+    """
+    Interrompe un job di replica. Il resume token resta sulla destinazione:
+    la prossima replica verso lo stesso dataset riprenderà da dove si è fermata.
+    """
+    job = _jobs.get(job_id)
+    if job is None:
+        return {
+            "success": False,
+            "error": f"Job di replica '{job_id}' non trovato"
+        }
+
+    if job.finished:
+        return {
+            "success": False,
+            "error": f"Il job di replica '{job_id}' è già terminato ({job.state})"
+        }
+
+    job._cancelled = True
+    for process in (job._send, job._recv):
+        if process is not None:
+            await terminate_process(process)
+
+    return {
+        "success": True,
+        "message": f"Replica '{job_id}' interrotta"
+    }
+
+async def abort_resumable_receive(target: str) -> Dict[str, Any]:
+    """
+    Scarta lo stato di un trasferimento interrotto (zfs recv -A) per ripartire da zero
+    """
+    for job in _jobs.values():
+        if job.target == target and not job.finished:
+            return {
+                "success": False,
+                "error": f"Una replica verso '{target}' è in corso (job {job.id})"
+            }
+
+    result = await run_command(["zfs", "recv", "-A", target])
+    invalidate_zfs_inventory()
+
+    if result["success"]:
+        return {
+            "success": True,
+            "message": f"Stato di ricezione interrotta di '{target}' eliminato"
+        }
+    else:
+        return {
+            "success": False,
+            "error": result["error"]
+        }
@@ -1,39 +1,105 @@
-import subprocess
+import base64
 import json
 import os
-from typing import List, Dict, Optional, Any
+import re
+from typing import List, Dict, Optional, Any, Tuple, Callable, Awaitable
 
-def run_command(command: List[str]) -> Dict[str, Any]:
+from .command_runner import run_command
+from .cache import TTLCache, MISSING
+from .block_devices import get_block_devices
+from .zpool_status import split_pool_blocks, parse_pool_block, iter_leaf_vdevs
+
+# Durata (secondi) della cache dell'inventario ZFS (pool e dataset)
+ZFS_INVENTORY_TTL = 5
+
+# Durata (secondi) della cache dello stato dei pool (zpool status analizzato)
+ZFS_STATUS_TTL = 10
+
+# Durata (secondi) della cache delle proprietà dei dataset (per dataset e proprietà)
+ZFS_PROPERTIES_TTL = 30
+
+# Proprietà restituite dalla lettura multipla se il client non ne specifica
+DEFAULT_BULK_PROPERTIES = ["used", "available", "referenced", "compressratio", "mountpoint",
+                           "quota", "compression", "recordsize"]
+
+PROPERTY_NAME_RE = re.compile(r"^[a-z0-9_.:-]+$")
+
+# Cache condivisa tra tutte le richieste: più schede aperte su ZFSManagement
+# non rilanciano zpool list / zfs list ad ogni polling
+_inventory_cache = TTLCache(ZFS_INVENTORY_TTL)
+_status_cache = TTLCache(ZFS_STATUS_TTL)
+_property_cache = TTLCache(ZFS_PROPERTIES_TTL, max_entries=20000)
+
+def invalidate_zfs_inventory() -> None:
     """
-    Esegue un comando e restituisce l'output come dizionario
+    Invalida la cache dell'inventario ZFS (da chiamare dopo ogni modifica a pool o dataset)
     """
-    try:
-        result = subprocess.run(
-            command,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return {
-            "success": True,
-            "output": result.stdout.strip(),
-            "error": None
-        }
-    except subprocess.CalledProcessError as e:
-        return {
-            "success": False,
-            "output": None,
-            "error": e.stderr.strip() if e.stderr else str(e)
-        }
+    _inventory_cache.invalidate()
+    _status_cache.invalidate()
+    _property_cache.invalidate()
+
+def invalidate_zfs_pool_status(name: Optional[str] = None) -> None:
+    """
+    Invalida lo stato in cache di un pool (o di tutti i pool se name è None)
+    """
+    if name is None:
+        _status_cache.invalidate()
+    else:
+        _status_cache.invalidate(("pool", name))
+        _status_cache.invalidate("all")
+
+def peek_zfs_inventory() -> Dict[str, Optional[List[Dict[str, Any]]]]:
+    """
+    Ultimi pool e dataset noti (elenco completo), senza eseguire comandi
+    """
+    return {
+        "pools": _inventory_cache.peek("pools"),
+        "datasets": _inventory_cache.peek(("datasets", None, None, None, False, None))
+    }
+
+def get_zfs_inventory_generation() -> int:
+    """
+    Restituisce il contatore di generazione dell'inventario ZFS.
+    Cambia ogni volta che l'inventario viene invalidato o ricaricato con dati diversi.
+    """
+    return _inventory_cache.generation
+
+async def get_zfs_pools() -> List[Dict[str, Any]]:
+    """
+    Ottiene l'elenco dei pool ZFS (dalla cache dell'inventario se ancora valida)
+    """
+    pools = await _inventory_cache.get_or_load("pools", _load_zfs_pools)
+    return list(pools) if pools is not None else []
 
-def get_zfs_pools() -> List[Dict[str, Any]]:
+async def get_zfs_pool_metrics() -> Dict[str, float]:
     """
-    Ottiene l'elenco dei pool ZFS
+    Occupazione dei pool per l'archivio delle metriche ({"pool.allocated" -> byte, ...})
     """
-    cmd_result = run_command(["zpool", "list", "-H", "-o", "name,size,allocated,free,capacity,health,altroot", "-p"])
+    metrics: Dict[str, float] = {}
+    for pool in await get_zfs_pools():
+        metrics[f"{pool['name']}.allocated"] = pool["allocated"]
+        metrics[f"{pool['name']}.free"] = pool["free"]
+        if pool["capacity"].isdigit():
+            metrics[f"{pool['name']}.capacity"] = int(pool["capacity"])
+    return metrics
+
+async def get_zfs_dataset_metrics() -> Dict[str, float]:
+    """
+    Spazio usato dai dataset figli dei pool per l'archivio delle metriche ({"pool/ds.used" -> byte}).
+    Tiene aggiornato anche l'elenco completo dei dataset, da cui /metrics ne esporta l'occupazione.
+    """
+    metrics: Dict[str, float] = {}
+    for dataset in await get_zfs_datasets():
+        # Solo il primo livello: i dataset annidati esaurirebbero il limite di serie dell'archivio
+        if dataset["name"].count("/") == 1:
+            metrics[f"{dataset['name']}.used"] = dataset["used"]
+    return metrics
+
+async def _load_zfs_pools() -> Optional[List[Dict[str, Any]]]:
+    cmd_result = await run_command(["zpool", "list", "-H", "-o", "name,size,allocated,free,capacity,health,altroot", "-p"])
     
     if not cmd_result["success"]:
-        return []
+        return None
     
     pools = []
     for line in cmd_result["output"].splitlines():
@@ -54,14 +120,74 @@ def get_zfs_pools() -> List[Dict[str, Any]]:
     
     return pools
 
-def get_zfs_datasets() -> List[Dict[str, Any]]:
+# Campi ordinabili esposti dall'API -> proprietà ZFS passate a zfs list -s/-S
+DATASET_SORT_FIELDS = {
+    "name": "name",
+    "used": "used",
+    "available": "avail",
+    "referenced": "refer",
+    "mountpoint": "mountpoint",
+    "creation": "creation"
+}
+SNAPSHOT_SORT_FIELDS = {
+    "name": "name",
+    "used": "used",
+    "referenced": "refer",
+    "creation": "creation"
+}
+
+def _build_list_command(properties: str, root: Optional[str], depth: Optional[int], sort: Optional[str],
+                        descending: bool, types: Optional[str], sort_fields: Dict[str, str]) -> List[str]:
+    command = ["zfs", "list", "-H", "-p", "-o", properties]
+    
+    if types:
+        command.extend(["-t", types])
+    
+    # Ordinamento e profondità vengono delegati a zfs list
+    if sort:
+        if sort not in sort_fields:
+            raise ValueError(f"Campo di ordinamento non valido: {sort}")
+        command.extend(["-S" if descending else "-s", sort_fields[sort]])
+    
+    if depth is not None:
+        if depth < 0:
+            raise ValueError("La profondità deve essere maggiore o uguale a zero")
+        command.extend(["-d", str(depth)])
+    elif root:
+        # Senza -r zfs list restituirebbe solo root: senza profondità serve l'intero albero
+        command.append("-r")
+    
+    if root:
+        command.append(root)
+    
+    return command
+
+async def get_zfs_datasets(root: Optional[str] = None, depth: Optional[int] = None, sort: Optional[str] = None,
+                           descending: bool = False, types: Optional[str] = None) -> List[Dict[str, Any]]:
     """
-    Ottiene l'elenco dei dataset ZFS
+    Ottiene l'elenco dei dataset ZFS (dalla cache dell'inventario se ancora valida)
+    
+    Args:
+        root: Pool o dataset da cui partire (opzionale, default tutti i pool)
+        depth: Profondità massima sotto root (opzionale, zfs list -d; default l'intero albero)
+        sort: Campo di ordinamento (name, used, available, referenced, mountpoint, creation)
+        descending: Se True, ordina in modo decrescente
+        types: Tipi da elencare (filesystem, volume; default quelli di zfs list)
+    
+    Raises:
+        ValueError: Se il campo di ordinamento o la profondità non sono validi
     """
-    cmd_result = run_command(["zfs", "list", "-H", "-o", "name,used,avail,refer,mountpoint", "-p"])
+    command = _build_list_command("name,used,avail,refer,mountpoint", root, depth, sort, descending,
+                                  types, DATASET_SORT_FIELDS)
+    key = ("datasets", root, depth, sort, descending, types)
+    datasets = await _inventory_cache.get_or_load(key, lambda: _load_zfs_datasets(command))
+    return list(datasets) if datasets is not None else []
+
+async def _load_zfs_datasets(command: List[str]) -> Optional[List[Dict[str, Any]]]:
+    cmd_result = await run_command(command)
     
     if not cmd_result["success"]:
-        return []
+        return None
     
     datasets = []
     for line in cmd_result["output"].splitlines():
@@ -80,65 +206,185 @@ def get_zfs_datasets() -> List[Dict[str, Any]]:
     
     return datasets
 
-def get_available_disks() -> List[Dict[str, Any]]:
+async def get_zfs_snapshots(root: Optional[str] = None, depth: Optional[int] = None, sort: Optional[str] = None,
+                            descending: bool = False) -> List[Dict[str, Any]]:
     """
-    Ottiene l'elenco dei dischi disponibili per la creazione di pool ZFS
+    Ottiene l'elenco degli snapshot ZFS (dalla cache dell'inventario se ancora valida)
+    
+    Args:
+        root: Pool o dataset di cui elencare gli snapshot (opzionale)
+        depth: Profondità massima sotto root (1 = solo gli snapshot di root)
+        sort: Campo di ordinamento (name, used, referenced, creation)
+        descending: Se True, ordina in modo decrescente
+    
+    Raises:
+        ValueError: Se il campo di ordinamento o la profondità non sono validi
     """
-    # Ottieni tutti i dispositivi di blocco
-    cmd_result = run_command(["lsblk", "-d", "-o", "NAME,SIZE,MODEL,SERIAL,TYPE"])
+    command = _build_list_command("name,used,refer,creation", root, depth, sort, descending,
+                                  "snapshot", SNAPSHOT_SORT_FIELDS)
+    key = ("snapshots", root, depth, sort, descending)
+    snapshots = await _inventory_cache.get_or_load(key, lambda: _load_zfs_snapshots(command))
+    return list(snapshots) if snapshots is not None else []
+
+async def _load_zfs_snapshots(command: List[str]) -> Optional[List[Dict[str, Any]]]:
+    cmd_result = await run_command(command)
     
     if not cmd_result["success"]:
-        return []
+        return None
     
-    try:
-        # Prova a interpretare l'output come JSON
+    snapshots = []
+    for line in cmd_result["output"].splitlines():
+        parts = line.split("\t")
+        if len(parts) >= 4 and "@" in parts[0]:
+            dataset, snapshot = parts[0].split("@", 1)
+            snapshots.append({
+                "name": parts[0],
+                "dataset": dataset,
+                "snapshot": snapshot,
+                "used": int(parts[1]),
+                "referenced": int(parts[2]),
+                "creation": int(parts[3])
+            })
+    
+    return snapshots
+
+def encode_cursor(name: str, offset: int) -> str:
+    """
+    Codifica il cursore di paginazione (nome dell'ultimo elemento restituito e sua posizione)
+    """
+    payload = json.dumps({"after": name, "offset": offset}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def paginate(items: List[Dict[str, Any]], limit: Optional[int] = None,
+             cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Restituisce una pagina di elementi e il cursore della pagina successiva (None se è l'ultima).
+    Il cursore riparte dall'elemento dopo l'ultimo restituito; se nel frattempo è stato
+    eliminato, si riparte dalla sua vecchia posizione (gli elementi successivi scalano di uno).
+    
+    Raises:
+        ValueError: Se il cursore o il limite non sono validi
+    """
+    start = 0
+    if cursor:
         try:
-            data = json.loads(cmd_result["output"])
-            blockdevices = data.get("blockdevices", [])
-        except json.JSONDecodeError:
-            # Se non è JSON, interpreta l'output come testo
-            lines = cmd_result["output"].strip().split('\n')
-            if len(lines) <= 1:
-                return []
-                
-            # Salta l'intestazione
-            blockdevices = []
-            for line in lines[1:]:
-                parts = line.split()
-                if len(parts) >= 5 and parts[-1] == "disk":
-                    blockdevices.append({
-                        "name": parts[0],
-                        "size": parts[1],
-                        "model": " ".join(parts[2:-2]) if len(parts) > 5 else "",
-                        "type": "disk"
-                    })
+            padded = cursor + "=" * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            after, offset = data["after"], int(data["offset"])
+        except (ValueError, KeyError, TypeError):
+            raise ValueError("Cursore di paginazione non valido")
+        
+        start = max(offset - 1, 0)
+        for position, item in enumerate(items):
+            if item["name"] == after:
+                start = position + 1
+                break
+    
+    if limit is None:
+        return items[start:], None
+    if limit <= 0:
+        raise ValueError("Il limite deve essere maggiore di zero")
+    
+    page = items[start:start + limit]
+    next_cursor = None
+    if page and start + limit < len(items):
+        next_cursor = encode_cursor(page[-1]["name"], start + limit)
+    
+    return page, next_cursor
+
+def resolve_device_name(path: str) -> str:
+    """
+    Risolve un percorso di dispositivo (anche /dev/disk/by-id/...) nel nome kernel canonico (es. sda1)
+    """
+    return os.path.basename(os.path.realpath(path))
+
+def get_parent_disk_name(name: str) -> str:
+    """
+    Restituisce il disco che contiene una partizione (sda1 -> sda, nvme0n1p1 -> nvme0n1).
+    Se il nome è già un disco intero viene restituito invariato.
+    """
+    sys_path = f"/sys/class/block/{name}"
+    if os.path.exists(sys_path):
+        if os.path.exists(os.path.join(sys_path, "partition")):
+            # /sys/class/block/sda1 -> /sys/devices/.../block/sda/sda1
+            return os.path.basename(os.path.dirname(os.path.realpath(sys_path)))
+        return name
+    
+    # Dispositivo non presente in sysfs (es. disco rimosso): deduci il disco dal nome
+    match = re.match(r"^((?:sd|vd|xvd|hd)[a-z]+)\d+$", name) or re.match(r"^((?:nvme\d+n\d+)|(?:mmcblk\d+))p\d+$", name)
+    return match.group(1) if match else name
+
+async def get_vdev_membership_index() -> Dict[str, str]:
+    """
+    Restituisce un indice {nome kernel -> pool} di tutti i dispositivi usati dai pool ZFS.
+    Contiene sia le partizioni (sda1) sia i dischi che le contengono (sda), così la verifica
+    "questo disco è in un pool?" costa una ricerca nel dizionario.
+    Viene ricavato dallo stato di tutti i pool (un solo `zpool status`) e condivide la cache dell'inventario.
+    """
+    index = await _inventory_cache.get_or_load("vdev_index", _load_vdev_membership_index)
+    return index if index is not None else {}
+
+async def _load_vdev_membership_index() -> Optional[Dict[str, str]]:
+    result = await get_all_zfs_pool_status()
+
+    if not result["success"]:
+        return None
+
+    return build_vdev_membership([entry["pool"] for entry in result["pools"]])
+
+def build_vdev_membership(pools: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Costruisce l'indice {nome kernel -> pool} dai modelli di `zpool status`
+    """
+    index = {}
+    for pool in pools:
+        for leaf in iter_leaf_vdevs(pool):
+            if not leaf["path"]:
+                continue
+            # I percorsi /dev/disk/by-id/... vengono risolti nel nome kernel canonico
+            name = resolve_device_name(leaf["path"])
+            index[name] = pool["name"]
+            index.setdefault(get_parent_disk_name(name), pool["name"])
+
+    return index
+
+async def get_available_disks() -> List[Dict[str, Any]]:
+    """
+    Ottiene l'elenco dei dischi disponibili per la creazione di pool ZFS
+    """
+    try:
+        # Inventario condiviso dei dispositivi di blocco (un solo lsblk, in cache)
+        inventory = await get_block_devices()
+        
+        # Indice dei dispositivi già usati nei pool ZFS (un solo zpool status per tutti i dischi)
+        vdev_index = await get_vdev_membership_index()
         
         disks = []
-        for device in blockdevices:
-            if device.get("type") == "disk":
-                # Verifica se il disco è già utilizzato in un pool ZFS
-                in_use = False
-                check_result = run_command(["zpool", "status"])
-                if check_result["success"] and device["name"] in check_result["output"]:
-                    in_use = True
-                
-                disks.append({
-                    "name": device["name"],
-                    "path": f"/dev/{device['name']}",
-                    "size": device.get("size", ""),
-                    "model": device.get("model", "").strip(),
-                    "serial": device.get("serial", "").strip() if "serial" in device else "",
-                    "in_use": in_use
-                })
+        for device in inventory.disks():
+            # Verifica se il disco è già utilizzato in un pool ZFS
+            pool = vdev_index.get(device["name"])
+            
+            disks.append({
+                "name": device["name"],
+                "path": device["path"],
+                "size": device["size"],
+                "model": device["model"],
+                "serial": device["serial"],
+                "wwn": device["wwn"],
+                "by_id": device["by_id"],
+                "in_use": pool is not None,
+                "pool": pool
+            })
         
         return disks
     except Exception as e:
         print(f"Errore in get_available_disks: {str(e)}")
         return []
 
-def create_zfs_pool(name: str, raid_type: str, disks: List[str], mount_point: Optional[str] = None) -> Dict[str, Any]:
+async def build_zfs_pool_create(name: str, raid_type: str, disks: List[str],
+                                mount_point: Optional[str] = None) -> Dict[str, Any]:
     """
-    Crea un nuovo pool ZFS
+    Verifica i parametri di un nuovo pool ZFS e costruisce il comando zpool create
     
     Args:
         name: Nome del pool
@@ -147,7 +393,7 @@ def create_zfs_pool(name: str, raid_type: str, disks: List[str], mount_point: Op
         mount_point: Punto di montaggio (opzionale)
     
     Returns:
-        Dizionario con il risultato dell'operazione
+        Dizionario con success, command e mount_point (o error)
     """
     if not name or not raid_type or not disks:
         return {
@@ -168,7 +414,7 @@ def create_zfs_pool(name: str, raid_type: str, disks: List[str], mount_point: Op
     if mount_point == "/storage":
         # Controlla se esiste già un pool montato su /storage controllando i dataset
         # Il pool root appare come dataset con lo stesso nome del pool
-        datasets = get_zfs_datasets()
+        datasets = await get_zfs_datasets()
         for dataset in datasets:
             dataset_mountpoint = dataset.get("mountpoint")
             dataset_name = dataset.get("name")
@@ -185,7 +431,7 @@ def create_zfs_pool(name: str, raid_type: str, disks: List[str], mount_point: Op
     
     # Verifica generale se il mountpoint è già in uso (per altri mountpoint)
     elif mount_point:
-        datasets = get_zfs_datasets()
+        datasets = await get_zfs_datasets()
         for dataset in datasets:
             if dataset.get("mountpoint") == mount_point:
                 # Il mountpoint è già utilizzato
@@ -208,29 +454,18 @@ def create_zfs_pool(name: str, raid_type: str, disks: List[str], mount_point: Op
         
         # Verifica che /storage non sia montato da overlayroot o overlay
         # Questo è importante perché overlayroot può interferire con ZFS
-        try:
-            mount_check = subprocess.run(
-                ["findmnt", "-n", "-o", "SOURCE,FSTYPE", "/storage"],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if mount_check.returncode == 0 and mount_check.stdout.strip():
-                mount_info = mount_check.stdout.strip().split()
-                if len(mount_info) >= 2:
-                    mount_source = mount_info[0]
-                    mount_fstype = mount_info[1]
-                    # Se è montato da overlay, avvisa ma continua (bind mount lo risolverà)
-                    if "overlay" in mount_fstype.lower():
-                        # Questo potrebbe essere un problema, ma il bind mount dovrebbe risolverlo
-                        # al prossimo riavvio quando bind-armnas.service viene eseguito
-                        pass
-        except FileNotFoundError:
-            # findmnt non disponibile, continua comunque
-            pass
-        except Exception:
-            # Errore nel controllo, continua comunque
-            pass
+        # (se findmnt non è disponibile o fallisce, continua comunque)
+        mount_check = await run_command(["findmnt", "-n", "-o", "SOURCE,FSTYPE", "/storage"], timeout=5)
+        if mount_check["success"] and mount_check["output"]:
+            mount_info = mount_check["output"].split()
+            if len(mount_info) >= 2:
+                mount_source = mount_info[0]
+                mount_fstype = mount_info[1]
+                # Se è montato da overlay, avvisa ma continua (bind mount lo risolverà)
+                if "overlay" in mount_fstype.lower():
+                    # Questo potrebbe essere un problema, ma il bind mount dovrebbe risolverlo
+                    # al prossimo riavvio quando bind-armnas.service viene eseguito
+                    pass
     
     # Costruisci il comando in base al tipo di RAID
     command = ["zpool", "create"]
@@ -260,8 +495,39 @@ def create_zfs_pool(name: str, raid_type: str, disks: List[str], mount_point: Op
             "error": f"Tipo di RAID non supportato: {raid_type}"
         }
     
-    # Esegui il comando
-    result = run_command(command)
+    return {
+        "success": True,
+        "command": command,
+        "mount_point": actual_mount_point
+    }
+
+async def create_zfs_pool(name: str, raid_type: str, disks: List[str], mount_point: Optional[str] = None,
+                          run: Optional[Callable[[List[str]], Awaitable[Dict[str, Any]]]] = None) -> Dict[str, Any]:
+    """
+    Crea un nuovo pool ZFS
+    
+    Args:
+        name: Nome del pool
+        raid_type: Tipo di RAID (mirror, raidz, raidz2, raidz3, stripe)
+        disks: Lista dei percorsi dei dischi
+        mount_point: Punto di montaggio (opzionale)
+        run: Esecutore del comando (default run_command; i job passano Job.run_command)
+    
+    Returns:
+        Dizionario con il risultato dell'operazione
+    """
+    prepared = await build_zfs_pool_create(name, raid_type, disks, mount_point)
+    if not prepared["success"]:
+        return prepared
+    command = prepared["command"]
+    actual_mount_point = prepared["mount_point"]
+    
+    # Esegui il comando (la creazione su dischi USB grandi può richiedere minuti)
+    if run is not None:
+        result = await run(command)
+    else:
+        result = await run_command(command, timeout=600)
+    invalidate_zfs_inventory()
     
     if result["success"]:
         message = f"Pool ZFS '{name}' creato con successo"
@@ -291,7 +557,7 @@ def create_zfs_pool(name: str, raid_type: str, disks: List[str], mount_point: Op
                         docker_config_result = configure_docker_data_root(docker_dir)
                         if docker_config_result.get("success"):
                             # Riavvia Docker automaticamente per applicare la configurazione
-                            restart_result = run_command(["systemctl", "restart", "docker"])
+                            restart_result = await run_command(["systemctl", "restart", "docker"])
                             if restart_result["success"]:
                                 message += ". Docker configurato automaticamente per usare /storage/docker come data-root e riavviato."
                             else:
@@ -317,7 +583,7 @@ def create_zfs_pool(name: str, raid_type: str, disks: List[str], mount_point: Op
             "error": error_msg
         }
 
-def destroy_zfs_pool(name: str, force: bool = False) -> Dict[str, Any]:
+async def destroy_zfs_pool(name: str, force: bool = False) -> Dict[str, Any]:
     """
     Distrugge un pool ZFS
     
@@ -335,7 +601,7 @@ def destroy_zfs_pool(name: str, force: bool = False) -> Dict[str, Any]:
         }
     
     # Verifica che il pool esista
-    pools = get_zfs_pools()
+    pools = await get_zfs_pools()
     pool_exists = any(pool["name"] == name for pool in pools)
     
     if not pool_exists:
@@ -351,7 +617,8 @@ def destroy_zfs_pool(name: str, force: bool = False) -> Dict[str, Any]:
     
     command.append(name)
     
-    result = run_command(command)
+    result = await run_command(command)
+    invalidate_zfs_inventory()
     
     if result["success"]:
         return {
@@ -371,8 +638,9 @@ def destroy_zfs_pool(name: str, force: bool = False) -> Dict[str, Any]:
             "error": error_msg
         }
 
-def create_zfs_dataset(pool_name: str, dataset_name: str, mount_point: Optional[str] = None, 
-                       quota: Optional[str] = None, compression: Optional[str] = None) -> Dict[str, Any]:
+async def create_zfs_dataset(pool_name: str, dataset_name: str, mount_point: Optional[str] = None, 
+                       quota: Optional[str] = None, compression: Optional[str] = None,
+                       recordsize: Optional[str] = None, special_small_blocks: Optional[str] = None) -> Dict[str, Any]:
     """
     Crea un nuovo dataset ZFS
     
@@ -382,6 +650,8 @@ def create_zfs_dataset(pool_name: str, dataset_name: str, mount_point: Optional[
         mount_point: Punto di montaggio (opzionale)
         quota: Quota per il dataset (opzionale)
         compression: Tipo di compressione (opzionale)
+        recordsize: Dimensione dei record, es. 16K, 128K, 1M (opzionale)
+        special_small_blocks: Blocchi fino a questa dimensione vanno sul vdev special (opzionale)
     
     Returns:
         Dizionario con il risultato dell'operazione
@@ -399,9 +669,16 @@ def create_zfs_dataset(pool_name: str, dataset_name: str, mount_point: Optional[
     if compression:
         command.extend(["-o", f"compression={compression}"])
     
+    if recordsize:
+        command.extend(["-o", f"recordsize={recordsize}"])
+    
+    if special_small_blocks:
+        command.extend(["-o", f"special_small_blocks={special_small_blocks}"])
+    
     command.append(full_name)
     
-    result = run_command(command)
+    result = await run_command(command)
+    invalidate_zfs_inventory()
     
     if result["success"]:
         return {
@@ -415,7 +692,7 @@ def create_zfs_dataset(pool_name: str, dataset_name: str, mount_point: Optional[
             "error": result["error"]
         }
 
-def destroy_zfs_dataset(name: str, recursive: bool = False, force: bool = False) -> Dict[str, Any]:
+async def destroy_zfs_dataset(name: str, recursive: bool = False, force: bool = False) -> Dict[str, Any]:
     """
     Distrugge un dataset ZFS
     
@@ -437,7 +714,8 @@ def destroy_zfs_dataset(name: str, recursive: bool = False, force: bool = False)
     
     command.append(name)
     
-    result = run_command(command)
+    result = await run_command(command)
+    invalidate_zfs_inventory()
     
     if result["success"]:
         return {
@@ -450,22 +728,90 @@ def destroy_zfs_dataset(name: str, recursive: bool = False, force: bool = False)
             "error": result["error"]
         }
 
-def get_zfs_pool_status(name: str) -> Dict[str, Any]:
+# Caratteri ammessi nel nome di uno snapshot (la parte dopo @)
+SNAPSHOT_NAME_RE = re.compile(r"^[A-Za-z0-9_.:-]+$")
+
+# Lunghezza massima degli argomenti di un singolo zfs destroy durante il pruning
+PRUNE_MAX_ARG_LENGTH = 65536
+
+async def create_zfs_snapshots(datasets: List[str], snapshot_name: str, recursive: bool = False) -> Dict[str, Any]:
     """
-    Ottiene lo stato dettagliato di un pool ZFS
+    Crea uno snapshot con lo stesso nome su uno o più dataset in modo atomico
+    
+    Tutti gli snapshot vengono creati con un solo `zfs snapshot` (più nomi e/o -r):
+    ZFS li crea nella stessa transazione, quindi sono coerenti tra loro.
     
     Args:
-        name: Nome del pool
+        datasets: Dataset di cui creare lo snapshot
+        snapshot_name: Nome dello snapshot (la parte dopo @)
+        recursive: Se True, crea lo snapshot anche di tutti i dataset figli
+    
+    Returns:
+        Dizionario con il risultato dell'operazione
+    """
+    if not datasets or not snapshot_name:
+        return {
+            "success": False,
+            "error": "Dataset e nome dello snapshot sono obbligatori"
+        }
+    
+    if not SNAPSHOT_NAME_RE.match(snapshot_name):
+        return {
+            "success": False,
+            "error": "Il nome dello snapshot può contenere solo lettere, numeri, '_', '.', ':' e '-'"
+        }
+    
+    command = ["zfs", "snapshot"]
+    if recursive:
+        command.append("-r")
+    
+    snapshots = [f"{dataset}@{snapshot_name}" for dataset in datasets]
+    command.extend(snapshots)
+    
+    result = await run_command(command)
+    invalidate_zfs_inventory()
+    
+    if result["success"]:
+        return {
+            "success": True,
+            "message": f"Snapshot '{snapshot_name}' creato su {len(datasets)} dataset",
+            "snapshots": snapshots
+        }
+    else:
+        return {
+            "success": False,
+            "error": result["error"]
+        }
+
+async def destroy_zfs_snapshot(name: str, recursive: bool = False) -> Dict[str, Any]:
+    """
+    Distrugge uno snapshot ZFS
+    
+    Args:
+        name: Nome completo dello snapshot (dataset@snapshot)
+        recursive: Se True, distrugge lo snapshot con lo stesso nome anche nei dataset figli
     
     Returns:
-        Dizionario con le informazioni sul pool
+        Dizionario con il risultato dell'operazione
     """
-    result = run_command(["zpool", "status", name])
+    if "@" not in name:
+        return {
+            "success": False,
+            "error": f"'{name}' non è il nome di uno snapshot (formato dataset@snapshot)"
+        }
+    
+    command = ["zfs", "destroy"]
+    if recursive:
+        command.append("-r")
+    command.append(name)
+    
+    result = await run_command(command)
+    invalidate_zfs_inventory()
     
     if result["success"]:
         return {
             "success": True,
-            "status": result["output"]
+            "message": f"Snapshot '{name}' distrutto con successo"
         }
     else:
         return {
@@ -473,7 +819,245 @@ def get_zfs_pool_status(name: str) -> Dict[str, Any]:
             "error": result["error"]
         }
 
-def get_zfs_pool_properties(name: str) -> Dict[str, Any]:
+def plan_snapshot_prune(snapshots: List[Dict[str, Any]], keep_last: Optional[int] = None,
+                        older_than: Optional[int] = None, prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Calcola in un solo passaggio gli snapshot da eliminare di un dataset
+    
+    Args:
+        snapshots: Snapshot del dataset ordinati dal più vecchio al più recente
+        keep_last: Numero di snapshot più recenti (tra quelli candidati) da conservare
+        older_than: Elimina solo gli snapshot creati prima di questo timestamp Unix
+        prefix: Considera solo gli snapshot il cui nome inizia con questo prefisso
+    
+    Returns:
+        Elenco degli snapshot da eliminare, nell'ordine di creazione
+    """
+    candidates = [snap for snap in snapshots if not prefix or snap["snapshot"].startswith(prefix)]
+    
+    if keep_last is not None:
+        candidates = candidates[:max(len(candidates) - keep_last, 0)]
+    
+    if older_than is not None:
+        candidates = [snap for snap in candidates if snap["creation"] < older_than]
+    
+    return candidates
+
+def build_destroy_ranges(snapshots: List[Dict[str, Any]], to_delete: List[Dict[str, Any]]) -> List[str]:
+    """
+    Comprime gli snapshot da eliminare in intervalli `primo%ultimo` per zfs destroy
+    
+    Un intervallo elimina tutti gli snapshot compresi tra i due estremi, quindi viene
+    usato solo per sequenze contigue (nell'ordine di creazione) interamente da eliminare.
+    """
+    delete_names = {snap["snapshot"] for snap in to_delete}
+    ranges = []
+    run: List[str] = []
+    
+    for snap in snapshots + [None]:
+        if snap is not None and snap["snapshot"] in delete_names:
+            run.append(snap["snapshot"])
+            continue
+        if run:
+            ranges.append(run[0] if len(run) == 1 else f"{run[0]}%{run[-1]}")
+            run = []
+    
+    return ranges
+
+async def _list_snapshots_by_txg(dataset: str, recursive: bool) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    # Lettura diretta (senza cache): il pruning deve lavorare su dati aggiornati.
+    # createtxg dà l'ordine esatto di creazione anche per snapshot creati nello stesso secondo
+    command = ["zfs", "list", "-H", "-p", "-t", "snapshot", "-o", "name,createtxg,creation", "-s", "createtxg"]
+    command.extend(["-r", dataset] if recursive else ["-d", "1", dataset])
+    
+    result = await run_command(command)
+    if not result["success"]:
+        return None
+    
+    by_dataset: Dict[str, List[Dict[str, Any]]] = {}
+    for line in result["output"].splitlines():
+        parts = line.split("\t")
+        if len(parts) >= 3 and "@" in parts[0]:
+            ds, snapshot = parts[0].split("@", 1)
+            by_dataset.setdefault(ds, []).append({
+                "snapshot": snapshot,
+                "createtxg": int(parts[1]),
+                "creation": int(parts[2])
+            })
+    
+    return by_dataset
+
+async def prune_zfs_snapshots(dataset: str, keep_last: Optional[int] = None, older_than: Optional[int] = None,
+                              prefix: Optional[str] = None, recursive: bool = False,
+                              dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Elimina gli snapshot secondo una politica di conservazione
+    
+    L'insieme da eliminare viene calcolato in un solo passaggio e distrutto con un
+    `zfs destroy dataset@a%b,c,d%e` per dataset invece di un processo per snapshot.
+    
+    Args:
+        dataset: Dataset di cui potare gli snapshot
+        keep_last: Numero di snapshot più recenti da conservare
+        older_than: Elimina solo gli snapshot creati prima di questo timestamp Unix
+        prefix: Considera solo gli snapshot con questo prefisso (es. "auto-")
+        recursive: Se True, applica la politica anche ai dataset figli
+        dry_run: Se True, restituisce solo il piano senza eliminare nulla
+    
+    Returns:
+        Dizionario con il piano di eliminazione e il risultato per dataset
+    """
+    if keep_last is None and older_than is None:
+        return {
+            "success": False,
+            "error": "Specifica almeno keep_last o older_than"
+        }
+    
+    if keep_last is not None and keep_last < 0:
+        return {
+            "success": False,
+            "error": "keep_last deve essere maggiore o uguale a zero"
+        }
+    
+    by_dataset = await _list_snapshots_by_txg(dataset, recursive)
+    if by_dataset is None:
+        return {
+            "success": False,
+            "error": f"Impossibile elencare gli snapshot di '{dataset}'"
+        }
+    
+    results = []
+    total_deleted = 0
+    errors = []
+    
+    for ds, snapshots in by_dataset.items():
+        to_delete = plan_snapshot_prune(snapshots, keep_last, older_than, prefix)
+        if not to_delete:
+            continue
+        
+        ranges = build_destroy_ranges(snapshots, to_delete)
+        entry = {
+            "dataset": ds,
+            "count": len(to_delete),
+            "ranges": ranges,
+            "success": True
+        }
+        
+        if not dry_run:
+            # Divide gli intervalli in blocchi per non superare la lunghezza massima degli argomenti
+            chunks: List[List[str]] = [[]]
+            length = 0
+            for spec in ranges:
+                if chunks[-1] and length + len(spec) + 1 > PRUNE_MAX_ARG_LENGTH:
+                    chunks.append([])
+                    length = 0
+                chunks[-1].append(spec)
+                length += len(spec) + 1
+            
+            for chunk in chunks:
+                result = await run_command(["zfs", "destroy", f"{ds}@{','.join(chunk)}"], timeout=600)
+                if not result["success"]:
+                    entry["success"] = False
+                    entry["error"] = result["error"]
+                    errors.append(f"{ds}: {result['error']}")
+                    break
+            
+            if entry["success"]:
+                total_deleted += len(to_delete)
+        
+        results.append(entry)
+    
+    if not dry_run:
+        invalidate_zfs_inventory()
+    
+    response = {
+        "success": not errors,
+        "dry_run": dry_run,
+        "deleted": total_deleted,
+        "planned": sum(entry["count"] for entry in results),
+        "datasets": results
+    }
+    if errors:
+        response["error"] = "; ".join(errors)
+    else:
+        response["message"] = (f"{response['planned']} snapshot da eliminare" if dry_run
+                               else f"{total_deleted} snapshot eliminati")
+    
+    return response
+
+async def get_zfs_pool_status(name: str) -> Dict[str, Any]:
+    """
+    Ottiene lo stato dettagliato di un pool ZFS
+    
+    Args:
+        name: Nome del pool
+    
+    Returns:
+        Dizionario con il testo di zpool status e il modello strutturato (vdev, errori, scan)
+    """
+    entry = await _status_cache.get_or_load(("pool", name), lambda: _load_zfs_pool_status(name))
+    
+    if entry is None:
+        return {
+            "success": False,
+            "error": f"Pool ZFS '{name}' non trovato"
+        }
+    
+    return {
+        "success": True,
+        "status": entry["raw"],
+        "pool": entry["pool"]
+    }
+
+async def _load_zfs_pool_status(name: str) -> Optional[Dict[str, Any]]:
+    # -P: percorsi completi dei dispositivi, -p: contatori in formato esatto
+    result = await run_command(["zpool", "status", "-P", "-p", name])
+    
+    if not result["success"]:
+        return None
+    
+    blocks = split_pool_blocks(result["output"])
+    if not blocks:
+        return None
+    
+    return {"raw": blocks[0], "pool": parse_pool_block(blocks[0])}
+
+async def get_all_zfs_pool_status() -> Dict[str, Any]:
+    """
+    Ottiene lo stato di tutti i pool ZFS con una sola esecuzione di zpool status
+    
+    Returns:
+        Dizionario con l'elenco dei pool (testo e modello strutturato di ciascuno)
+    """
+    entries = await _status_cache.get_or_load("all", _load_all_zfs_pool_status)
+    
+    if entries is None:
+        return {
+            "success": False,
+            "error": "Impossibile ottenere lo stato dei pool ZFS"
+        }
+    
+    return {
+        "success": True,
+        "pools": entries
+    }
+
+async def _load_all_zfs_pool_status() -> Optional[List[Dict[str, Any]]]:
+    result = await run_command(["zpool", "status", "-P", "-p"])
+    
+    if not result["success"]:
+        return None
+    
+    entries = []
+    for block in split_pool_blocks(result["output"]):
+        entry = {"raw": block, "pool": parse_pool_block(block)}
+        # Popola anche la cache del singolo pool: aprire un pool dopo la dashboard non costa nulla
+        _status_cache.set(("pool", entry["pool"]["name"]), entry)
+        entries.append(entry)
+    
+    return entries
+
+async def get_zfs_pool_properties(name: str) -> Dict[str, Any]:
     """
     Ottiene le proprietà di un pool ZFS
     
@@ -483,7 +1067,7 @@ def get_zfs_pool_properties(name: str) -> Dict[str, Any]:
     Returns:
         Dizionario con le proprietà del pool
     """
-    result = run_command(["zpool", "get", "all", name, "-H"])
+    result = await run_command(["zpool", "get", "all", name, "-H"])
     
     if not result["success"]:
         return {
@@ -502,7 +1086,7 @@ def get_zfs_pool_properties(name: str) -> Dict[str, Any]:
         "properties": properties
     }
 
-def get_zfs_dataset_properties(name: str) -> Dict[str, Any]:
+async def get_zfs_dataset_properties(name: str) -> Dict[str, Any]:
     """
     Ottiene le proprietà di un dataset ZFS
     
@@ -512,7 +1096,7 @@ def get_zfs_dataset_properties(name: str) -> Dict[str, Any]:
     Returns:
         Dizionario con le proprietà del dataset
     """
-    result = run_command(["zfs", "get", "all", name, "-H"])
+    result = await run_command(["zfs", "get", "all", name, "-H"])
     
     if not result["success"]:
         return {
@@ -529,4 +1113,102 @@ def get_zfs_dataset_properties(name: str) -> Dict[str, Any]:
     return {
         "success": True,
         "properties": properties
-    }
\ No newline at end of file
+    }
+
+def parse_property_value(value: str) -> Any:
+    """
+    Converte il valore di una proprietà letto con `zfs get -p` nel tipo corrispondente:
+    intero (byte, contatori, timestamp), float (rapporti come compressratio) o stringa.
+    "-" (non applicabile) diventa None.
+    """
+    if value in ("-", ""):
+        return None
+    if not re.match(r"^-?\d+(\.\d+)?x?$", value):
+        return value
+    if value.endswith("x"):
+        return float(value[:-1])
+    return float(value) if "." in value else int(value)
+
+async def get_zfs_bulk_properties(datasets: List[str], properties: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Ottiene le proprietà di più dataset con un solo `zfs get`
+    
+    Solo le coppie (dataset, proprietà) non presenti in cache vengono lette, sempre con
+    un unico processo: aprire un pool con 200 dataset costa un fork invece di 200.
+    
+    Args:
+        datasets: Nomi dei dataset (o dei pool, per il dataset radice)
+        properties: Proprietà da leggere (default DEFAULT_BULK_PROPERTIES)
+    
+    Returns:
+        Dizionario con {dataset -> {proprietà -> {value, raw, source}}} e gli eventuali errori
+    """
+    properties = properties or DEFAULT_BULK_PROPERTIES
+    
+    if not datasets:
+        return {
+            "success": False,
+            "error": "Nessun dataset specificato"
+        }
+    
+    invalid = [prop for prop in properties if prop == "all" or not PROPERTY_NAME_RE.match(prop)]
+    if invalid:
+        return {
+            "success": False,
+            "error": f"Proprietà non valide: {', '.join(invalid)}"
+        }
+    
+    # Unione dei dataset e delle proprietà mancanti in cache: una sola lettura per tutti
+    missing_datasets = []
+    missing_properties = set()
+    for dataset in datasets:
+        missing = [prop for prop in properties if _property_cache.get((dataset, prop)) is MISSING]
+        if missing:
+            missing_datasets.append(dataset)
+            missing_properties.update(missing)
+    
+    errors: Dict[str, str] = {}
+    if missing_datasets:
+        props = [prop for prop in properties if prop in missing_properties]
+        command = ["zfs", "get", "-H", "-p", "-o", "name,property,value,source", ",".join(props)]
+        command.extend(missing_datasets)
+        # check=False: se un dataset non esiste zfs get fallisce ma restituisce comunque gli altri
+        result = await run_command(command, check=False)
+        
+        if result["output"] is None:
+            return {
+                "success": False,
+                "error": result["error"]
+            }
+        
+        found = set()
+        for line in result["output"].splitlines():
+            parts = line.split("\t")
+            if len(parts) < 4:
+                continue
+            name, prop, raw, source = parts[0], parts[1], parts[2], parts[3]
+            found.add(name)
+            _property_cache.set((name, prop), {
+                "value": parse_property_value(raw),
+                "raw": raw,
+                "source": source
+            })
+        
+        for dataset in missing_datasets:
+            if dataset not in found:
+                errors[dataset] = result["error"] or f"Dataset '{dataset}' non trovato"
+    
+    values: Dict[str, Dict[str, Any]] = {}
+    for dataset in datasets:
+        if dataset in errors:
+            continue
+        values[dataset] = {}
+        for prop in properties:
+            entry = _property_cache.get((dataset, prop))
+            values[dataset][prop] = entry if entry is not MISSING else None
+    
+    return {
+        "success": True,
+        "properties": values,
+        "errors": errors
+    }
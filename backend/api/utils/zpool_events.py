@@ -0,0 +1,215 @@
+"""
+Eventi ZFS in tempo reale da `zpool events -f`
+
+Un solo task in background segue `zpool events -f -H -v`: ogni evento (guasti, inizio e fine
+di scrub/resilver, modifiche alla configurazione, operazioni sui dataset) invalida le cache
+interessate e viene pubblicato sul Broadcaster, a cui i client si collegano via SSE invece
+di interrogare periodicamente lo stato dei pool.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from typing import List, Dict, Optional, Any, Set, Tuple
+
+from .command_runner import spawn_process, terminate_process
+from .streaming import Broadcaster
+from .zfs_utils import invalidate_zfs_inventory, invalidate_zfs_pool_status
+
+logger = logging.getLogger(__name__)
+
+# Numero di eventi conservati per i client che si collegano
+ZPOOL_EVENTS_HISTORY = 200
+
+# Attesa (secondi) prima di riavviare zpool events se termina, raddoppiata ad ogni errore
+ZPOOL_EVENTS_RESTART_DELAY = 5
+ZPOOL_EVENTS_MAX_RESTART_DELAY = 300
+
+# Eventi che modificano pool, vdev o dataset: invalidano l'intero inventario ZFS
+INVENTORY_EVENTS = {
+    "pool_create", "pool_destroy", "pool_import", "pool_export", "pool_reguid",
+    "vdev_add", "vdev_remove", "vdev_attach", "vdev_clear", "vdev_online", "vdev_spare",
+    "config_sync", "history_event"
+}
+
+_FIELD_RE = re.compile(r"^\s+(\w+) = (.*)$")
+
+def _parse_field_value(value: str) -> Any:
+    value = value.strip()
+    if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+        return value[1:-1]
+    if re.match(r"^0x[0-9a-fA-F]+$", value):
+        return int(value, 16)
+    if re.match(r"^-?\d+$", value):
+        return int(value)
+    return value
+
+def parse_event_block(lines: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Analizza un evento di `zpool events -H -v`: riga di intestazione (ora e classe)
+    seguita dai campi "nome = valore" indentati
+    """
+    if not lines or not lines[0].strip():
+        return None
+
+    header = lines[0].strip()
+    parts = header.split("\t") if "\t" in header else header.rsplit(None, 1)
+    event_class = parts[-1].strip()
+
+    fields: Dict[str, Any] = {}
+    for line in lines[1:]:
+        match = _FIELD_RE.match(line)
+        if match:
+            fields[match.group(1)] = _parse_field_value(match.group(2))
+
+    event_class = fields.get("class", event_class)
+    category, _, event_type = event_class.partition(".fs.zfs.")
+
+    timestamp = None
+    raw_time = fields.get("time")
+    if isinstance(raw_time, str):
+        # "time = 0x<secondi> 0x<nanosecondi>"
+        values = raw_time.split()
+        try:
+            timestamp = int(values[0], 16) + (int(values[1], 16) / 1e9 if len(values) > 1 else 0)
+        except ValueError:
+            timestamp = None
+    elif isinstance(raw_time, int):
+        timestamp = float(raw_time)
+
+    return {
+        "event": "zfs",
+        "class": event_class,
+        "category": category,
+        "type": event_type or event_class,
+        "time": parts[0].strip() if len(parts) > 1 else None,
+        "timestamp": timestamp,
+        "eid": fields.get("eid"),
+        "pool": fields.get("pool"),
+        "pool_state": fields.get("pool_state_str") or fields.get("pool_state"),
+        "vdev_path": fields.get("vdev_path"),
+        "vdev_state": fields.get("vdev_state_str") or fields.get("vdev_state"),
+        "history_command": fields.get("history_internal_name"),
+        "history_dataset": fields.get("history_dsname"),
+        "fields": fields
+    }
+
+def apply_event(event: Dict[str, Any]) -> None:
+    """
+    Invalida le cache interessate da un evento
+    """
+    if event["type"] in INVENTORY_EVENTS or not event.get("pool"):
+        invalidate_zfs_inventory()
+    else:
+        # Errori, cambi di stato, scrub e resilver cambiano solo lo stato del pool
+        invalidate_zfs_pool_status(event["pool"])
+
+class ZpoolEventFollower:
+    """
+    Processo `zpool events -f` sempre attivo, riavviato automaticamente se termina
+    """
+
+    def __init__(self, history: int = ZPOOL_EVENTS_HISTORY):
+        self.events: deque = deque(maxlen=history)
+        self.broadcaster = Broadcaster()
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._task: Optional[asyncio.Task] = None
+        self._started_at = 0.0
+        # Eventi nella storia (eid, ora, classe) e riavvii del processo
+        self._seen: Set[Tuple[Any, Any, str]] = set()
+        self._restarted = False
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._process is not None:
+            await terminate_process(self._process)
+            self._process = None
+
+    async def _run(self) -> None:
+        delay = ZPOOL_EVENTS_RESTART_DELAY
+        while True:
+            self._started_at = time.time()
+            try:
+                self._process = await spawn_process(["zpool", "events", "-f", "-H", "-v"],
+                                                    stderr=asyncio.subprocess.DEVNULL)
+            except OSError as e:
+                logger.warning(f"Impossibile avviare zpool events: {e}")
+            else:
+                logger.info("Lettore zpool events avviato")
+                await self._read_loop(self._process)
+                await self._process.wait()
+                if time.time() - self._started_at > ZPOOL_EVENTS_MAX_RESTART_DELAY:
+                    delay = ZPOOL_EVENTS_RESTART_DELAY
+                logger.warning(f"zpool events terminato (codice {self._process.returncode})")
+
+            self._restarted = True
+            # Gli eventi persi durante l'interruzione non sono noti: i dati in cache non sono affidabili
+            invalidate_zfs_inventory()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, ZPOOL_EVENTS_MAX_RESTART_DELAY)
+
+    async def _read_loop(self, process: asyncio.subprocess.Process) -> None:
+        block: List[str] = []
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            text = line.decode(errors="replace").rstrip("\n")
+
+            # Un evento inizia con una riga non indentata e termina con una riga vuota
+            if not text.strip() or (not text[0].isspace() and block):
+                self._handle_block(block)
+                block = [text] if text.strip() else []
+            else:
+                block.append(text)
+        self._handle_block(block)
+
+    @staticmethod
+    def _event_key(event: Dict[str, Any]) -> Tuple[Any, Any, str]:
+        return (event["eid"], event["timestamp"], event["class"])
+
+    def _handle_block(self, block: List[str]) -> None:
+        event = parse_event_block(block)
+        if event is None:
+            return
+
+        # Ad ogni avvio zpool events riporta anche gli eventi passati: entrano nella storia
+        # solo al primo avvio e non vanno ripubblicati
+        replayed = event["timestamp"] is not None and event["timestamp"] < self._started_at - 2
+        key = self._event_key(event)
+        if key in self._seen or (replayed and self._restarted):
+            return
+        if len(self.events) == self.events.maxlen:
+            self._seen.discard(self._event_key(self.events[0]))
+        self.events.append(event)
+        self._seen.add(key)
+
+        if replayed:
+            return
+
+        apply_event(event)
+        self.broadcaster.publish(event)
+
+    def get_history(self, limit: Optional[int] = None, pool: Optional[str] = None) -> Dict[str, Any]:
+        events = [event for event in self.events if pool is None or event.get("pool") == pool]
+        if limit:
+            events = events[-limit:]
+        return {
+            "running": self.running,
+            "events": events
+        }
+
+# Istanza condivisa, avviata all'avvio dell'applicazione
+event_follower = ZpoolEventFollower()
@@ -0,0 +1,211 @@
+"""
+Telemetria I/O dei pool ZFS da `zpool iostat`
+
+Un solo processo `zpool iostat -v -l -H -p -T u <intervallo>` viene avviato al primo client
+in ascolto e condiviso da tutti: i campioni (operazioni, banda e latenze per ogni vdev)
+finiscono in un ring buffer e vengono distribuiti via Server-Sent Events.
+Se il processo termina viene riavviato finché ci sono client; quando non ne resta
+nessuno viene fermato.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import List, Dict, Optional, Any
+
+from .command_runner import spawn_process, terminate_process
+from .streaming import Broadcaster
+from .zfs_utils import get_zfs_pools, get_zfs_inventory_generation
+
+logger = logging.getLogger(__name__)
+
+# Intervallo di campionamento (secondi) e numero di campioni conservati
+IOSTAT_INTERVAL = 2
+IOSTAT_HISTORY = 300
+
+# Attesa (secondi) prima di riavviare zpool iostat se termina, raddoppiata ad ogni errore
+IOSTAT_RESTART_DELAY = 5
+IOSTAT_MAX_RESTART_DELAY = 60
+
+# Colonne di `zpool iostat -v -l -H -p` dopo il nome (le ultime dipendono dalla versione di ZFS)
+IOSTAT_COLUMNS = [
+    "alloc", "free",
+    "read_ops", "write_ops",
+    "read_bytes", "write_bytes",
+    "total_wait_read", "total_wait_write",
+    "disk_wait_read", "disk_wait_write",
+    "syncq_wait_read", "syncq_wait_write",
+    "asyncq_wait_read", "asyncq_wait_write",
+    "scrub_wait", "trim_wait", "rebuild_wait"
+]
+
+# Righe di raggruppamento senza statistiche proprie
+AUX_GROUPS = {"logs", "cache", "spares", "special", "dedup"}
+
+def _parse_value(value: str) -> Optional[int]:
+    if value in ("-", ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return int(float(value))
+        except ValueError:
+            return None
+
+def parse_iostat_row(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Analizza una riga di `zpool iostat -H -p` (nome e valori separati da tab)
+    """
+    parts = line.strip().split("\t") if "\t" in line else line.split()
+    if len(parts) < 2:
+        return None
+    row: Dict[str, Any] = {"name": parts[0]}
+    for column, value in zip(IOSTAT_COLUMNS, parts[1:]):
+        row[column] = _parse_value(value)
+    return row
+
+def group_iostat_rows(rows: List[Dict[str, Any]], pool_names: set) -> Dict[str, Dict[str, Any]]:
+    """
+    Raggruppa le righe di un intervallo per pool: la riga del pool e quelle dei suoi vdev
+    """
+    pools: Dict[str, Dict[str, Any]] = {}
+    current = None
+
+    for row in rows:
+        name = row["name"]
+        if name in pool_names or current is None:
+            current = {"stats": row, "vdevs": []}
+            pools[name] = current
+        elif name in AUX_GROUPS and all(row.get(column) is None for column in IOSTAT_COLUMNS):
+            continue
+        else:
+            current["vdevs"].append(row)
+
+    return pools
+
+class ZpoolIostatReader:
+    """
+    Lettore condiviso di `zpool iostat`: avviato con il primo sottoscrittore, fermato con l'ultimo
+    """
+
+    def __init__(self, interval: int = IOSTAT_INTERVAL, history: int = IOSTAT_HISTORY):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=history)
+        self.broadcaster = Broadcaster(on_first_subscriber=self.start, on_no_subscribers=self.stop)
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pool_names: set = set()
+        self._pool_generation = -1
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        process = self._process
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if process is not None:
+            await terminate_process(process)
+            # Durante l'attesa un nuovo sottoscrittore può aver avviato un altro processo
+            if self._process is process:
+                self._process = None
+        logger.info("Lettore zpool iostat fermato")
+
+    async def _refresh_pool_names(self) -> None:
+        # Nomi dei pool, per riconoscere le righe dei pool da quelle dei vdev
+        self._pool_generation = get_zfs_inventory_generation()
+        self._pool_names = {pool["name"] for pool in await get_zfs_pools()}
+
+    async def _run(self) -> None:
+        # zpool iostat termina ad esempio se non ci sono pool: viene riavviato
+        # finché ci sono client in ascolto, con attesa crescente tra i tentativi
+        delay = IOSTAT_RESTART_DELAY
+        while True:
+            await self._refresh_pool_names()
+            started = time.monotonic()
+
+            # -T u: un timestamp Unix prima di ogni intervallo separa i campioni
+            command = ["zpool", "iostat", "-v", "-l", "-H", "-p", "-T", "u", str(self.interval)]
+            try:
+                process = await spawn_process(command, stderr=asyncio.subprocess.DEVNULL)
+            except OSError as e:
+                logger.error(f"Impossibile avviare zpool iostat: {e}")
+            else:
+                self._process = process
+                try:
+                    logger.info("Lettore zpool iostat avviato")
+                    await self._read_loop(process)
+                    await process.wait()
+                    logger.warning(f"zpool iostat terminato (codice {process.returncode})")
+                finally:
+                    # Anche se il task viene annullato: il processo non deve restare orfano
+                    await terminate_process(process)
+                    if self._process is process:
+                        self._process = None
+                if time.monotonic() - started > IOSTAT_MAX_RESTART_DELAY:
+                    delay = IOSTAT_RESTART_DELAY
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, IOSTAT_MAX_RESTART_DELAY)
+
+    async def _read_loop(self, process: asyncio.subprocess.Process) -> None:
+        rows: List[Dict[str, Any]] = []
+        timestamp = None
+        # Il primo intervallo riporta le medie dall'avvio del sistema: viene scartato
+        first = True
+
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            text = line.decode(errors="replace").rstrip("\n")
+            if not text.strip():
+                continue
+
+            if text.strip().isdigit():
+                # Inizio di un nuovo intervallo: chiudi il campione precedente
+                if timestamp is not None and rows and not first:
+                    if self._pool_generation != get_zfs_inventory_generation():
+                        # Pool creati, importati o distrutti dall'ultima lettura dei nomi
+                        await self._refresh_pool_names()
+                    self._emit(timestamp, rows)
+                if timestamp is not None:
+                    first = False
+                timestamp = int(text.strip())
+                rows = []
+                continue
+
+            row = parse_iostat_row(text)
+            if row is not None:
+                rows.append(row)
+
+    def _emit(self, timestamp: int, rows: List[Dict[str, Any]]) -> None:
+        sample = {
+            "timestamp": timestamp,
+            "interval": self.interval,
+            "pools": group_iostat_rows(rows, self._pool_names)
+        }
+        self.samples.append(sample)
+        self.broadcaster.publish(sample)
+
+    def get_history(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        samples = list(self.samples)
+        if limit:
+            samples = samples[-limit:]
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": samples
+        }
+
+# Istanza condivisa da tutte le richieste
+iostat_reader = ZpoolIostatReader()
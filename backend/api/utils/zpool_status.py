@@ -0,0 +1,245 @@
+"""
+Parser dell'output di `zpool status`
+
+Trasforma il testo di `zpool status -P -p` (uno o più pool) in un modello strutturato:
+stato del pool, albero dei vdev con i contatori di errore e avanzamento di scrub/resilver.
+"""
+
+import re
+from typing import List, Dict, Optional, Any
+
+# Campi di primo livello riconosciuti nell'output di zpool status
+STATUS_FIELDS = {"pool", "id", "state", "status", "action", "see", "scan", "scrub",
+                 "remove", "checkpoint", "config", "errors"}
+
+# Gruppi di vdev ausiliari che compaiono allo stesso livello del pool nella sezione config
+AUX_GROUPS = {"logs", "cache", "spares", "special", "dedup"}
+
+SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3,
+              "T": 1024 ** 4, "P": 1024 ** 5, "E": 1024 ** 6, "Z": 1024 ** 7}
+
+_FIELD_RE = re.compile(r"^\s*([a-z]+):\s?(.*)$")
+_SIZE = r"([\d.]+[BKMGTPEZ]?)"
+
+def parse_human_size(value: Optional[str]) -> Optional[int]:
+    """
+    Converte una dimensione in formato ZFS (es. "1.23T", "600G", "0B", "1234") in byte
+    """
+    if not value:
+        return None
+    match = re.match(r"^([\d.]+)([BKMGTPEZ]?)(?:i?B)?$", value.strip())
+    if not match:
+        return None
+    try:
+        return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+    except ValueError:
+        return None
+
+def split_pool_blocks(output: str) -> List[str]:
+    """
+    Divide l'output di `zpool status` (più pool) in un blocco di testo per pool
+    """
+    blocks: List[List[str]] = []
+    for line in output.splitlines():
+        if re.match(r"^\s*pool:", line):
+            blocks.append([])
+        if blocks:
+            blocks[-1].append(line)
+    return ["\n".join(block) for block in blocks]
+
+def parse_zpool_status(output: str) -> List[Dict[str, Any]]:
+    """
+    Analizza l'output completo di `zpool status` e restituisce un modello per ogni pool
+    """
+    return [parse_pool_block(block) for block in split_pool_blocks(output)]
+
+def parse_pool_block(block: str) -> Dict[str, Any]:
+    """
+    Analizza il blocco di testo di un singolo pool
+    """
+    fields: Dict[str, str] = {}
+    config_lines: List[str] = []
+    current = None
+
+    for line in block.splitlines():
+        match = _FIELD_RE.match(line)
+        if match and match.group(1) in STATUS_FIELDS and (current != "config" or match.group(1) == "errors"):
+            current = match.group(1)
+            fields[current] = match.group(2).strip()
+            continue
+
+        if current == "config":
+            config_lines.append(line)
+        elif current and line.strip():
+            # Riga di continuazione di un campo su più righe (status, action, scan, ...)
+            fields[current] = f"{fields[current]} {line.strip()}".strip()
+
+    config = parse_config(config_lines)
+    scan_text = fields.get("scan") or fields.get("scrub")
+
+    return {
+        "name": fields.get("pool", ""),
+        "state": fields.get("state", "UNKNOWN"),
+        "status": fields.get("status"),
+        "action": fields.get("action"),
+        "see": fields.get("see"),
+        "scan": parse_scan(scan_text) if scan_text else None,
+        "errors": fields.get("errors"),
+        "vdevs": config["vdevs"],
+        "logs": config["logs"],
+        "cache": config["cache"],
+        "spares": config["spares"],
+        "special": config["special"],
+        "dedup": config["dedup"]
+    }
+
+def _parse_counter(value: str) -> Optional[int]:
+    return parse_human_size(value)
+
+def parse_config(lines: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Costruisce l'albero dei vdev dalla sezione config (la profondità è data dall'indentazione)
+    """
+    result: Dict[str, List[Dict[str, Any]]] = {"vdevs": [], "logs": [], "cache": [],
+                                               "spares": [], "special": [], "dedup": []}
+    # Pila di (profondità, nodo) per agganciare ogni vdev al suo genitore
+    stack: List[Any] = []
+    group = None
+    base_indent = None
+
+    for line in lines:
+        if not line.strip():
+            continue
+        expanded = line.expandtabs(8)
+        indent = len(expanded) - len(expanded.lstrip())
+        parts = expanded.split()
+
+        if parts[0] == "NAME" and "STATE" in parts:
+            base_indent = indent
+            continue
+        if base_indent is None:
+            continue
+
+        depth = (indent - base_indent) // 2
+
+        if depth == 0:
+            stack = []
+            if parts[0] in AUX_GROUPS and len(parts) == 1:
+                group = parts[0]
+            else:
+                # Radice del pool: i figli sono i vdev di primo livello
+                group = "vdevs"
+                stack = [(0, None)]
+            continue
+
+        node = {
+            "name": parts[0],
+            "state": parts[1] if len(parts) > 1 else None,
+            "read": _parse_counter(parts[2]) if len(parts) > 4 else None,
+            "write": _parse_counter(parts[3]) if len(parts) > 4 else None,
+            "cksum": _parse_counter(parts[4]) if len(parts) > 4 else None,
+            "message": " ".join(parts[5:]) if len(parts) > 5 else None,
+            "path": parts[0] if parts[0].startswith("/") else None,
+            "children": []
+        }
+
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        parent = stack[-1][1] if stack else None
+
+        if parent is not None:
+            parent["children"].append(node)
+        elif group:
+            result[group].append(node)
+
+        stack.append((depth, node))
+
+    return result
+
+def iter_leaf_vdevs(pool: Dict[str, Any]):
+    """
+    Itera su tutti i dispositivi foglia (dischi/partizioni) di un pool, inclusi log, cache e spare
+    """
+    pending = []
+    for group in ("vdevs", "logs", "cache", "spares", "special", "dedup"):
+        pending.extend(pool.get(group) or [])
+    while pending:
+        node = pending.pop()
+        if node["children"]:
+            pending.extend(node["children"])
+        else:
+            yield node
+
+def _parse_duration(text: str) -> Optional[int]:
+    # Formati: "1 days 02:03:04", "00:47:49", "0h5m"
+    match = re.search(r"(?:(\d+) days? )?(\d+):(\d{2}):(\d{2})", text)
+    if match:
+        days = int(match.group(1) or 0)
+        return days * 86400 + int(match.group(2)) * 3600 + int(match.group(3)) * 60 + int(match.group(4))
+    match = re.search(r"(\d+)h(\d+)m", text)
+    if match:
+        return int(match.group(1)) * 3600 + int(match.group(2)) * 60
+    return None
+
+def parse_scan(text: str) -> Dict[str, Any]:
+    """
+    Analizza la riga scan (scrub/resilver): stato, percentuale, velocità ed ETA
+    """
+    scan: Dict[str, Any] = {
+        "function": None,
+        "state": "none",
+        "percent": None,
+        "rate": None,
+        "eta_seconds": None,
+        "scanned": None,
+        "issued": None,
+        "total": None,
+        "repaired": None,
+        "errors": None,
+        "raw": text
+    }
+
+    match = re.match(r"^(scrub|resilver)", text)
+    if match:
+        scan["function"] = match.group(1)
+
+    if "in progress" in text:
+        scan["state"] = "in_progress"
+    elif "canceled" in text:
+        scan["state"] = "canceled"
+    elif "paused" in text:
+        scan["state"] = "paused"
+    elif scan["function"] and ("repaired" in text or "resilvered" in text):
+        scan["state"] = "finished"
+
+    match = re.search(r"([\d.]+)% done", text)
+    if match:
+        scan["percent"] = float(match.group(1))
+
+    # Formato attuale: "X scanned at R/s, Y issued at R/s, Z total"
+    # Formato precedente: "X scanned out of Z at R/s"
+    match = re.search(_SIZE + r" scanned", text)
+    if match:
+        scan["scanned"] = parse_human_size(match.group(1))
+    match = re.search(_SIZE + r" issued", text)
+    if match:
+        scan["issued"] = parse_human_size(match.group(1))
+    match = re.search(_SIZE + r" total", text) or re.search(r"out of " + _SIZE, text)
+    if match:
+        scan["total"] = parse_human_size(match.group(1))
+    match = re.search(r"issued at " + _SIZE + r"/s", text) or re.search(r" at " + _SIZE + r"/s", text)
+    if match:
+        scan["rate"] = parse_human_size(match.group(1))
+
+    match = re.search(r"([\d:hm ]+|\d+ days? [\d:]+) to go", text)
+    if match:
+        scan["eta_seconds"] = _parse_duration(match.group(1))
+
+    match = re.search(_SIZE + r" (?:repaired|resilvered)", text) or re.search(r"repaired " + _SIZE, text)
+    if match:
+        scan["repaired"] = parse_human_size(match.group(1))
+    match = re.search(r"with (\d+) errors", text)
+    if match:
+        scan["errors"] = int(match.group(1))
+
+    return scan
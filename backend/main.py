@@ -1,13 +1,29 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import os
+import secrets
+import time
 from sqlalchemy.orm import Session
 
-from api.routes import disk, auth, zfs, docker, system, updates, vdsm_network
+from api.routes import disk, auth, zfs, docker, system, updates, vdsm_network, jobs, metrics
 from api.database import get_db
 from api.auth import get_current_admin, init_admin_user
+from api.utils.command_runner import bind_client_request
+from api.utils.zfs_arc import arc_collector
+from api.utils.zpool_events import event_follower
+from api.utils.smart import smart_monitor
+from api.utils.diskstats import diskstats_collector
+from api.utils.hotplug import hotplug_monitor
+from api.utils.jobs import recover_interrupted_jobs
+from api.utils.system_sampler import system_sampler
+from api.utils.metrics_store import metrics_store
+from api.utils.zfs_utils import get_zfs_pool_metrics, get_zfs_dataset_metrics
+from api.utils.docker_utils import get_container_metrics
+from api.utils.services import get_service_metrics
+from api.utils.prometheus import render_metrics, request_latency, PROMETHEUS_CONTENT_TYPE
 
 app = FastAPI(
     title="ZFS Disk Management API",
@@ -25,32 +41,101 @@ app.add_middleware(
 )
 
 # Middleware per verificare l'autenticazione per tutte le API tranne /api/auth/login
-@app.middleware("http")
-async def auth_middleware(request: Request, call_next):
-    # Escludi le rotte di autenticazione e la documentazione
-    excluded_paths = ["/api/auth/login", "/docs", "/redoc", "/openapi.json"]
-    
-    if any(request.url.path.startswith(path) for path in excluded_paths):
-        return await call_next(request)
-    
-    # Verifica il cookie di sessione
-    session_token = request.cookies.get("session_token")
-    
-    # Se non c'è un token di sessione, continua comunque (la protezione avverrà a livello di endpoint)
-    if not session_token:
-        return await call_next(request)
-    
-    # Continua con la richiesta
-    return await call_next(request)
+# Middleware ASGI puro: con @app.middleware("http") gli handler non vedrebbero la
+# disconnessione del client e i comandi di sola lettura non verrebbero annullati
+class AuthMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+
+        # Escludi le rotte di autenticazione e la documentazione
+        excluded_paths = ["/api/auth/login", "/docs", "/redoc", "/openapi.json"]
+
+        if any(request.url.path.startswith(path) for path in excluded_paths):
+            await self.app(scope, receive, send)
+            return
+
+        # Verifica il cookie di sessione
+        session_token = request.cookies.get("session_token")
+
+        # Se non c'è un token di sessione, continua comunque (la protezione avverrà a livello di endpoint)
+        if not session_token:
+            await self.app(scope, receive, send)
+            return
+
+        # Continua con la richiesta
+        await self.app(scope, receive, send)
+
+app.add_middleware(AuthMiddleware)
+
+# Middleware ASGI puro per l'istogramma delle latenze esportato su /metrics
+class LatencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        response = {"status": 500, "stream": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                # Gli stream SSE restano aperti per minuti: la loro durata non è una latenza
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        response["stream"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not response["stream"]:
+                # Il template della route (es. /api/jobs/{job_id}) limita il numero di serie
+                route = scope.get("route")
+                request_latency.observe(scope["method"], route.path if route is not None else "unmatched",
+                                        response["status"], time.perf_counter() - start)
+
+app.add_middleware(LatencyMiddleware)
 
 # Inclusione dei router per le diverse funzionalità
+# bind_client_request permette di annullare i comandi di sola lettura se il client si disconnette
 app.include_router(auth.router, prefix="/api/auth", tags=["Autenticazione"])
-app.include_router(disk.router, prefix="/api/disk", tags=["Disco"], dependencies=[Depends(get_current_admin)])
-app.include_router(zfs.router, prefix="/api/zfs", tags=["ZFS"], dependencies=[Depends(get_current_admin)])
-app.include_router(docker.router, prefix="/api/docker", tags=["Virtual DSM"], dependencies=[Depends(get_current_admin)])
-app.include_router(vdsm_network.router, prefix="/api/vdsm", tags=["Virtual DSM Network"], dependencies=[Depends(get_current_admin)])
-app.include_router(system.router, prefix="/api/system", tags=["Sistema"], dependencies=[Depends(get_current_admin)])
-app.include_router(updates.router, prefix="/api/updates", tags=["Aggiornamenti"], dependencies=[Depends(get_current_admin)])
+app.include_router(disk.router, prefix="/api/disk", tags=["Disco"], dependencies=[Depends(get_current_admin), Depends(bind_client_request)])
+app.include_router(zfs.router, prefix="/api/zfs", tags=["ZFS"], dependencies=[Depends(get_current_admin), Depends(bind_client_request)])
+app.include_router(docker.router, prefix="/api/docker", tags=["Virtual DSM"], dependencies=[Depends(get_current_admin), Depends(bind_client_request)])
+app.include_router(vdsm_network.router, prefix="/api/vdsm", tags=["Virtual DSM Network"], dependencies=[Depends(get_current_admin), Depends(bind_client_request)])
+app.include_router(system.router, prefix="/api/system", tags=["Sistema"], dependencies=[Depends(get_current_admin), Depends(bind_client_request)])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["Job"], dependencies=[Depends(get_current_admin), Depends(bind_client_request)])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["Metriche"], dependencies=[Depends(get_current_admin), Depends(bind_client_request)])
+app.include_router(updates.router, prefix="/api/updates", tags=["Aggiornamenti"], dependencies=[Depends(get_current_admin), Depends(bind_client_request)])
+
+# Client ammessi a /metrics quando METRICS_TOKEN non è impostato
+METRICS_LOOPBACK_HOSTS = {"127.0.0.1", "::1"}
+
+# Metriche per Prometheus, lette solo dallo stato in memoria (nessun comando per scrape).
+# Senza sessione: con METRICS_TOKEN impostato (vedi docs/DEPLOY_GUIDE.md) serve
+# "Authorization: Bearer <token>", altrimenti rispondono solo alle richieste da localhost
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    token = os.environ.get("METRICS_TOKEN")
+    if token:
+        authorization = request.headers.get("authorization", "")
+        if not secrets.compare_digest(authorization, f"Bearer {token}"):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token delle metriche non valido")
+    elif request.client is None or request.client.host not in METRICS_LOOPBACK_HOSTS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Metriche disponibili solo da localhost senza METRICS_TOKEN")
+    return Response(content=render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 # Commentiamo questa parte perché i file statici sono serviti da Nginx
 # app.mount("/", StaticFiles(directory="../frontend/dist", html=True), name="frontend")
@@ -60,6 +145,37 @@ app.include_router(updates.router, prefix="/api/updates", tags=["Aggiornamenti"]
 async def startup_event():
     db = next(get_db())
     init_admin_user(db)
+    
+    # Job rimasti in corso all'arresto precedente
+    recover_interrupted_jobs()
+    
+    # Campionatori in background per la telemetria
+    arc_collector.start()
+    event_follower.start()
+    smart_monitor.start()
+    diskstats_collector.start()
+    hotplug_monitor.start()
+    system_sampler.start()
+    
+    # Storia a lungo termine delle metriche: ogni sorgente si registra sull'archivio
+    metrics_store.register_collector("system", system_sampler.metrics)
+    metrics_store.register_collector("disk", diskstats_collector.metrics)
+    metrics_store.register_collector("zfs", arc_collector.metrics)
+    metrics_store.register_collector("zfs.pool", get_zfs_pool_metrics, interval=60)
+    metrics_store.register_collector("zfs.dataset", get_zfs_dataset_metrics, interval=60)
+    metrics_store.register_collector("container", get_container_metrics, interval=60)
+    metrics_store.register_collector("service", get_service_metrics, interval=60)
+    metrics_store.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await arc_collector.stop()
+    await event_follower.stop()
+    await smart_monitor.stop()
+    await diskstats_collector.stop()
+    await hotplug_monitor.stop()
+    await system_sampler.stop()
+    await metrics_store.stop()
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
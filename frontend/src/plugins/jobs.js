@@ -0,0 +1,21 @@
+import axios from '@/plugins/axios'
+
+// Stati finali di un job in background
+const FINAL_STATES = ['completed', 'failed', 'cancelled', 'interrupted']
+
+// Attende la fine di un job interrogando /api/jobs/{id}; onProgress riceve ogni aggiornamento
+export const waitForJob = async (jobId, onProgress = null, interval = 2000) => {
+  for (;;) {
+    const response = await axios.get(`/api/jobs/${jobId}`)
+    const job = response.data
+    if (onProgress) {
+      onProgress(job)
+    }
+    if (FINAL_STATES.includes(job.state)) {
+      return job
+    }
+    await new Promise(resolve => setTimeout(resolve, interval))
+  }
+}
+
+export default waitForJob
@@ -1,13 +1,16 @@
 import axios from '@/plugins/axios'
+import { waitForJob } from '@/plugins/jobs'
 
 const state = {
   disks: [],
+  benchmarks: [],
   loading: false,
   error: null
 }
 
 const getters = {
   allDisks: state => state.disks,
+  allBenchmarks: state => state.benchmarks,
   isLoading: state => state.loading,
   hasError: state => !!state.error,
   errorMessage: state => state.error
@@ -30,7 +33,14 @@ const actions = {
   async performDiskOperation({ commit, dispatch }, operation) {
     commit('SET_LOADING', true)
     try {
-      await axios.post('/api/disk/operation', operation)
+      const response = await axios.post('/api/disk/operation', operation)
+      // Le formattazioni proseguono in background come job: attendi l'esito
+      if (response.data.job_id) {
+        const job = await waitForJob(response.data.job_id)
+        if (job.state !== 'completed') {
+          throw { response: { data: { detail: job.error || 'Operazione sul disco non riuscita' } } }
+        }
+      }
       commit('SET_ERROR', null)
       // Aggiorna l'elenco dei dischi dopo l'operazione
       dispatch('fetchDisks')
@@ -57,6 +67,25 @@ const actions = {
     } finally {
       commit('SET_LOADING', false)
     }
+  },
+  
+  async fetchBenchmarks({ commit }) {
+    try {
+      const response = await axios.get('/api/disk/benchmark/results')
+      commit('SET_BENCHMARKS', response.data.results)
+      return { success: true }
+    } catch (error) {
+      return { success: false, message: error.response?.data?.detail || 'Errore nel recupero dei benchmark' }
+    }
+  },
+  
+  async compareBenchmarks(_, { base, other }) {
+    try {
+      const response = await axios.get('/api/disk/benchmark/compare', { params: { base, other } })
+      return { success: true, comparison: response.data }
+    } catch (error) {
+      return { success: false, message: error.response?.data?.detail || 'Errore nel confronto dei benchmark' }
+    }
   }
 }
 
@@ -64,6 +93,9 @@ const mutations = {
   SET_DISKS(state, disks) {
     state.disks = disks
   },
+  SET_BENCHMARKS(state, benchmarks) {
+    state.benchmarks = benchmarks
+  },
   SET_LOADING(state, loading) {
     state.loading = loading
   },